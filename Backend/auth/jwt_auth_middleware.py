@@ -5,29 +5,31 @@ from channels.db import database_sync_to_async
 
 @database_sync_to_async
 def get_user(validated_token):
-    from django.contrib.auth import get_user_model
     from django.contrib.auth.models import AnonymousUser
-    User = get_user_model()
+    from rest_framework.exceptions import AuthenticationFailed
+    from rest_framework_simplejwt.exceptions import InvalidToken
+    from .token_cache import token_cache
     try:
-        user_id = validated_token['user_id']
-        return User.objects.get(id=user_id)
-    except User.DoesNotExist:
+        # Instantané partagé avec l'authentification HTTP : pas de requête SQL s'il est en cache
+        return token_cache.authenticate(validated_token)
+    except (AuthenticationFailed, InvalidToken):
         return AnonymousUser()
 
 class JWTAuthMiddleware(BaseMiddleware):
     async def __call__(self, scope, receive, send):
-        from rest_framework_simplejwt.tokens import UntypedToken
+        from django.contrib.auth.models import AnonymousUser
         from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+        from .token_cache import token_cache
         # Extraire le token de l'URL
         query_string = scope['query_string'].decode()
         params = parse_qs(query_string)
         token = params.get('token', [None])[0]
         if token is not None:
             try:
-                validated_token = UntypedToken(token)
+                validated_token = token_cache.validate(token)
                 scope['user'] = await get_user(validated_token)
             except (InvalidToken, TokenError):
                 scope['user'] = AnonymousUser()
         else:
             scope['user'] = AnonymousUser()
-        return await super().__call__(scope, receive, send) 
\ No newline at end of file
+        return await super().__call__(scope, receive, send)
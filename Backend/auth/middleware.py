@@ -2,9 +2,11 @@ import logging
 from django.conf import settings
 from django.http import JsonResponse
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.settings import api_settings
 import jwt
-from django.contrib.gis.geoip2 import GeoIP2
+
+from .ratelimit import build_rate_limiter, client_ip, request_identity
+from .token_cache import token_cache
 
 logger = logging.getLogger(__name__)
 
@@ -51,8 +53,11 @@ class TokenValidationMiddleware:
         if auth_header and auth_header.startswith('Bearer '):
             token = auth_header.split(' ')[1]
             try:
-                # Valider le token
-                AccessToken(token)
+                # Valider le token (une fois, via le cache) ; DRF réutilise request.validated_token
+                # et l'identifiant sert aux limites de débit par utilisateur
+                access_token = token_cache.validate(token)
+                request.validated_token = access_token
+                request.token_user_id = access_token.get(api_settings.USER_ID_CLAIM)
             except (InvalidToken, TokenError) as e:
                 logger.warning(f"Invalid token attempt: {e}")
                 return JsonResponse({
@@ -75,63 +80,50 @@ class TokenValidationMiddleware:
 
 class RateLimitMiddleware:
     """
-    Middleware basique pour limiter les requêtes.
+    Limite le débit par politique (RATE_LIMIT_SETTINGS), voir auth/ratelimit.py.
+
+    À placer après TokenValidationMiddleware pour les politiques par utilisateur.
     """
-    
+
     def __init__(self, get_response):
         self.get_response = get_response
-        self.request_counts = {}
+        self.limiter = build_rate_limiter()
 
     def __call__(self, request):
-        # IP du client
-        client_ip = self.get_client_ip(request)
-        
-        # Limiter les requêtes par IP (exemple: 100 requêtes par minute)
-        if self.is_rate_limited(client_ip):
-            return JsonResponse({
+        policy = self.limiter.policy_for(request.path, request.method)
+        if policy is None:
+            return self.get_response(request)
+        identity = request_identity(request, policy)
+        if identity is None:
+            return self.get_response(request)
+
+        result = self.limiter.check(policy, identity)
+        if not result.allowed:
+            response = JsonResponse({
                 'error': 'Trop de requêtes',
                 'detail': 'Vous avez dépassé la limite de requêtes. Veuillez réessayer plus tard.'
             }, status=429)
-        
-        response = self.get_response(request)
+            response['Retry-After'] = str(result.retry_after)
+        else:
+            response = self.get_response(request)
+        response['X-RateLimit-Limit'] = str(result.limit)
+        response['X-RateLimit-Remaining'] = str(result.remaining)
         return response
-    
+
     def get_client_ip(self, request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
-    
-    def is_rate_limited(self, client_ip):
-        # Implémentation basique - à améliorer avec Redis en production
-        import time
-        current_time = time.time()
-        
-        if client_ip not in self.request_counts:
-            self.request_counts[client_ip] = {'count': 1, 'reset_time': current_time + 60}
-            return False
-        
-        if current_time > self.request_counts[client_ip]['reset_time']:
-            self.request_counts[client_ip] = {'count': 1, 'reset_time': current_time + 60}
-            return False
-        
-        self.request_counts[client_ip]['count'] += 1
-        return self.request_counts[client_ip]['count'] > 100
+        return client_ip(request)
+
 
 class GeoIP2Middleware:
+    """Pays et ville de l'IP cliente, via le lecteur GeoIP partagé (depannage/geoip.py) et son cache."""
+
     def __init__(self, get_response):
         self.get_response = get_response
-        self.geoip = GeoIP2()
 
     def __call__(self, request):
-        ip = request.META.get('REMOTE_ADDR')
-        try:
-            geo = self.geoip.city(ip)
-            request.geoip_country = geo.get('country_name', '')
-            request.geoip_city = geo.get('city', '')
-        except Exception:
-            request.geoip_country = ''
-            request.geoip_city = ''
-        return self.get_response(request) 
\ No newline at end of file
+        from depannage.geoip import geoip_lookup
+
+        location = geoip_lookup.lookup(request.META.get('REMOTE_ADDR'))
+        request.geoip_country = location.country
+        request.geoip_city = location.city
+        return self.get_response(request)
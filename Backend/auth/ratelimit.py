@@ -0,0 +1,221 @@
+"""
+Limitation de débit par fenêtre glissante.
+
+Algorithme : compteur à fenêtre glissante approchée. Pour une limite de N
+requêtes par période P, on garde un compteur par fenêtre fixe de durée P et
+on estime le nombre de requêtes sur les P dernières secondes par
+
+    courante + précédente * (1 - temps écoulé dans la fenêtre courante / P)
+
+Deux entiers par client suffisent, sans l'effet de bord des fenêtres fixes
+(2N requêtes autour d'un changement de fenêtre).
+
+Stockage interchangeable (``RATE_LIMIT_SETTINGS['STORAGE']``) :
+- ``local`` : LRU en mémoire du processus, bornée à ``LOCAL_MAX_KEYS`` clés
+  (un seul worker, coût de quelques microsecondes) ;
+- ``cache`` : cache Django ``CACHE_ALIAS`` (Redis entre plusieurs workers),
+  incréments atomiques ``incr``.
+
+Les politiques sont choisies par chemin (exact ou préfixe) et méthode HTTP,
+et comptées par IP ou par utilisateur authentifié (``key``).
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import caches
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """``"5/m"``, ``"100/min"``, ``"1000/day"`` -> (requêtes, période en secondes)."""
+    count, period = rate.split("/")
+    return int(count), PERIODS[period.strip()[0].lower()]
+
+
+@dataclass(frozen=True)
+class RatePolicy:
+    name: str
+    limit: int
+    period: int
+    # "ip", "user" ou "user_or_ip"
+    key: str = "ip"
+    path: str = ""
+    prefix: str = ""
+    methods: frozenset = frozenset()
+
+    @classmethod
+    def from_setting(cls, config):
+        limit, period = parse_rate(config["rate"])
+        return cls(
+            name=config["name"],
+            limit=limit,
+            period=period,
+            key=config.get("key", "ip"),
+            path=config.get("path", ""),
+            prefix=config.get("prefix", ""),
+            methods=frozenset(m.upper() for m in config.get("methods", ())),
+        )
+
+    def applies_to(self, method):
+        return not self.methods or method in self.methods
+
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: int
+
+
+class LocalStorage:
+    """Compteurs en mémoire du processus, LRU bornée."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, previous_key, limit_check, ttl):
+        with self._lock:
+            current = self._counts.get(key, 0)
+            previous = self._counts.get(previous_key, 0)
+            allowed = limit_check(current + 1, previous)
+            if allowed:
+                current += 1
+                self._counts[key] = current
+                self._counts.move_to_end(key)
+                if len(self._counts) > self.max_keys:
+                    self._counts.popitem(last=False)
+            return allowed, current, previous
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+class CacheStorage:
+    """Compteurs partagés dans un cache Django (``incr`` atomique sur Redis/Memcached)."""
+
+    def __init__(self, alias="default"):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def hit(self, key, previous_key, limit_check, ttl):
+        cache = self.cache
+        try:
+            current = cache.incr(key)
+        except ValueError:
+            cache.add(key, 0, ttl)
+            current = cache.incr(key)
+        previous = cache.get(previous_key, 0)
+        allowed = limit_check(current, previous)
+        if not allowed:
+            # Une requête refusée ne consomme pas de quota
+            current = cache.decr(key)
+        return allowed, current, previous
+
+    def clear(self):
+        self.cache.clear()
+
+
+class RateLimiter:
+    """Associe une requête à sa politique et applique la fenêtre glissante."""
+
+    def __init__(self, policies=(), default_policy=None, storage=None, clock=time.time):
+        self.storage = storage or LocalStorage()
+        self.clock = clock
+        self.default_policy = default_policy
+        self.exact = {}
+        self.prefixed = []
+        for policy in policies:
+            if policy.path:
+                self.exact.setdefault(policy.path, []).append(policy)
+            else:
+                self.prefixed.append(policy)
+        # Le préfixe le plus long l'emporte
+        self.prefixed.sort(key=lambda policy: len(policy.prefix), reverse=True)
+
+    def policy_for(self, path, method):
+        for policy in self.exact.get(path, ()):
+            if policy.applies_to(method):
+                return policy
+        for policy in self.prefixed:
+            if path.startswith(policy.prefix) and policy.applies_to(method):
+                return policy
+        return self.default_policy
+
+    def check(self, policy, identity):
+        now = self.clock()
+        window = int(now // policy.period)
+        elapsed = (now - window * policy.period) / policy.period
+        weight = 1.0 - elapsed
+
+        def limit_check(current, previous):
+            return current + previous * weight <= policy.limit
+
+        base = f"rl:{policy.name}:{identity}:"
+        allowed, current, previous = self.storage.hit(
+            f"{base}{window}", f"{base}{window - 1}", limit_check, ttl=2 * policy.period
+        )
+        used = current + previous * weight
+        remaining = max(0, int(policy.limit - used))
+        retry_after = 0
+        if not allowed:
+            # Attente avant que la part de la fenêtre précédente ne libère une place
+            if previous:
+                needed = used + 1 - policy.limit
+                retry_after = min(policy.period, needed * policy.period / previous)
+            else:
+                retry_after = policy.period * (1 - elapsed)
+            retry_after = max(1, int(retry_after + 0.999))
+        return RateLimitResult(allowed, policy.limit, remaining, retry_after)
+
+
+def client_ip(request, trusted_proxy_count=None):
+    """
+    IP du client. ``X-Forwarded-For`` est fourni par le client : il n'est lu que derrière
+    ``TRUSTED_PROXY_COUNT`` proxys, en prenant l'adresse ajoutée par le plus externe
+    (n-ième entrée en partant de la droite), sinon ``REMOTE_ADDR``.
+    """
+    if trusted_proxy_count is None:
+        trusted_proxy_count = getattr(settings, "RATE_LIMIT_SETTINGS", {}).get("TRUSTED_PROXY_COUNT", 0)
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if trusted_proxy_count and x_forwarded_for:
+        addresses = [address.strip() for address in x_forwarded_for.split(',')]
+        if len(addresses) >= trusted_proxy_count:
+            return addresses[-trusted_proxy_count]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def request_identity(request, policy):
+    """Identifiant compté par la politique ; l'utilisateur vient de la session ou du JWT déjà validé."""
+    if policy.key in ("user", "user_or_ip"):
+        user = getattr(request, "user", None)
+        user_id = user.pk if user is not None and user.is_authenticated else getattr(request, "token_user_id", None)
+        if user_id is not None:
+            return f"u{user_id}"
+        if policy.key == "user":
+            return None
+    return f"ip{client_ip(request)}"
+
+
+def build_rate_limiter(config=None):
+    config = config if config is not None else getattr(settings, "RATE_LIMIT_SETTINGS", {})
+    if config.get("STORAGE", "local") == "cache":
+        storage = CacheStorage(config.get("CACHE_ALIAS", "default"))
+    else:
+        storage = LocalStorage(config.get("LOCAL_MAX_KEYS", 100000))
+    default = config.get("DEFAULT")
+    return RateLimiter(
+        policies=[RatePolicy.from_setting(policy) for policy in config.get("POLICIES", ())],
+        default_policy=RatePolicy.from_setting({"name": "default", **default}) if default else None,
+        storage=storage,
+    )
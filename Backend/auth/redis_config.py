@@ -0,0 +1,83 @@
+"""
+Configuration Redis partagée : cache Django et channel layer Channels.
+
+Avec ``REDIS_URL`` défini, le cache et les groupes WebSocket (``user_<id>``,
+``chat_<id>``, ``tracking_technician_<id>``...) sont partagés entre tous les
+workers daphne/uvicorn. Sans Redis, on retombe sur les backends en mémoire,
+limités à un seul processus.
+
+``USE_FAKE_REDIS=True`` démarre un serveur Redis simulé (fakeredis) dans le
+processus : les clients s'y connectent en TCP comme à un vrai Redis, ce qui
+permet de vérifier la diffusion entre plusieurs instances sans service externe.
+"""
+import threading
+
+DEFAULT_REDIS_SETTINGS = {
+    # Pool de connexions du cache
+    'CACHE_MAX_CONNECTIONS': 50,
+    'CACHE_POOL_TIMEOUT': 5,  # secondes d'attente d'une connexion libre
+    'CACHE_TIMEOUT': 300,
+    'KEY_PREFIX': 'depanneteliman',
+    # Channel layer
+    'CHANNEL_CAPACITY': 100,  # messages en attente par canal avant rejet
+    'CHANNEL_EXPIRY': 60,  # durée de vie d'un message non consommé (s)
+    'GROUP_EXPIRY': 86400,  # durée de vie d'une appartenance à un groupe (s)
+    'CHANNEL_PREFIX': 'asgi',
+}
+
+_fake_server = None
+_fake_server_lock = threading.Lock()
+
+
+def build_cache_settings(redis_url, options=None):
+    """Bloc ``CACHES`` utilisant le backend Redis natif de Django avec pool bloquant."""
+    config = {**DEFAULT_REDIS_SETTINGS, **(options or {})}
+    return {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': redis_url,
+            'TIMEOUT': config['CACHE_TIMEOUT'],
+            'KEY_PREFIX': config['KEY_PREFIX'],
+            'OPTIONS': {
+                'pool_class': 'redis.BlockingConnectionPool',
+                'max_connections': config['CACHE_MAX_CONNECTIONS'],
+                'timeout': config['CACHE_POOL_TIMEOUT'],
+            },
+        },
+    }
+
+
+def build_channel_layers(redis_url, options=None):
+    """Bloc ``CHANNEL_LAYERS`` utilisant channels_redis."""
+    config = {**DEFAULT_REDIS_SETTINGS, **(options or {})}
+    return {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [redis_url],
+                'capacity': config['CHANNEL_CAPACITY'],
+                'expiry': config['CHANNEL_EXPIRY'],
+                'group_expiry': config['GROUP_EXPIRY'],
+                'prefix': config['CHANNEL_PREFIX'],
+            },
+        },
+    }
+
+
+def start_fake_redis_server(host='127.0.0.1', port=0):
+    """
+    Démarre (une seule fois par processus) un serveur fakeredis en TCP.
+
+    Retourne l'URL ``redis://`` à utiliser comme ``REDIS_URL``.
+    """
+    global _fake_server
+    with _fake_server_lock:
+        if _fake_server is None:
+            from fakeredis import TcpFakeServer
+
+            server = TcpFakeServer((host, port))
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name='fake-redis', daemon=True).start()
+            _fake_server = server
+        bound_host, bound_port = _fake_server.server_address[:2]
+        return f'redis://{bound_host}:{bound_port}/0'
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 import os
+import sys
 from dotenv import load_dotenv
 from django.utils import timezone
 
@@ -85,7 +86,8 @@ MIDDLEWARE = [
     # Middlewares personnalisés pour la sécurité
     'auth.middleware.JWTSecurityMiddleware',
     'auth.middleware.TokenValidationMiddleware',
-    # 'auth.middleware.RateLimitMiddleware',  # Décommenter en production pour limiter le nombre de requêtes
+    # 'auth.middleware.RateLimitMiddleware',  # Décommenter en production pour limiter le nombre de requêtes (RATE_LIMIT_SETTINGS)
+    # 'auth.middleware.GeoIP2Middleware',  # Pays/ville de l'IP (request.geoip_country), nécessite la base GeoLite2
 ]
 
 # Fichier de configuration des URLs principales
@@ -207,7 +209,7 @@ AUTH_USER_MODEL = 'users.User'
 # Configuration de Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'auth.token_cache.CachedJWTAuthentication',  # JWTAuthentication avec cache (auth/token_cache.py)
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -259,7 +261,7 @@ CSRF_TRUSTED_ORIGINS = ['http://localhost:3000', 'http://127.0.0.1:3000']
 # Limitation de débit (Rate Limiting)
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'auth.token_cache.CachedJWTAuthentication',  # JWTAuthentication avec cache (auth/token_cache.py)
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -384,17 +386,36 @@ LOGGING = {
     },
 }
 
+# Redis partagé pour le cache et le channel layer (voir auth/redis_config.py).
+# Sans REDIS_URL, on reste sur les backends en mémoire (un seul processus).
+REDIS_URL = os.getenv('REDIS_URL', '')
+if os.getenv('USE_FAKE_REDIS', 'False') == 'True':
+    from auth.redis_config import start_fake_redis_server
+    REDIS_URL = start_fake_redis_server()
+
+REDIS_SETTINGS = {
+    'CACHE_MAX_CONNECTIONS': int(os.getenv('REDIS_CACHE_MAX_CONNECTIONS', '50')),
+    'CACHE_POOL_TIMEOUT': int(os.getenv('REDIS_CACHE_POOL_TIMEOUT', '5')),
+    'CHANNEL_CAPACITY': int(os.getenv('CHANNEL_LAYER_CAPACITY', '100')),
+    'CHANNEL_EXPIRY': int(os.getenv('CHANNEL_LAYER_EXPIRY', '60')),
+    'GROUP_EXPIRY': int(os.getenv('CHANNEL_LAYER_GROUP_EXPIRY', '86400')),
+}
+
 # Configuration de cache pour les performances
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'TIMEOUT': 300,  # 5 minutes
-        'OPTIONS': {
-            'MAX_ENTRIES': 1000,
+if REDIS_URL:
+    from auth.redis_config import build_cache_settings
+    CACHES = build_cache_settings(REDIS_URL, REDIS_SETTINGS)
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+            'TIMEOUT': 300,  # 5 minutes
+            'OPTIONS': {
+                'MAX_ENTRIES': 1000,
+            },
         },
-    },
-}
+    }
 
 # Configuration pour les fichiers média
 MEDIA_URL = '/media/'
@@ -431,11 +452,137 @@ GEOLOCATION_SETTINGS = {
     'DEFAULT_RADIUS_KM': 10,
     'MAX_RADIUS_KM': 50,
     'CACHE_TIMEOUT': 3600,  # 1 heure
+    # Index spatial en mémoire des techniciens (depannage/spatial_index.py) ;
+    # désactivé, les recherches passent par un préfiltre SQL par boîte englobante
+    'SPATIAL_INDEX_ENABLED': True,
+    'SPATIAL_INDEX_CELL_DEGREES': 0.05,  # ~5,5 km par cellule
+    'SPATIAL_INDEX_REFRESH_SECONDS': 300,  # rechargement complet depuis la base
+    # Écriture différée des positions GPS (depannage/location_buffer.py)
+    'LOCATION_FLUSH_INTERVAL_SECONDS': 10,
+    'LOCATION_FLUSH_DISTANCE_METERS': 200,  # déplacement qui force une écriture anticipée
 }
 
-# Channels layer config (dev only)
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
-    }
+# Affectation des techniciens (depannage/dispatch.py) : score pondéré des candidats
+DISPATCH_SETTINGS = {
+    'WEIGHTS': {
+        'distance': 0.4,
+        'rating': 0.25,
+        'experience': 0.1,
+        'response_time': 0.15,
+        'urgency': 0.1,  # demandes urgent/SOS : techniciens disponibles en urgence
+    },
+    'MAX_RADIUS_KM': 50,  # fenêtre de recherche, le rayon propre à chacun s'applique ensuite
+    'REASSIGN_MIN_RATING': 3.5,  # note minimale lors d'une réaffectation automatique
+    'MAX_ACTIVE_JOBS': 1,  # demandes assignées/en cours au-delà desquelles un technicien est occupé
+    'NOTIFY_TOP_K': 20,  # techniciens notifiés d'une nouvelle demande
+    'RESPONSE_TIME_CAP_MINUTES': 120,
+    'UNRATED_SCORE': 0.6,  # score de note d'un technicien sans avis
+    'REFRESH_SECONDS': 300,  # rechargement de la table des candidats (autres workers)
+    'RECONCILE_SECONDS': 3600,  # vérification des compteurs par run_dispatch_scheduler (0 : jamais)
+}
+
+# Délais de prise en charge des demandes en attente (depannage/sla.py), "manage.py run_dispatch_scheduler"
+SLA_SETTINGS = {
+    'DEADLINE_MINUTES': {'sos': 30, 'urgent': 120, 'same_day': 720, 'normal': 2880},
+    'OFFER_INTERVAL_MINUTES': {'sos': 5, 'urgent': 15, 'same_day': 60, 'normal': 240},  # nouvelle offre
+    'RADIUS_RINGS_KM': [10, 20, 35, 50],  # rayon de recherche élargi à chaque nouvelle offre
+    'OFFER_TOP_K': 10,  # techniciens supplémentaires notifiés à chaque offre
+    'ESCALATE_AT': 0.75,  # part du délai écoulée avant l'alerte aux administrateurs
+    'CHANNEL': 'dispatch-sla',  # canal du channel layer lu par le planificateur
+    'PUBLISH_EVENTS': bool(REDIS_URL),  # le channel layer en mémoire ne traverse pas les processus
+    'RESYNC_SECONDS': 900,  # relecture des demandes en attente (événements perdus, update() en masse)
+}
+
+# Instantané des statistiques du tableau de bord (depannage/statistics.py)
+STATISTICS_SETTINGS = {
+    'MAX_AGE_SECONDS': 900,  # recalcul forcé au-delà de 15 minutes
+    'MIN_REFRESH_SECONDS': 60,  # délai minimal entre deux recalculs déclenchés par des modifications
+}
+
+# File d'écriture regroupée des messages du chat WebSocket (depannage/chat_pipeline.py)
+CHAT_SETTINGS = {
+    'PIPELINE_FLUSH_MS': 5,  # attente avant d'écrire un lot
+    'PIPELINE_MAX_BATCH': 200,  # éléments maximum par lot
 }
+
+# Géolocalisation IP (depannage/geoip.py) : lecteur GeoLite2 unique en MMAP et cache par IP
+GEOIP_SETTINGS = {
+    'DB_PATH': os.getenv('GEOIP_DB_PATH', os.path.join(BASE_DIR, 'geoip', 'GeoLite2-City.mmdb')),
+    'CACHE_SIZE': 10000,  # adresses gardées en mémoire (LRU)
+    'CACHE_TTL_SECONDS': 3600,
+}
+
+# Exports CSV / Excel en flux (depannage/exports.py)
+EXPORT_SETTINGS = {
+    'CHUNK_SIZE': 2000,  # lignes lues par requête et par morceau envoyé
+    # Exports générés en tâche de fond (PDF des statistiques) : hors de MEDIA_ROOT, servis aux
+    # administrateurs uniquement par download_statistics_pdf
+    'PRIVATE_DIR': os.getenv('EXPORT_PRIVATE_DIR', os.path.join(BASE_DIR, 'archives', 'exports')),
+}
+
+# Journal d'audit écrit par lots en arrière-plan (users/audit.py)
+AUDIT_SETTINGS = {
+    # Écriture synchrone pendant "manage.py test" : pas de thread hors des transactions de test
+    'ASYNC': os.getenv('AUDIT_ASYNC', 'True').lower() == 'true' and sys.argv[1:2] != ['test'],
+    'MAX_BUFFER': 10000,  # événements en file avant contre-pression
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL_SECONDS': 0.5,
+    # Archivage (manage.py archive_audit_logs) : journal brut au-delà de RETENTION_DAYS
+    # compressé dans ARCHIVE_DIR puis supprimé ; les agrégats journaliers sont conservés
+    'RETENTION_DAYS': int(os.getenv('AUDIT_RETENTION_DAYS', '90')),
+    'HOURLY_ROLLUP_RETENTION_DAYS': 30,
+    'ARCHIVE_DIR': os.getenv('AUDIT_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archives', 'audit')),
+    'ARCHIVE_BATCH_SIZE': 5000,
+}
+
+# Cache des jetons JWT validés et des utilisateurs (auth/token_cache.py), partagé HTTP / WebSocket
+TOKEN_CACHE_SETTINGS = {
+    'TTL_SECONDS': 60,  # jeton décodé gardé dans le processus
+    'USER_TTL_SECONDS': 60,  # instantané utilisateur dans le cache Django
+    'MAX_ENTRIES': 10000,
+    'CACHE_ALIAS': 'default',  # révocations et instantanés ; partagé entre workers avec Redis
+}
+
+# Limitation de débit (auth/ratelimit.py, RateLimitMiddleware) : fenêtre glissante par politique.
+# Stockage "local" (LRU du processus) sans Redis, "cache" (partagé entre workers) sinon.
+RATE_LIMIT_SETTINGS = {
+    'STORAGE': 'cache' if REDIS_URL else 'local',
+    'CACHE_ALIAS': 'default',
+    'LOCAL_MAX_KEYS': 100000,
+    # Proxys (nginx, load balancer) devant l'application : 0 = X-Forwarded-For ignoré, REMOTE_ADDR fait foi
+    'TRUSTED_PROXY_COUNT': int(os.getenv('TRUSTED_PROXY_COUNT', '0')),
+    # Politique appliquée aux chemins sans politique dédiée
+    'DEFAULT': {'rate': '300/m', 'key': 'user_or_ip'},
+    'POLICIES': [
+        {'name': 'login', 'path': '/users/login/', 'methods': ['POST'], 'rate': '10/m'},
+        {'name': 'verify_otp', 'path': '/users/verify_otp/', 'methods': ['POST'], 'rate': '10/m'},
+        {'name': 'register', 'path': '/users/register/', 'methods': ['POST'], 'rate': '20/h'},
+        {'name': 'forgot_password', 'path': '/users/forgot_password/', 'methods': ['POST'], 'rate': '5/h'},
+        {'name': 'reset_password', 'path': '/users/reset_password/', 'methods': ['POST'], 'rate': '10/h'},
+        {'name': 'exports', 'prefix': '/depannage/api/admin/audit-logs/export/', 'rate': '10/m', 'key': 'user_or_ip'},
+    ],
+}
+
+# Tâches de fond en base (depannage/jobs.py), exécutées par "manage.py run_jobs"
+JOB_SETTINGS = {
+    # Threads du processus web qui exécutent les tâches après commit, hors requête, tant qu'aucun
+    # worker run_jobs n'est déployé (OTP, réinitialisation de mot de passe) : 0 une fois le worker lancé
+    'IN_PROCESS_WORKERS': int(os.getenv('JOBS_IN_PROCESS_WORKERS', '2')),
+    # Exécution après commit dans le thread appelant : développement et tests uniquement
+    'EAGER': os.getenv('JOBS_EAGER', 'False').lower() == 'true',
+    'MAX_ATTEMPTS': 3,
+    'RETRY_BACKOFF_SECONDS': 30,  # doublé à chaque nouvel essai
+    'STALE_AFTER_SECONDS': 900,  # tâche "running" sans nouvelles : worker considéré arrêté
+    'POLL_INTERVAL_SECONDS': 2,
+}
+
+# Channels layer config : Redis si configuré, sinon en mémoire (dev, un seul worker)
+if REDIS_URL:
+    from auth.redis_config import build_channel_layers
+    CHANNEL_LAYERS = build_channel_layers(REDIS_URL, REDIS_SETTINGS)
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer"
+        }
+    }
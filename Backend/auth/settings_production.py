@@ -45,18 +45,12 @@ DATABASES = {
 }
 
 # Configuration Redis pour la production
-REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
 
-# Configuration de cache
-CACHES = {
-    'default': {
-        'BACKEND': 'django_redis.cache.RedisCache',
-        'LOCATION': REDIS_URL,
-        'OPTIONS': {
-            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
-        }
-    }
-}
+# Cache et channel layer partagés entre workers
+from .redis_config import build_cache_settings, build_channel_layers
+CACHES = build_cache_settings(REDIS_URL, REDIS_SETTINGS)
+CHANNEL_LAYERS = build_channel_layers(REDIS_URL, REDIS_SETTINGS)
 
 # Configuration de logging pour la production
 LOGGING = {
@@ -0,0 +1,196 @@
+"""
+Cache des jetons JWT validés et des utilisateurs authentifiés.
+
+Un seul chemin d'authentification pour HTTP et WebSocket :
+- ``validate`` vérifie la signature et l'expiration d'un jeton d'accès une
+  fois, puis garde le jeton décodé dans une LRU du processus pour
+  ``TTL_SECONDS`` (jamais au-delà de son expiration) ;
+- ``authenticate`` lit en un seul ``get_many`` du cache Django (Redis entre
+  workers) la révocation du ``jti`` et l'instantané de l'utilisateur ; la base
+  n'est interrogée qu'en cas d'absence de l'instantané.
+
+``TokenValidationMiddleware`` pose le jeton validé sur la requête et
+``CachedJWTAuthentication`` (DRF) le réutilise : un jeton n'est décodé qu'une
+fois par requête, et plus du tout tant qu'il reste en cache.
+
+La déconnexion révoque le ``jti`` (jusqu'à l'expiration du jeton) ; la
+déconnexion de tous les appareils révoque les jetons d'accès de l'utilisateur
+émis jusque-là (``revoke_user_tokens``), faute de lien entre un jeton d'accès
+et son refresh token ; l'enregistrement d'un utilisateur efface son instantané.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class TokenCache:
+    def __init__(self, max_entries=10000, ttl=60, user_ttl=60, cache_alias="default", clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.user_ttl = user_ttl
+        self.cache_alias = cache_alias
+        self.clock = clock
+        self._tokens = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @staticmethod
+    def _revoked_key(jti):
+        return f"jwt:revoked:{jti}"
+
+    @staticmethod
+    def _user_key(user_id):
+        return f"jwt:user:{user_id}"
+
+    @staticmethod
+    def _revoked_before_key(user_id):
+        return f"jwt:revoked_before:{user_id}"
+
+    def validate(self, raw_token):
+        """Jeton d'accès validé ; lève ``TokenError`` si invalide ou expiré."""
+        if isinstance(raw_token, bytes):
+            raw_token = raw_token.decode()
+        now = self.clock()
+        with self._lock:
+            entry = self._tokens.get(raw_token)
+            if entry is not None:
+                if entry[1] > now:
+                    self._tokens.move_to_end(raw_token)
+                    return entry[0]
+                del self._tokens[raw_token]
+
+        token = AccessToken(raw_token)
+        # Le jeton ne doit pas survivre dans le cache à sa propre expiration
+        lifetime = token["exp"] - time.time()
+        expires = now + min(self.ttl, max(lifetime, 0))
+        with self._lock:
+            self._tokens[raw_token] = (token, expires)
+            while len(self._tokens) > self.max_entries:
+                self._tokens.popitem(last=False)
+        return token
+
+    def authenticate(self, validated_token):
+        """Utilisateur du jeton (révocation, compte actif et mot de passe vérifiés)."""
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as exc:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from exc
+
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        revoked_key, user_key = self._revoked_key(jti), self._user_key(user_id)
+        revoked_before_key = self._revoked_before_key(user_id)
+        cached = self.cache.get_many([revoked_key, user_key, revoked_before_key])
+        if cached.get(revoked_key):
+            raise AuthenticationFailed(_("Token is revoked"), code="token_revoked")
+        revoked_before = cached.get(revoked_before_key)
+        if revoked_before is not None and validated_token.get("iat", 0) < revoked_before:
+            raise AuthenticationFailed(_("Token is revoked"), code="token_revoked")
+
+        user = self._user_from_snapshot(cached.get(user_key))
+        if user is None:
+            user = self._load_user(user_id)
+            self.cache.set(user_key, self._snapshot(user), self.user_ttl)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if getattr(api_settings, "CHECK_REVOKE_TOKEN", False):
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+    def _load_user(self, user_id):
+        from django.contrib.auth import get_user_model
+
+        User = get_user_model()
+        try:
+            return User.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+        except User.DoesNotExist as exc:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from exc
+
+    @staticmethod
+    def _snapshot(user):
+        return tuple(getattr(user, field.attname) for field in user._meta.concrete_fields)
+
+    @staticmethod
+    def _user_from_snapshot(snapshot):
+        # Nouvelle instance à chaque requête : les vues peuvent modifier request.user
+        from django.contrib.auth import get_user_model
+
+        if snapshot is None:
+            return None
+        User = get_user_model()
+        fields = User._meta.concrete_fields
+        if len(snapshot) != len(fields):
+            return None
+        return User.from_db("default", [field.attname for field in fields], snapshot)
+
+    def revoke(self, token):
+        """Révoque un jeton d'accès jusqu'à son expiration (déconnexion)."""
+        remaining = int(token["exp"] - time.time()) + 1
+        if remaining > 0:
+            self.cache.set(self._revoked_key(token.get(api_settings.JTI_CLAIM)), True, remaining)
+        raw_token = str(token)
+        with self._lock:
+            self._tokens.pop(raw_token, None)
+
+    def revoke_user_tokens(self, user_id):
+        """Révoque les jetons d'accès de l'utilisateur émis avant maintenant (à la seconde près)."""
+        # Au-delà de la durée de vie d'un jeton d'accès, tous ceux visés ont expiré
+        timeout = int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()) + 1
+        self.cache.set(self._revoked_before_key(user_id), int(time.time()), timeout)
+
+    def invalidate_user(self, user_id):
+        self.cache.delete(self._user_key(user_id))
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` s'appuyant sur ``token_cache`` et sur le jeton déjà validé par le middleware."""
+
+    def get_validated_token(self, raw_token):
+        try:
+            return token_cache.validate(raw_token)
+        except TokenError as exc:
+            raise InvalidToken({
+                "detail": _("Given token not valid for any token type"),
+                "messages": [{
+                    "token_class": AccessToken.__name__,
+                    "token_type": AccessToken.token_type,
+                    "message": exc.args[0],
+                }],
+            })
+
+    def authenticate(self, request):
+        validated_token = getattr(request._request, "validated_token", None)
+        if validated_token is None:
+            return super().authenticate(request)
+        return self.get_user(validated_token), validated_token
+
+    def get_user(self, validated_token):
+        return token_cache.authenticate(validated_token)
+
+
+_token_settings = getattr(settings, "TOKEN_CACHE_SETTINGS", {})
+
+token_cache = TokenCache(
+    max_entries=_token_settings.get("MAX_ENTRIES", 10000),
+    ttl=_token_settings.get("TTL_SECONDS", 60),
+    user_ttl=_token_settings.get("USER_TTL_SECONDS", 60),
+    cache_alias=_token_settings.get("CACHE_ALIAS", "default"),
+)
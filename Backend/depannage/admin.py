@@ -11,7 +11,7 @@ from .models import (
     Client, Technician, RepairRequest, RequestDocument, Review, 
     Payment, Conversation, Message, MessageAttachment, 
     Notification, TechnicianLocation, SystemConfiguration, CinetPayPayment, ClientLocation, Report, AdminNotification,
-    TechnicianSubscription, SubscriptionPaymentRequest
+    TechnicianSubscription, SubscriptionPaymentRequest, BackgroundJob
 )
 
 
@@ -702,6 +702,22 @@ class SystemConfigurationAdmin(admin.ModelAdmin):
     value_short.short_description = "Valeur"
 
 
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'priority', 'attempts', 'run_at', 'finished_at')
+    list_filter = ('status', 'name')
+    # Charge utile en lecture seule : une tâche relancée exécute ce qui a été mis en file
+    readonly_fields = ('created_at', 'finished_at', 'locked_by', 'locked_at', 'last_error', 'result', 'payload')
+    actions = ['retry_jobs']
+
+    def retry_jobs(self, request, queryset):
+        updated = queryset.filter(status=BackgroundJob.Status.FAILED).update(
+            status=BackgroundJob.Status.PENDING, attempts=0, run_at=timezone.now()
+        )
+        self.message_user(request, f"{updated} tâche(s) remise(s) en file.")
+    retry_jobs.short_description = "Relancer les tâches échouées"
+
+
 @admin.register(CinetPayPayment)
 class CinetPayPaymentAdmin(admin.ModelAdmin):
     list_display = (
@@ -0,0 +1,153 @@
+"""
+Persistance regroupée des messages du chat WebSocket.
+
+Au lieu d'un aller-retour ``database_sync_to_async`` par message, les
+``ChatConsumer`` déposent leurs écritures dans une file asyncio propre à la
+boucle d'événements du worker. Une tâche unique vide la file toutes les
+``PIPELINE_FLUSH_MS`` millisecondes et écrit le lot en une transaction :
+- un ``bulk_create`` pour les nouveaux ``ChatMessage`` ;
+- un seul UPDATE de ``last_message_at`` pour toutes les conversations du lot ;
+- un UPDATE par (conversation, lecteur) pour les accusés de lecture.
+
+La file est traitée dans l'ordre d'arrivée par une seule tâche, et
+``bulk_create`` insère dans l'ordre de la liste : les identifiants restent
+croissants dans chaque conversation. Chaque expéditeur attend un futur qui lui
+rend son message enregistré (avec son id).
+"""
+import asyncio
+import logging
+import weakref
+from collections import defaultdict
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_MESSAGE = "message"
+_READ = "read"
+
+
+class ChatPersistencePipeline:
+    """File d'écritures du chat, une par boucle d'événements."""
+
+    def __init__(self, flush_interval=0.005, max_batch=200):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._loops = weakref.WeakKeyDictionary()
+
+    async def save_message(self, **fields):
+        """Met en file un nouveau ``ChatMessage`` et retourne l'instance une fois enregistrée."""
+        from .models import ChatMessage
+
+        return await self._submit(_MESSAGE, ChatMessage(**fields))
+
+    async def mark_read(self, conversation_id, reader_id, message_id):
+        """Met en file un accusé de lecture (ignoré pour les propres messages du lecteur)."""
+        return await self._submit(_READ, (conversation_id, reader_id, message_id))
+
+    async def _submit(self, kind, payload):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue_for(loop).put_nowait((kind, payload, future))
+        return await future
+
+    def _queue_for(self, loop):
+        state = self._loops.get(loop)
+        if state is None:
+            queue = asyncio.Queue()
+            # La référence à la tâche est gardée pour qu'elle ne soit pas collectée
+            state = self._loops[loop] = (queue, loop.create_task(self._run(queue)))
+        return state[0]
+
+    async def _run(self, queue):
+        while True:
+            batch = [await queue.get()]
+            if self.flush_interval:
+                await asyncio.sleep(self.flush_interval)
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                results = await database_sync_to_async(self.persist)(batch)
+            except Exception as exc:
+                logger.exception("Échec de l'écriture d'un lot de %s éléments du chat", len(batch))
+                results = [exc] * len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def persist(self, batch):
+        """Écrit un lot (synchrone) ; retourne un résultat ou une exception par élément."""
+        messages = [payload for kind, payload, _ in batch if kind == _MESSAGE]
+        reads = [payload for kind, payload, _ in batch if kind == _READ]
+        failures = self._write_messages(messages) if messages else {}
+        if reads:
+            self._write_reads(reads)
+
+        results = []
+        for kind, payload, _ in batch:
+            if kind == _MESSAGE:
+                results.append(failures.get(id(payload), payload))
+            else:
+                results.append(None)
+        return results
+
+    def _write_messages(self, messages):
+        from .models import ChatConversation, ChatMessage
+
+        try:
+            with transaction.atomic():
+                ChatMessage.objects.bulk_create(messages)
+                last_message_at = {}
+                for message in messages:
+                    current = last_message_at.get(message.conversation_id)
+                    if current is None or message.created_at > current:
+                        last_message_at[message.conversation_id] = message.created_at
+                ChatConversation.objects.filter(pk__in=last_message_at).update(
+                    last_message_at=Case(
+                        *(When(pk=pk, then=Value(value)) for pk, value in last_message_at.items()),
+                        output_field=DateTimeField(),
+                    )
+                )
+            return {}
+        except DatabaseError:
+            logger.warning("Lot de messages rejeté, enregistrement message par message", exc_info=True)
+
+        # Un message invalide ne doit pas faire échouer les autres messages du lot
+        failures = {}
+        for message in messages:
+            message.pk = None
+            message._state.adding = True
+            try:
+                with transaction.atomic():
+                    message.save()
+            except DatabaseError as exc:
+                failures[id(message)] = exc
+        return failures
+
+    def _write_reads(self, reads):
+        from .models import ChatMessage
+
+        grouped = defaultdict(set)
+        for conversation_id, reader_id, message_id in reads:
+            grouped[(conversation_id, reader_id)].add(message_id)
+        now = timezone.now()
+        for (conversation_id, reader_id), message_ids in grouped.items():
+            ChatMessage.objects.filter(
+                id__in=message_ids, conversation_id=conversation_id, is_read=False
+            ).exclude(sender_id=reader_id).update(is_read=True, read_at=now)
+
+
+_chat_settings = getattr(settings, "CHAT_SETTINGS", {})
+
+chat_pipeline = ChatPersistencePipeline(
+    flush_interval=_chat_settings.get("PIPELINE_FLUSH_MS", 5) / 1000,
+    max_batch=_chat_settings.get("PIPELINE_MAX_BATCH", 200),
+)
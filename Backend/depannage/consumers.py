@@ -1,9 +1,12 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
 import json
 from channels.db import database_sync_to_async
-from .models import Conversation, Message, TechnicianLocation, ClientLocation
+from .models import Conversation, Message
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from .chat_pipeline import chat_pipeline
+from .location_buffer import technician_location_buffer, client_location_buffer
+from .spatial_index import technician_index
 
 User = get_user_model()
 
@@ -64,19 +67,15 @@ class ChatConsumer(AsyncWebsocketConsumer):
         self.room_group_name = f'chat_{self.conversation_id}'
 
         if self.scope["user"].is_authenticated:
-            # Vérification supplémentaire : l'utilisateur doit être participant à la conversation
-            from .models import ChatConversation
-            try:
-                conversation = await database_sync_to_async(ChatConversation.objects.get)(id=self.conversation_id)
-                is_participant = await database_sync_to_async(
-                    lambda: self.scope["user"] in [conversation.client, conversation.technician]
-                )()
-                if not is_participant:
-                    await self.close()
-                    return
-            except Exception:
+            # L'appartenance est vérifiée une seule fois ici, puis gardée pour la durée
+            # de la connexion ; elle est réévaluée sur l'événement conversation_access_changed
+            access = await self.get_conversation_access(self.conversation_id)
+            if access is None or not self.is_allowed(access):
                 await self.close()
                 return
+            user = self.scope["user"]
+            self.conversation_id = access['id']
+            self.sender_name = user.get_full_name() or user.username
             await self.channel_layer.group_add(self.room_group_name, self.channel_name)
             await self.accept()
         else:
@@ -85,18 +84,27 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
-    async def receive(self, text_data):
-        # Vérification supplémentaire à chaque message
+    def is_allowed(self, access):
+        """L'utilisateur connecté est participant d'une conversation active."""
+        return access['is_active'] and self.scope["user"].id in (access['client_id'], access['technician_id'])
+
+    @database_sync_to_async
+    def get_conversation_access(self, conversation_id):
         from .models import ChatConversation
-        conversation = await database_sync_to_async(ChatConversation.objects.get)(id=self.conversation_id)
-        is_participant = await database_sync_to_async(
-            lambda: self.scope["user"] in [conversation.client, conversation.technician]
-        )()
-        if not is_participant:
-            await self.send(text_data=json.dumps({"error": "Vous n'êtes pas participant à cette conversation."}))
+        try:
+            return ChatConversation.objects.filter(id=conversation_id).values(
+                'id', 'client_id', 'technician_id', 'is_active'
+            ).first()
+        except (TypeError, ValueError):
+            return None
+
+    async def conversation_access_changed(self, event):
+        """Conversation archivée ou participants modifiés : on réévalue l'accès mis en cache."""
+        if not self.is_allowed(event['access']):
+            await self.send(text_data=json.dumps({"error": "Vous n'avez plus accès à cette conversation."}))
             await self.close()
-            return
-        
+
+    async def receive(self, text_data):
         data = json.loads(text_data)
         message_type = data.get('type', 'message')
         
@@ -114,6 +122,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
         content = data.get('content')
         message_type = data.get('message_type', 'text')
         user_id = self.scope['user'].id
+        if not content:
+            return
 
         # Sauvegarder le message en base
         msg = await self.save_chat_message(user_id, self.conversation_id, content, message_type)
@@ -125,8 +135,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'type': 'chat_message',
                 'message': {
                     'id': msg.id,
-                    'sender': msg.sender.id,
-                    'sender_name': msg.sender.get_full_name() or msg.sender.username,
+                    'sender': msg.sender_id,
+                    'sender_name': self.sender_name,
                     'content': msg.content,
                     'message_type': msg.message_type,
                     'created_at': msg.created_at.isoformat(),
@@ -143,7 +153,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
             {
                 'type': 'typing_indicator',
                 'sender_id': self.scope['user'].id,
-                'sender_name': self.scope['user'].get_full_name() or self.scope['user'].username,
+                'sender_name': self.sender_name,
                 'is_typing': data.get('is_typing', True)
             }
         )
@@ -179,8 +189,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'type': 'location_message',
                 'message': {
                     'id': msg.id,
-                    'sender': msg.sender.id,
-                    'sender_name': msg.sender.get_full_name() or msg.sender.username,
+                    'sender': msg.sender_id,
+                    'sender_name': self.sender_name,
                     'content': msg.content,
                     'message_type': 'location',
                     'latitude': msg.latitude,
@@ -222,43 +232,43 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'message': event['message']
         }))
 
-    @database_sync_to_async
-    def save_chat_message(self, user_id, conversation_id, content, message_type='text'):
-        """Sauvegarde un message de chat en base de données."""
-        from .models import ChatConversation, ChatMessage
-        user = User.objects.get(id=user_id)
-        conversation = ChatConversation.objects.get(id=conversation_id)
-        return ChatMessage.objects.create(
-            conversation=conversation,
-            sender=user,
+    async def save_chat_message(self, user_id, conversation_id, content, message_type='text'):
+        """Sauvegarde un message de chat via la file d'écriture regroupée."""
+        return await chat_pipeline.save_message(
+            conversation_id=conversation_id,
+            sender_id=user_id,
             content=content,
             message_type=message_type
         )
 
-    @database_sync_to_async
-    def save_location_message(self, user_id, conversation_id, latitude, longitude):
+    async def save_location_message(self, user_id, conversation_id, latitude, longitude):
         """Sauvegarde un message de localisation."""
-        from .models import ChatConversation, ChatMessage
-        user = User.objects.get(id=user_id)
-        conversation = ChatConversation.objects.get(id=conversation_id)
-        return ChatMessage.objects.create(
-            conversation=conversation,
-            sender=user,
+        return await chat_pipeline.save_message(
+            conversation_id=conversation_id,
+            sender_id=user_id,
             content="📍 Ma position actuelle",
             message_type='location',
             latitude=latitude,
             longitude=longitude
         )
 
-    @database_sync_to_async
-    def mark_message_as_read(self, message_id):
-        """Marque un message comme lu."""
-        from .models import ChatMessage
+    async def mark_message_as_read(self, message_id):
+        """Marque comme lu un message reçu dans cette conversation."""
         try:
-            message = ChatMessage.objects.get(id=message_id)
-            message.mark_as_read()
-        except ChatMessage.DoesNotExist:
-            pass
+            message_id = int(message_id)
+        except (TypeError, ValueError):
+            return
+        await chat_pipeline.mark_read(self.conversation_id, self.scope['user'].id, message_id)
+
+
+async def flush_own_position(buffer, owner_id):
+    """Écrit la position en attente d'un seul propriétaire, sans toucher à celles des autres."""
+    try:
+        owner_id = int(owner_id)
+    except (TypeError, ValueError):
+        return
+    await database_sync_to_async(buffer.flush)(owner_id)
+
 
 class TechnicianLocationConsumer(AsyncWebsocketConsumer):
     """Consumer pour le suivi en temps réel de la position des techniciens."""
@@ -275,6 +285,8 @@ class TechnicianLocationConsumer(AsyncWebsocketConsumer):
 
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        # Dernière position de ce technicien écrite sans attendre le prochain cycle
+        await flush_own_position(technician_location_buffer, self.technician_id)
 
     async def receive(self, text_data):
         """Reçoit la position GPS du technicien et la diffuse."""
@@ -283,8 +295,8 @@ class TechnicianLocationConsumer(AsyncWebsocketConsumer):
         longitude = data.get('longitude')
         
         if latitude is not None and longitude is not None:
-            # Sauvegarder en base de données
-            await self.save_technician_location(self.technician_id, latitude, longitude)
+            # Mémoriser la position (écriture en base différée)
+            self.save_technician_location(self.technician_id, latitude, longitude)
             
             # Diffuser à tous les abonnés
             await self.channel_layer.group_send(
@@ -306,29 +318,17 @@ class TechnicianLocationConsumer(AsyncWebsocketConsumer):
             'timestamp': event['timestamp']
         }))
 
-    @database_sync_to_async
     def save_technician_location(self, technician_id, latitude, longitude):
-        """Sauvegarde la position du technicien en base de données."""
-        from .models import Technician
+        """Mémorise la position du technicien ; l'écriture en base est différée et regroupée."""
         try:
-            technician = Technician.objects.get(id=technician_id)
-            location, created = TechnicianLocation.objects.get_or_create(
-                technician=technician,
-                defaults={'latitude': latitude, 'longitude': longitude}
-            )
-            if not created:
-                location.latitude = latitude
-                location.longitude = longitude
-                location.save()
-            
-            # Mettre à jour aussi les champs du technicien
-            technician.current_latitude = latitude
-            technician.current_longitude = longitude
-            technician.last_position_update = timezone.now()
-            technician.save()
-            
-        except Technician.DoesNotExist:
-            pass
+            technician_id = int(technician_id)
+            latitude, longitude = float(latitude), float(longitude)
+        except (TypeError, ValueError):
+            return
+        technician_location_buffer.record(technician_id, latitude, longitude)
+        # L'index spatial suit la position en direct, sans attendre l'écriture en base
+        if technician_index.is_loaded:
+            technician_index.update_position(technician_id, latitude, longitude)
 
 class ClientLocationConsumer(AsyncWebsocketConsumer):
     """Consumer pour le suivi en temps réel de la position des clients."""
@@ -345,6 +345,7 @@ class ClientLocationConsumer(AsyncWebsocketConsumer):
 
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        await flush_own_position(client_location_buffer, self.client_id)
 
     async def receive(self, text_data):
         """Reçoit la position GPS du client et la diffuse."""
@@ -353,8 +354,8 @@ class ClientLocationConsumer(AsyncWebsocketConsumer):
         longitude = data.get('longitude')
         
         if latitude is not None and longitude is not None:
-            # Sauvegarder en base de données
-            await self.save_client_location(self.client_id, latitude, longitude)
+            # Mémoriser la position (écriture en base différée)
+            self.save_client_location(self.client_id, latitude, longitude)
             
             # Diffuser à tous les abonnés
             await self.channel_layer.group_send(
@@ -376,20 +377,9 @@ class ClientLocationConsumer(AsyncWebsocketConsumer):
             'timestamp': event['timestamp']
         }))
 
-    @database_sync_to_async
     def save_client_location(self, client_id, latitude, longitude):
-        """Sauvegarde la position du client en base de données."""
-        from .models import Client
+        """Mémorise la position du client ; l'écriture en base est différée et regroupée."""
         try:
-            client = Client.objects.get(id=client_id)
-            location, created = ClientLocation.objects.get_or_create(
-                client=client,
-                defaults={'latitude': latitude, 'longitude': longitude}
-            )
-            if not created:
-                location.latitude = latitude
-                location.longitude = longitude
-                location.save()
-                
-        except Client.DoesNotExist:
-            pass 
\ No newline at end of file
+            client_location_buffer.record(int(client_id), float(latitude), float(longitude))
+        except (TypeError, ValueError):
+            pass
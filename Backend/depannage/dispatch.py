@@ -0,0 +1,354 @@
+"""
+Moteur d'affectation des techniciens.
+
+Un seul pipeline de sélection pour la création d'une demande (techniciens
+notifiés), la réaffectation après absence signalée (``report_no_show``) et
+après changement de spécialité (``handle_specialty_change``) :
+
+1. index : ``TechnicianFeatureTable`` garde en colonnes NumPy les techniciens
+   disponibles et vérifiés, par spécialité et triés par latitude ; la bande
+   de latitude autour de la demande est trouvée par recherche dichotomique ;
+2. filtre vectorisé : longitude, distance exacte, rayon d'intervention propre
+   à chacun, note et niveau d'expérience minimums, exclusions ;
+3. score pondéré des critères enregistrés avec ``register_scorer`` (poids dans
+   ``DISPATCH_SETTINGS['WEIGHTS']``) ;
+4. les meilleurs scores sont parcourus par tranches et les techniciens déjà
+   occupés (compteur ``Technician.active_jobs_count``, une requête par clé
+   primaire par tranche) écartés jusqu'à en retenir ``k``.
+
+Chaque critère retourne, pour tous les candidats à la fois, un tableau de
+valeurs dans [0, 1] (1 = meilleur).
+
+La table est chargée au premier besoin, marquée périmée à chaque
+enregistrement d'un technicien (voir les signaux de ``models.py``) et
+rechargée au plus tard toutes les ``REFRESH_SECONDS`` pour rattraper les
+écritures des autres workers et les compteurs d'avis mis à jour par ``update``.
+"""
+import threading
+import time
+from dataclasses import dataclass, fields
+from typing import NamedTuple
+
+import numpy as np
+from django.conf import settings
+
+from .utils import bounding_box, haversine_distances
+
+EXPERIENCE_RANKS = {"junior": 0, "intermediate": 1, "senior": 2, "expert": 3}
+URGENT_LEVELS = frozenset({"urgent", "sos"})
+
+# Colonnes Technician chargées dans la table
+FEATURE_FIELDS = (
+    "id", "user_id", "current_latitude", "current_longitude", "service_radius_km",
+    "rating_sum", "rating_count", "experience_level", "response_time_minutes", "is_available_urgent",
+)
+
+# Champs Technician dont la modification périme la table (voir invalidate_dispatch_table)
+TABLE_FIELDS = frozenset(FEATURE_FIELDS[2:]) | {"specialty", "is_available", "is_verified"}
+
+SCORERS = {}
+
+
+def register_scorer(name):
+    """Enregistre ``func(candidates, query, dispatcher) -> ndarray`` comme critère ``name``."""
+    def decorator(func):
+        SCORERS[name] = func
+        return func
+    return decorator
+
+
+@dataclass
+class CandidateSet:
+    """Techniciens en colonnes NumPy alignées ; ``distance_km`` est propre à une demande."""
+
+    ids: np.ndarray
+    user_ids: np.ndarray
+    latitude: np.ndarray
+    longitude: np.ndarray
+    radius_km: np.ndarray
+    rating: np.ndarray
+    rating_count: np.ndarray
+    experience: np.ndarray
+    response_minutes: np.ndarray
+    urgent_ok: np.ndarray
+    distance_km: np.ndarray = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def select(self, selector):
+        """Sous-ensemble (tranche, masque booléen ou indices)."""
+        return CandidateSet(**{
+            f.name: None if getattr(self, f.name) is None else getattr(self, f.name)[selector]
+            for f in fields(self)
+        })
+
+    @classmethod
+    def from_rows(cls, rows):
+        """``rows`` : tuples dans l'ordre de ``FEATURE_FIELDS``."""
+        count = len(rows)
+        columns = list(zip(*rows)) if rows else [()] * len(FEATURE_FIELDS)
+        ids, user_ids, lats, lons, radius, rating_sum, rating_count, experience, response, urgent = columns
+
+        def column(values, dtype):
+            return np.fromiter(values, dtype=dtype, count=count)
+
+        rating_sum = column(rating_sum, np.float64)
+        rating_count = column(rating_count, np.float64)
+        return cls(
+            ids=column(ids, np.int64),
+            user_ids=column(user_ids, np.int64),
+            latitude=column(lats, np.float64),
+            longitude=column(lons, np.float64),
+            radius_km=column((r or 0 for r in radius), np.float64),
+            # Même arrondi que Technician.average_rating
+            rating=np.round(np.divide(rating_sum, rating_count, out=np.zeros(count), where=rating_count > 0), 1),
+            rating_count=rating_count,
+            experience=column((EXPERIENCE_RANKS.get(e, 0) for e in experience), np.int64),
+            response_minutes=column(response, np.float64),
+            urgent_ok=column(urgent, bool),
+        )
+
+
+class TechnicianFeatureTable:
+    """Techniciens disponibles et vérifiés, par spécialité, triés par latitude."""
+
+    def __init__(self, refresh_seconds=300):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._by_specialty = {}
+        self._loaded_at = None
+
+    def load(self, rows_by_specialty):
+        """Remplace le contenu : ``{spécialité: [tuples FEATURE_FIELDS]}``."""
+        tables = {}
+        for specialty, rows in rows_by_specialty.items():
+            table = CandidateSet.from_rows(rows)
+            tables[specialty] = table.select(np.argsort(table.latitude, kind="stable"))
+        with self._lock:
+            self._by_specialty = tables
+            self._loaded_at = time.monotonic()
+
+    def load_from_database(self):
+        from .models import Technician
+
+        rows_by_specialty = {}
+        rows = Technician.objects.filter(
+            is_available=True, is_verified=True,
+            current_latitude__isnull=False, current_longitude__isnull=False,
+        ).values_list("specialty", *FEATURE_FIELDS)
+        for row in rows.iterator(chunk_size=2000):
+            rows_by_specialty.setdefault(row[0], []).append(row[1:])
+        self.load(rows_by_specialty)
+
+    def ensure_loaded(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.refresh_seconds:
+            self.load_from_database()
+
+    def invalidate(self):
+        """Rechargement au prochain appel (plusieurs enregistrements successifs n'en coûtent qu'un)."""
+        self._loaded_at = None
+
+    def nearby(self, specialty, latitude, longitude, radius_km):
+        """Techniciens de la spécialité à moins de ``radius_km``, avec leur distance."""
+        self.ensure_loaded()
+        table = self._by_specialty.get(specialty)
+        if table is None or not len(table):
+            empty = CandidateSet.from_rows([])
+            empty.distance_km = np.zeros(0)
+            return empty
+        min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+        start = np.searchsorted(table.latitude, min_lat, side="left")
+        stop = np.searchsorted(table.latitude, max_lat, side="right")
+        band = table.select(slice(start, stop))
+        band = band.select((band.longitude >= min_lon) & (band.longitude <= max_lon))
+        band.distance_km = np.asarray(
+            haversine_distances(latitude, longitude, band.latitude, band.longitude), dtype=np.float64
+        ) if len(band) else np.zeros(0)
+        return band
+
+
+@dataclass(frozen=True)
+class DispatchQuery:
+    """Ce que le moteur retient d'une demande."""
+
+    latitude: float
+    longitude: float
+    specialty: str
+    urgency_level: str = "normal"
+    min_experience_level: str = "junior"
+    min_rating: float = 0
+    exclude_ids: frozenset = frozenset()
+    exclude_busy: bool = True
+
+    @classmethod
+    def from_request(cls, repair_request, exclude_ids=(), min_rating=None, **kwargs):
+        return cls(
+            latitude=repair_request.latitude,
+            longitude=repair_request.longitude,
+            specialty=repair_request.specialty_needed,
+            urgency_level=repair_request.urgency_level or "normal",
+            min_experience_level=repair_request.min_experience_level or "junior",
+            min_rating=max(repair_request.min_rating or 0, min_rating or 0),
+            exclude_ids=frozenset(i for i in exclude_ids if i is not None),
+            **kwargs,
+        )
+
+    @property
+    def is_urgent(self):
+        return self.urgency_level in URGENT_LEVELS
+
+
+class DispatchCandidate(NamedTuple):
+    technician_id: int
+    user_id: int
+    distance_km: float
+    score: float
+
+
+def busy_technician_ids(technician_ids, max_active_jobs=1):
+    """
+    Techniciens (parmi ``technician_ids``) ayant atteint ``max_active_jobs`` demandes
+    assignées ou en cours : lecture du compteur ``active_jobs_count`` par clé primaire,
+    sans parcourir les demandes ouvertes.
+    """
+    from .models import Technician
+
+    return set(
+        Technician.objects.filter(
+            id__in=list(technician_ids), active_jobs_count__gte=max_active_jobs,
+        ).values_list("id", flat=True)
+    )
+
+
+# --- Critères ---------------------------------------------------------------
+
+@register_scorer("distance")
+def distance_score(candidates, query, dispatcher):
+    """Proximité relative au rayon d'intervention du technicien."""
+    radius = np.maximum(candidates.radius_km, 1.0)
+    return np.clip(1.0 - candidates.distance_km / radius, 0.0, 1.0)
+
+
+@register_scorer("rating")
+def rating_score(candidates, query, dispatcher):
+    """Note moyenne ; un technicien sans avis reçoit une note neutre."""
+    return np.where(candidates.rating_count > 0, candidates.rating / 5.0, dispatcher.unrated_score)
+
+
+@register_scorer("experience")
+def experience_score(candidates, query, dispatcher):
+    return candidates.experience / max(EXPERIENCE_RANKS.values())
+
+
+@register_scorer("response_time")
+def response_time_score(candidates, query, dispatcher):
+    cap = dispatcher.response_time_cap
+    return 1.0 - np.minimum(candidates.response_minutes, cap) / cap
+
+
+@register_scorer("urgency")
+def urgency_score(candidates, query, dispatcher):
+    """Demandes urgentes/SOS : priorité aux techniciens disponibles en urgence."""
+    if not query.is_urgent:
+        return np.zeros(len(candidates))
+    return candidates.urgent_ok.astype(np.float64)
+
+
+# --- Moteur -----------------------------------------------------------------
+
+class Dispatcher:
+    def __init__(self, table=None, weights=None, max_radius_km=50, reassign_min_rating=3.5,
+                 notify_top_k=20, response_time_cap=120, unrated_score=0.6, max_active_jobs=1,
+                 busy_lookup=busy_technician_ids):
+        self.table = table or TechnicianFeatureTable()
+        self.weights = dict(weights or {
+            "distance": 0.4, "rating": 0.25, "experience": 0.1, "response_time": 0.15, "urgency": 0.1,
+        })
+        self.max_radius_km = max_radius_km
+        self.reassign_min_rating = reassign_min_rating
+        self.notify_top_k = notify_top_k
+        self.response_time_cap = response_time_cap
+        self.unrated_score = unrated_score
+        self.max_active_jobs = max_active_jobs
+        self.busy_lookup = busy_lookup
+
+    def eligible(self, candidates, query):
+        """Masque des candidats retenus, calculé en une passe vectorisée."""
+        mask = candidates.distance_km <= candidates.radius_km
+        mask &= candidates.rating >= query.min_rating
+        mask &= candidates.experience >= EXPERIENCE_RANKS.get(query.min_experience_level, 0)
+        if query.exclude_ids:
+            mask &= ~np.isin(candidates.ids, np.fromiter(query.exclude_ids, dtype=np.int64))
+        return mask
+
+    def score(self, candidates, query):
+        total = np.zeros(len(candidates))
+        for name, weight in self.weights.items():
+            if weight:
+                total += weight * SCORERS[name](candidates, query, self)
+        return total
+
+    def rank(self, candidates, query, k=10):
+        """Les ``k`` meilleurs candidats éligibles et libres, par score décroissant puis distance."""
+        candidates = candidates.select(self.eligible(candidates, query))
+        if not len(candidates):
+            return []
+        scores = self.score(candidates, query)
+        order = np.lexsort((candidates.distance_km, -scores))
+        ranked = []
+        # Tranches de meilleurs scores : une requête « occupés » par tranche, en général une seule
+        chunk = max(k * 4, 20)
+        for start in range(0, len(order), chunk):
+            indices = order[start:start + chunk]
+            busy = set()
+            if query.exclude_busy and self.busy_lookup is not None:
+                busy = self.busy_lookup(candidates.ids[indices].tolist(), self.max_active_jobs)
+            for i in indices:
+                technician_id = int(candidates.ids[i])
+                if technician_id in busy:
+                    continue
+                ranked.append(DispatchCandidate(
+                    technician_id, int(candidates.user_ids[i]),
+                    round(float(candidates.distance_km[i]), 2), round(float(scores[i]), 4),
+                ))
+                if len(ranked) == k:
+                    return ranked
+        return ranked
+
+    def top_k(self, query, k=10, radius_km=None):
+        """``radius_km`` : fenêtre de recherche (``max_radius_km`` par défaut), voir les anneaux de sla.py."""
+        if query.latitude is None or query.longitude is None:
+            return []
+        candidates = self.table.nearby(
+            query.specialty, query.latitude, query.longitude, radius_km or self.max_radius_km
+        )
+        return self.rank(candidates, query, k)
+
+    def best_technician(self, query):
+        """Instance ``Technician`` du meilleur candidat (revérifié en base), ou None."""
+        from .models import Technician
+
+        for candidate in self.top_k(query, k=3):
+            technician = Technician.objects.select_related("user").filter(
+                id=candidate.technician_id, is_available=True, is_verified=True,
+            ).first()
+            if technician is not None:
+                technician.distance_km = candidate.distance_km
+                return technician
+        return None
+
+
+_dispatch_settings = getattr(settings, "DISPATCH_SETTINGS", {})
+
+dispatcher = Dispatcher(
+    table=TechnicianFeatureTable(refresh_seconds=_dispatch_settings.get("REFRESH_SECONDS", 300)),
+    weights=_dispatch_settings.get("WEIGHTS"),
+    max_radius_km=_dispatch_settings.get("MAX_RADIUS_KM", 50),
+    reassign_min_rating=_dispatch_settings.get("REASSIGN_MIN_RATING", 3.5),
+    notify_top_k=_dispatch_settings.get("NOTIFY_TOP_K", 20),
+    response_time_cap=_dispatch_settings.get("RESPONSE_TIME_CAP_MINUTES", 120),
+    unrated_score=_dispatch_settings.get("UNRATED_SCORE", 0.6),
+    max_active_jobs=_dispatch_settings.get("MAX_ACTIVE_JOBS", 1),
+)
@@ -0,0 +1,156 @@
+"""
+Exports CSV / XLSX en flux, à mémoire constante.
+
+Un export est décrit par une liste de ``ExportColumn`` : l'en-tête, les
+chemins ``values_list`` lus (relations comprises, ``user__email`` par
+exemple) et une fonction de mise en forme facultative. Les lignes sont lues
+par lots de ``CHUNK_SIZE`` avec ``.iterator()`` : aucune instance de modèle
+n'est construite, les relations sont jointes dans la même requête (pas de
+N+1) et le jeu de résultats complet n'est jamais chargé.
+
+- CSV : chaque lot est encodé puis envoyé au client par ``StreamingHttpResponse`` ;
+- XLSX : le classeur openpyxl est ouvert en mode ``write_only`` (les lignes
+  sont écrites sur disque au fil de l'eau), enregistré dans un fichier
+  temporaire puis renvoyé par morceaux avec ``FileResponse``.
+"""
+import csv
+import tempfile
+from typing import Callable, NamedTuple, Optional, Sequence
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+class ExportColumn(NamedTuple):
+    header: str
+    # Un chemin ``values_list`` ou plusieurs, passés dans l'ordre au formateur
+    fields: object
+    formatter: Optional[Callable] = None
+
+    @property
+    def paths(self):
+        return (self.fields,) if isinstance(self.fields, str) else tuple(self.fields)
+
+
+def format_datetime(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else ""
+
+
+def format_full_name(first_name, last_name):
+    return f"{first_name or ''} {last_name or ''}".strip()
+
+
+def _chunk_size(chunk_size=None):
+    return chunk_size or getattr(settings, "EXPORT_SETTINGS", {}).get("CHUNK_SIZE", 2000)
+
+
+def iter_rows(queryset, columns: Sequence[ExportColumn], chunk_size=None):
+    """Lignes mises en forme, lues par lots sans instancier de modèles."""
+    paths = []
+    slices = []
+    for column in columns:
+        start = len(paths)
+        paths.extend(column.paths)
+        slices.append((column, start, len(paths)))
+
+    for values in queryset.values_list(*paths).iterator(chunk_size=_chunk_size(chunk_size)):
+        row = []
+        for column, start, end in slices:
+            if column.formatter is not None:
+                row.append(column.formatter(*values[start:end]))
+            else:
+                value = values[start]
+                row.append("" if value is None else value)
+        yield row
+
+
+class _Echo:
+    """Pseudo-fichier pour ``csv.writer`` : ``write`` rend la ligne au lieu de la stocker."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(queryset, columns, chunk_size=None):
+    """Contenu CSV par morceaux (un morceau par lot de lignes)."""
+    size = _chunk_size(chunk_size)
+    writer = csv.writer(_Echo())
+    yield writer.writerow([column.header for column in columns])
+    buffer = []
+    for row in iter_rows(queryset, columns, size):
+        buffer.append(writer.writerow(row))
+        if len(buffer) >= size:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
+
+
+def write_xlsx(queryset, columns, fileobj, sheet_title="Export", chunk_size=None):
+    """Écrit le classeur dans ``fileobj`` en mode ``write_only`` d'openpyxl."""
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title)
+    sheet.append([column.header for column in columns])
+    for row in iter_rows(queryset, columns, chunk_size):
+        sheet.append([_xlsx_value(value) for value in row])
+    workbook.save(fileobj)
+
+
+def _xlsx_value(value):
+    # Les types non gérés par openpyxl (dict JSON, UUID...) sont écrits en texte
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+class _ExportFormatRenderer(BaseRenderer):
+    """
+    Accepte ``?format=csv|excel`` dans la négociation de contenu DRF.
+
+    Les exports renvoient directement un ``StreamingHttpResponse`` ; seules
+    les réponses d'erreur passent par ce renderer, rendues en JSON.
+    """
+
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data)
+
+
+class CSVExportRenderer(_ExportFormatRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+
+class ExcelExportRenderer(_ExportFormatRenderer):
+    media_type = XLSX_CONTENT_TYPE
+    format = "excel"
+    charset = None
+
+
+EXPORT_RENDERER_CLASSES = [JSONRenderer, CSVExportRenderer, ExcelExportRenderer]
+
+
+def export_response(queryset, columns, filename, export_format="csv", sheet_title="Export", chunk_size=None):
+    """Réponse HTTP en flux ; ``filename`` sans extension."""
+    if export_format in ("excel", "xlsx"):
+        output = tempfile.TemporaryFile()
+        try:
+            write_xlsx(queryset, columns, output, sheet_title=sheet_title, chunk_size=chunk_size)
+        except Exception:
+            output.close()
+            raise
+        output.seek(0)
+        # FileResponse ferme (et supprime) le fichier temporaire en fin d'envoi
+        return FileResponse(
+            output, as_attachment=True, filename=f"{filename}.xlsx", content_type=XLSX_CONTENT_TYPE
+        )
+
+    response = StreamingHttpResponse(iter_csv(queryset, columns, chunk_size), content_type="text/csv")
+    response["Content-Disposition"] = f'attachment; filename="{filename}.csv"'
+    return response
@@ -0,0 +1,140 @@
+"""
+Géolocalisation IP partagée par tout le processus.
+
+La base GeoLite2 est ouverte une seule fois, en mode ``MODE_MMAP`` : le
+fichier est projeté en mémoire et partagé entre workers par le cache de pages
+du système, au lieu d'un ``geoip2.database.Reader`` ouvert puis refermé à
+chaque appel. Devant le lecteur, un cache LRU borné avec durée de vie
+(``GEOIP_SETTINGS``) garde le résultat par adresse IP : le middleware et
+``log_event`` qui suivent dans la même requête ne refont pas la recherche.
+
+Les adresses inconnues (ou privées) sont aussi mises en cache, avec un
+résultat vide.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LOCAL_ADDRESSES = ("127.0.0.1", "::1", "localhost")
+
+
+class GeoLocation(NamedTuple):
+    country: str = ""
+    city: str = ""
+
+    @property
+    def label(self):
+        """Libellé "Ville, Pays" (ou le pays seul) enregistré dans le journal d'audit."""
+        if self.city and self.country:
+            return f"{self.city}, {self.country}"
+        return self.country or None
+
+
+UNKNOWN_LOCATION = GeoLocation()
+
+
+def _open_mmap_reader(path):
+    import geoip2.database
+
+    return geoip2.database.Reader(path, mode=geoip2.database.MODE_MMAP)
+
+
+class GeoIPLookup:
+    """Lecteur GeoIP unique et cache LRU/TTL par IP, sûrs entre threads."""
+
+    def __init__(self, db_path, cache_size=10000, ttl=3600, reader_factory=_open_mmap_reader,
+                 clock=time.monotonic):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.reader_factory = reader_factory
+        self.clock = clock
+        self._reader = None
+        self._unavailable = False
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def reader(self):
+        """Ouvert au premier besoin ; None si la base est absente ou illisible."""
+        if self._reader is None and not self._unavailable:
+            with self._lock:
+                if self._reader is None and not self._unavailable:
+                    try:
+                        self._reader = self.reader_factory(self.db_path)
+                    except Exception as exc:
+                        self._unavailable = True
+                        logger.warning("Base GeoIP indisponible (%s) : %s", self.db_path, exc)
+        return self._reader
+
+    def lookup(self, ip_address):
+        """``GeoLocation`` de l'adresse (vide si inconnue)."""
+        if not ip_address or ip_address in LOCAL_ADDRESSES:
+            return UNKNOWN_LOCATION
+        now = self.clock()
+        with self._lock:
+            entry = self._cache.get(ip_address)
+            if entry is not None and entry[1] > now:
+                self._cache.move_to_end(ip_address)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        location = self._resolve(ip_address)
+        with self._lock:
+            self._cache[ip_address] = (location, now + self.ttl)
+            self._cache.move_to_end(ip_address)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return location
+
+    def _resolve(self, ip_address):
+        reader = self.reader
+        if reader is None:
+            return UNKNOWN_LOCATION
+        try:
+            response = reader.city(ip_address)
+        except Exception:
+            # AddressNotFoundError, adresse invalide...
+            return UNKNOWN_LOCATION
+        return GeoLocation(response.country.name or "", response.city.name or "")
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = 0
+
+    def close(self):
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+            self._reader = None
+            self._unavailable = False
+            self._cache.clear()
+
+
+def default_db_path():
+    geoip_settings = getattr(settings, "GEOIP_SETTINGS", {})
+    if geoip_settings.get("DB_PATH"):
+        return geoip_settings["DB_PATH"]
+    if getattr(settings, "GEOIP_PATH", None):
+        return os.path.join(settings.GEOIP_PATH, "GeoLite2-City.mmdb")
+    return os.path.join(os.path.dirname(__file__), "../geoip/GeoLite2-City.mmdb")
+
+
+_geoip_settings = getattr(settings, "GEOIP_SETTINGS", {})
+
+geoip_lookup = GeoIPLookup(
+    default_db_path(),
+    cache_size=_geoip_settings.get("CACHE_SIZE", 10000),
+    ttl=_geoip_settings.get("CACHE_TTL_SECONDS", 3600),
+)
@@ -0,0 +1,402 @@
+"""
+File de tâches de fond stockée en base.
+
+Les effets de bord lents (emails SMTP, rendu PDF...) ne sont plus exécutés
+dans le thread de la requête : la vue appelle ``enqueue`` qui insère une
+ligne ``BackgroundJob`` dans la transaction courante (annulée avec elle),
+et les workers ``python manage.py run_jobs`` les exécutent.
+
+- priorité : ``BackgroundJob.PRIORITY_HIGH`` passe avant ``PRIORITY_LOW`` ;
+- prise en charge : UPDATE conditionnel ``status=pending`` → ``running``,
+  plusieurs workers (processus ou threads) ne prennent jamais la même tâche ;
+- échec : nouvel essai après ``RETRY_BACKOFF_SECONDS * 2**(tentative-1)``
+  jusqu'à ``max_attempts``, puis statut ``failed`` ;
+- une tâche ``running`` dont le worker a disparu est remise en file après
+  ``STALE_AFTER_SECONDS``.
+
+Avec ``JOB_SETTINGS['IN_PROCESS_WORKERS']`` > 0 (par défaut, tant qu'aucun
+worker n'est déployé), la tâche est réservée dès son insertion au nom du
+processus web puis confiée, après la validation de la transaction, à un pool
+de threads de ce processus : la requête n'attend ni SMTP ni rendu, et un
+worker ``run_jobs`` lancé en parallèle ne peut pas l'exécuter une seconde
+fois. Les nouveaux essais sont repris par ce pool (ou par un worker).
+
+``JOB_SETTINGS['EAGER']`` (développement et tests uniquement, désactivé par
+défaut) exécute la tâche après commit dans le thread appelant.
+"""
+import logging
+import os
+import socket
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {}
+
+
+def _job_settings():
+    return getattr(settings, "JOB_SETTINGS", {})
+
+
+def register_job(name):
+    """Enregistre ``func(**payload)`` comme tâche ``name`` ; sa valeur de retour (dict) est conservée."""
+    def decorator(func):
+        JOB_HANDLERS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, priority=None, run_at=None, max_attempts=None):
+    """Met une tâche en file ; ``payload`` doit être sérialisable en JSON."""
+    from .models import BackgroundJob
+
+    if name not in JOB_HANDLERS:
+        raise KeyError(f"Tâche inconnue : {name}")
+    now = timezone.now()
+    eager = _job_settings().get("EAGER", False)
+    in_process = (eager or _job_settings().get("IN_PROCESS_WORKERS", 0) > 0) and (run_at is None or run_at <= now)
+    lock = {}
+    if in_process:
+        # Réservée dès l'insertion : aucun worker run_jobs ne la prend entre l'insertion et le commit
+        lock = {"status": BackgroundJob.Status.RUNNING, "locked_by": in_process_worker_id(), "locked_at": now}
+    job = BackgroundJob.objects.create(
+        name=name,
+        payload=payload or {},
+        priority=BackgroundJob.PRIORITY_NORMAL if priority is None else priority,
+        run_at=run_at or now,
+        max_attempts=max_attempts or _job_settings().get("MAX_ATTEMPTS", 3),
+        **lock,
+    )
+    if eager and in_process:
+        transaction.on_commit(lambda: run_job(job))
+    elif in_process:
+        transaction.on_commit(lambda: _submit_in_process(job.pk))
+    return job
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def in_process_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:web"
+
+
+def _claim(job_id, worker_id):
+    from .models import BackgroundJob
+
+    claimed = BackgroundJob.objects.filter(id=job_id, status=BackgroundJob.Status.PENDING).update(
+        status=BackgroundJob.Status.RUNNING, locked_by=worker_id[:100], locked_at=timezone.now()
+    )
+    return BackgroundJob.objects.get(id=job_id) if claimed else None
+
+
+def claim_next(worker_id=None):
+    """Réserve la tâche prête la plus prioritaire, ou retourne None."""
+    from .models import BackgroundJob
+
+    worker_id = worker_id or default_worker_id()
+    ready = BackgroundJob.objects.filter(
+        status=BackgroundJob.Status.PENDING, run_at__lte=timezone.now()
+    ).order_by("priority", "run_at", "id")
+    # Quelques candidats : si un autre worker prend le premier, on tente le suivant
+    for job_id in ready.values_list("id", flat=True)[:5]:
+        job = _claim(job_id, worker_id)
+        if job is not None:
+            return job
+    return None
+
+
+def run_job(job):
+    """Exécute une tâche réservée et enregistre son issue (succès, nouvel essai ou échec)."""
+    from .models import BackgroundJob
+
+    handler = JOB_HANDLERS.get(job.name)
+    job.attempts += 1
+    try:
+        if handler is None:
+            raise KeyError(f"Tâche inconnue : {job.name}")
+        result = handler(**job.payload)
+    except Exception as exc:
+        job.last_error = "".join(traceback.format_exception_only(type(exc), exc)).strip()
+        if job.attempts < job.max_attempts:
+            backoff = _job_settings().get("RETRY_BACKOFF_SECONDS", 30) * 2 ** (job.attempts - 1)
+            job.status = BackgroundJob.Status.PENDING
+            job.run_at = timezone.now() + timedelta(seconds=backoff)
+            logger.warning("Tâche %s en échec (essai %s/%s) : %s", job, job.attempts, job.max_attempts, exc)
+        else:
+            job.status = BackgroundJob.Status.FAILED
+            job.finished_at = timezone.now()
+            logger.exception("Tâche %s abandonnée après %s essais", job, job.attempts)
+    else:
+        job.status = BackgroundJob.Status.SUCCEEDED
+        job.result = result if isinstance(result, dict) else {}
+        job.finished_at = timezone.now()
+    job.locked_by = ""
+    job.locked_at = None
+    job.save(update_fields=[
+        "status", "attempts", "run_at", "result", "last_error", "finished_at", "locked_by", "locked_at",
+    ])
+    return job
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _in_process_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        # Après un fork (workers gunicorn), les threads du parent n'existent plus
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(
+                max_workers=max(1, _job_settings().get("IN_PROCESS_WORKERS", 0)), thread_name_prefix="jobs",
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _submit_in_process(job_id, claim=False):
+    _in_process_pool().submit(_run_in_process, job_id, claim)
+
+
+def _run_in_process(job_id, claim=False):
+    """Exécute dans le pool une tâche réservée par ``enqueue`` (ou à réserver pour un nouvel essai)."""
+    from .models import BackgroundJob
+
+    close_old_connections()
+    try:
+        worker_id = in_process_worker_id()
+        if claim:
+            job = _claim(job_id, worker_id)
+        else:
+            job = BackgroundJob.objects.filter(
+                id=job_id, status=BackgroundJob.Status.RUNNING, locked_by=worker_id[:100]
+            ).first()
+        if job is None:
+            # Prise par un worker run_jobs, ou remise en file entre-temps
+            return
+        job = run_job(job)
+        if job.status == BackgroundJob.Status.PENDING:
+            timer = threading.Timer(
+                max(0.0, (job.run_at - timezone.now()).total_seconds()), _submit_in_process, args=(job_id, True),
+            )
+            timer.daemon = True
+            timer.start()
+    except Exception:
+        logger.exception("Tâche %s : exécution dans le processus web impossible", job_id)
+    finally:
+        close_old_connections()
+
+
+def run_pending(limit=None, worker_id=None):
+    """Exécute les tâches prêtes jusqu'à épuisement (ou ``limit``) ; retourne le nombre traité."""
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_next(worker_id)
+        if job is None:
+            break
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def requeue_stale_jobs(stale_after=None):
+    """Remet en file les tâches restées ``running`` trop longtemps (worker arrêté en cours de route)."""
+    from .models import BackgroundJob
+
+    stale_after = stale_after or _job_settings().get("STALE_AFTER_SECONDS", 900)
+    return BackgroundJob.objects.filter(
+        status=BackgroundJob.Status.RUNNING,
+        locked_at__lt=timezone.now() - timedelta(seconds=stale_after),
+    ).update(status=BackgroundJob.Status.PENDING, locked_by="", locked_at=None)
+
+
+# --- Tâches de l'application -------------------------------------------------
+
+@register_job("send_email")
+def send_email_job(subject, message, recipient_list, from_email=None, html_message=None):
+    from django.core.mail import send_mail
+
+    sent = send_mail(
+        subject,
+        message,
+        from_email or settings.DEFAULT_FROM_EMAIL,
+        recipient_list,
+        html_message=html_message,
+        fail_silently=False,
+    )
+    return {"sent": sent}
+
+
+@register_job("security_notification")
+def security_notification_job(user_id, subject, message, html_message=None, event_type=None):
+    from users.models import User
+    from users.utils import send_security_notification
+
+    user = User.objects.filter(pk=user_id).first()
+    if user is not None:
+        send_security_notification(user, subject, message, html_message=html_message, event_type=event_type)
+    return {}
+
+
+@register_job("otp_email")
+def otp_email_job(otp_challenge_id):
+    """Envoie le code d'un ``OTPChallenge`` ; seul l'identifiant est stocké dans la tâche."""
+    from django.core.mail import send_mail
+    from users.models import OTPChallenge
+
+    otp = OTPChallenge.objects.select_related("user").filter(pk=otp_challenge_id).first()
+    if otp is None or otp.is_expired():
+        return {"sent": 0}
+    sent = send_mail(
+        "Votre code de connexion DepanneTeliman",
+        f"Votre code de vérification est : {otp.code}",
+        "no-reply@depanneteliman.com",
+        [otp.user.email],
+        fail_silently=False,
+    )
+    return {"sent": sent}
+
+
+@register_job("password_reset_email")
+def password_reset_email_job(reset_token_id):
+    """Envoie le lien de réinitialisation d'un ``PasswordResetToken`` ; le jeton reste hors de la tâche."""
+    from django.core.mail import send_mail
+    from users.models import PasswordResetToken
+
+    reset_token = PasswordResetToken.objects.select_related("user").filter(pk=reset_token_id).first()
+    if reset_token is None or reset_token.is_expired():
+        return {"sent": 0}
+    user = reset_token.user
+    reset_url = f"http://127.0.0.1:5173/reset-password?token={reset_token.token}"
+    sent = send_mail(
+        "Réinitialisation de votre mot de passe - DepanneTeliman",
+        f'''Bonjour {user.first_name},
+
+Vous avez demandé la réinitialisation de votre mot de passe.
+
+Cliquez sur le lien suivant pour créer un nouveau mot de passe :
+{reset_url}
+
+Ce lien expire dans 24 heures.
+
+Si vous n'avez pas demandé cette réinitialisation, ignorez cet email.
+
+Cordialement,
+L'équipe DepanneTeliman''',
+        "no-reply@depanneteliman.com",
+        [user.email],
+        fail_silently=False,
+    )
+    return {"sent": sent}
+
+
+@register_job("statistics_pdf")
+def statistics_pdf_job(user_id=None):
+    """Génère le PDF des statistiques dans le stockage privé des exports et prévient le demandeur."""
+    import secrets
+
+    from django.core.files.base import ContentFile
+    from django.urls import reverse
+
+    from .export_statistics_pdf import private_export_storage, render_statistics_pdf
+    from .notifications import notify
+
+    filename, content = render_statistics_pdf()
+    # Nom non devinable en plus du contrôle d'accès de download_statistics_pdf
+    stem, extension = os.path.splitext(filename)
+    path = private_export_storage().save(f"{stem}_{secrets.token_urlsafe(16)}{extension}", ContentFile(content))
+    url = reverse("download_statistics_pdf", args=[path])
+    if user_id:
+        notify(
+            user_id,
+            title="Export des statistiques prêt",
+            message="Le rapport PDF des statistiques est disponible.",
+            type="system",
+            extra_data={"url": url},
+        )
+    return {"path": path, "url": url}
+
+
+@register_job("reassign_after_specialty_change")
+def reassign_after_specialty_change_job(technician_id, old_specialty):
+    """Réaffecte les demandes en cours d'un technicien qui a changé de spécialité."""
+    from django.db import transaction
+
+    from .dispatch import DispatchQuery, dispatcher
+    from .models import RepairRequest, Technician
+    from .notifications import build_notification, dispatch_notifications
+
+    technician = Technician.objects.filter(pk=technician_id).only("id", "specialty").first()
+    if technician is None or technician.specialty == old_specialty:
+        # Supprimé entre-temps, ou revenu à son ancienne spécialité
+        return {"reassigned": 0, "unassigned": 0}
+
+    # Demandes en cours assignées à ce technicien pour l'ancienne spécialité
+    requests = RepairRequest.objects.filter(
+        technician_id=technician_id,
+        status__in=RepairRequest.ACTIVE_STATUSES,
+        specialty_needed=old_specialty,
+    ).select_related("client")
+    notifications = []
+    reassigned = unassigned = 0
+    with transaction.atomic():
+        for req in requests:
+            # Chercher un autre technicien libre de la même spécialité
+            new_tech = dispatcher.best_technician(DispatchQuery.from_request(
+                req, exclude_ids=[technician_id], min_rating=dispatcher.reassign_min_rating,
+            ))
+            if new_tech is not None:
+                req.assign_to_technician(new_tech)
+                reassigned += 1
+                # Notifier le nouveau technicien et le client
+                notifications.append(build_notification(
+                    new_tech.user_id,
+                    title="Nouvelle demande réassignée",
+                    message=f"Vous avez été réassigné à la demande #{req.id} (suite à un changement de spécialité d'un autre technicien)",
+                    type="new_request_technician",
+                    request=req,
+                ))
+                notifications.append(build_notification(
+                    req.client.user_id,
+                    title="Nouveau technicien en route",
+                    message=f"Votre demande #{req.id} a été réassignée à un nouveau technicien.",
+                    type="technician_assigned",
+                    request=req,
+                ))
+            else:
+                # Aucun technicien dispo, désassigner la demande
+                req.technician = None
+                req.status = RepairRequest.Status.PENDING
+                req.save()
+                unassigned += 1
+                notifications.append(build_notification(
+                    req.client.user_id,
+                    title="Demande en attente",
+                    message=f"Votre demande #{req.id} est de nouveau en attente, aucun technicien n'est disponible pour le moment.",
+                    type="no_technician_available",
+                    request=req,
+                ))
+    dispatch_notifications(notifications)
+    return {"reassigned": reassigned, "unassigned": unassigned}
+
+
+def enqueue_email(subject, message, recipient_list, from_email=None, html_message=None,
+                  priority=None):
+    """Email envoyé en tâche de fond (``send_mail`` n'est plus appelé dans la requête)."""
+    return enqueue("send_email", {
+        "subject": subject,
+        "message": message,
+        "recipient_list": list(recipient_list),
+        "from_email": from_email,
+        "html_message": html_message,
+    }, priority=priority)
@@ -0,0 +1,185 @@
+"""
+Écriture différée et regroupée des positions GPS en temps réel.
+
+Les consumers WebSocket de suivi diffusent chaque position immédiatement mais
+ne l'écrivent plus en base : seule la dernière position connue de chaque
+technicien (ou client) est gardée en mémoire, puis écrite par lots via
+``bulk_update``/``bulk_create`` :
+- toutes les ``LOCATION_FLUSH_INTERVAL_SECONDS`` secondes ;
+- plus tôt si un déplacement dépasse ``LOCATION_FLUSH_DISTANCE_METERS`` depuis
+  la dernière position écrite ;
+- à la déconnexion du consumer (sa seule position) et à l'arrêt du processus.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .utils import calculate_distance
+
+logger = logging.getLogger(__name__)
+
+
+class LocationWriteBuffer:
+    """Dernières positions en attente d'écriture, indexées par identifiant."""
+
+    def __init__(self, name, writer, flush_interval=10, distance_threshold_m=200):
+        self.name = name
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self.distance_threshold_km = distance_threshold_m / 1000
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._persisted = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.received_count = 0
+        self.written_count = 0
+
+    def record(self, owner_id, latitude, longitude):
+        """Mémorise une position ; retourne True si elle déclenche une écriture anticipée."""
+        position = (float(latitude), float(longitude), timezone.now())
+        with self._lock:
+            self._pending[owner_id] = position
+            self.received_count += 1
+            last = self._persisted.get(owner_id)
+            urgent = last is None or calculate_distance(
+                last[0], last[1], position[0], position[1]
+            ) >= self.distance_threshold_km
+        if self.flush_interval:
+            self._ensure_started()
+            if urgent:
+                self._wakeup.set()
+        return urgent
+
+    def flush(self, owner_id=None):
+        """
+        Écrit les positions en attente (seulement celle de ``owner_id`` s'il est donné) ;
+        retourne le nombre de lignes concernées.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if owner_id is None:
+                    batch, self._pending = self._pending, {}
+                elif owner_id in self._pending:
+                    batch = {owner_id: self._pending.pop(owner_id)}
+                else:
+                    batch = {}
+            if not batch:
+                return 0
+            try:
+                self.writer(batch)
+            except Exception:
+                logger.exception("Échec de l'écriture des positions (%s)", self.name)
+                with self._lock:
+                    # Les positions plus récentes reçues entre-temps restent prioritaires
+                    for owner_id, position in batch.items():
+                        self._pending.setdefault(owner_id, position)
+                return 0
+            with self._lock:
+                for owner_id, (latitude, longitude, _) in batch.items():
+                    self._persisted[owner_id] = (latitude, longitude)
+                self.written_count += len(batch)
+            return len(batch)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f"location-buffer-{self.name}", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+def write_technician_positions(batch):
+    """Écrit les positions des techniciens : Technician et TechnicianLocation, par lots."""
+    from .models import Technician, TechnicianLocation
+
+    existing_ids = set(Technician.objects.filter(id__in=batch.keys()).values_list("id", flat=True))
+    now = timezone.now()
+    technicians = [
+        Technician(
+            id=technician_id,
+            current_latitude=latitude,
+            current_longitude=longitude,
+            last_position_update=received_at,
+            updated_at=now,
+        )
+        for technician_id, (latitude, longitude, received_at) in batch.items()
+        if technician_id in existing_ids
+    ]
+    Technician.objects.bulk_update(
+        technicians, ["current_latitude", "current_longitude", "last_position_update", "updated_at"]
+    )
+    _write_location_rows(TechnicianLocation, "technician_id", batch, existing_ids, now)
+
+
+def write_client_positions(batch):
+    """Écrit les positions des clients dans ClientLocation, par lots."""
+    from .models import Client, ClientLocation
+
+    existing_ids = set(Client.objects.filter(id__in=batch.keys()).values_list("id", flat=True))
+    _write_location_rows(ClientLocation, "client_id", batch, existing_ids, timezone.now())
+
+
+def _write_location_rows(model, owner_field, batch, existing_ids, now):
+    location_ids = dict(
+        model.objects.filter(**{f"{owner_field}__in": existing_ids}).values_list(owner_field, "id")
+    )
+    to_update, to_create = [], []
+    for owner_id, (latitude, longitude, _) in batch.items():
+        if owner_id not in existing_ids:
+            continue
+        if owner_id in location_ids:
+            to_update.append(model(id=location_ids[owner_id], latitude=latitude, longitude=longitude, updated_at=now))
+        else:
+            to_create.append(model(**{owner_field: owner_id}, latitude=latitude, longitude=longitude))
+    if to_update:
+        model.objects.bulk_update(to_update, ["latitude", "longitude", "updated_at"])
+    if to_create:
+        model.objects.bulk_create(to_create, ignore_conflicts=True)
+
+
+_geo_settings = getattr(settings, "GEOLOCATION_SETTINGS", {})
+
+technician_location_buffer = LocationWriteBuffer(
+    "technicians",
+    write_technician_positions,
+    flush_interval=_geo_settings.get("LOCATION_FLUSH_INTERVAL_SECONDS", 10),
+    distance_threshold_m=_geo_settings.get("LOCATION_FLUSH_DISTANCE_METERS", 200),
+)
+client_location_buffer = LocationWriteBuffer(
+    "clients",
+    write_client_positions,
+    flush_interval=_geo_settings.get("LOCATION_FLUSH_INTERVAL_SECONDS", 10),
+    distance_threshold_m=_geo_settings.get("LOCATION_FLUSH_DISTANCE_METERS", 200),
+)
+
+
+@atexit.register
+def flush_location_buffers():
+    """Dernière écriture à l'arrêt du processus pour ne perdre aucune position."""
+    for buffer in (technician_location_buffer, client_location_buffer):
+        try:
+            buffer.flush()
+        except Exception:
+            logger.exception("Échec de l'écriture finale des positions (%s)", buffer.name)
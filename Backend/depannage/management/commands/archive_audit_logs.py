@@ -0,0 +1,97 @@
+import gzip
+import json
+import os
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from users.models import AuditLog
+from users.rollups import bucket_start, prune_hourly_rollups, rebuild_rollups
+
+ARCHIVE_FIELDS = (
+    "id", "timestamp", "user_id", "ip_address", "user_agent", "event_type", "status",
+    "geo_country", "geo_city", "location", "risk_score", "metadata",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive le journal d'audit brut plus ancien que la rétention (JSON Lines gzip, un fichier "
+        "par jour et par lot) puis le supprime ; purge les agrégats horaires expirés."
+    )
+
+    def add_arguments(self, parser):
+        audit_settings = getattr(settings, "AUDIT_SETTINGS", {})
+        parser.add_argument("--days", type=int, default=audit_settings.get("RETENTION_DAYS", 90),
+                            help="Âge minimal (jours) des événements archivés.")
+        parser.add_argument("--archive-dir", default=audit_settings.get("ARCHIVE_DIR"),
+                            help="Répertoire des archives.")
+        parser.add_argument("--batch-size", type=int, default=audit_settings.get("ARCHIVE_BATCH_SIZE", 5000))
+        parser.add_argument("--dry-run", action="store_true", help="Compte les événements sans rien écrire.")
+        parser.add_argument("--rebuild-rollups", action="store_true",
+                            help="Recalcule d'abord les agrégats depuis le journal brut encore en base.")
+
+    def handle(self, *args, **options):
+        audit_settings = getattr(settings, "AUDIT_SETTINGS", {})
+        now = timezone.now()
+        # Coupure au début d'un jour UTC : un fichier d'archive ne couvre jamais un jour incomplet
+        cutoff = bucket_start(now - timedelta(days=options["days"]), "day")
+        expired = AuditLog.objects.filter(timestamp__lt=cutoff)
+
+        if options["dry_run"]:
+            self.stdout.write(f"{expired.count()} événements antérieurs au {cutoff:%Y-%m-%d} à archiver.")
+            return
+
+        if options["rebuild_rollups"]:
+            # Seulement depuis le plus ancien événement encore en base : les agrégats des jours
+            # déjà archivés n'ont plus de journal brut et seraient perdus
+            oldest = AuditLog.objects.aggregate(oldest=Min("timestamp"))["oldest"]
+            if oldest is None:
+                self.stdout.write("Journal brut vide : agrégats conservés tels quels.")
+            else:
+                rows = rebuild_rollups(since=oldest)
+                self.stdout.write(f"{rows} agrégats recalculés depuis le {oldest:%Y-%m-%d}.")
+
+        archive_dir = options["archive_dir"]
+        archived = files = 0
+        while True:
+            batch = list(
+                expired.order_by("timestamp", "id").values(*ARCHIVE_FIELDS)[:options["batch_size"]]
+            )
+            if not batch:
+                break
+            for day, rows in groupby(batch, key=lambda row: bucket_start(row["timestamp"], "day")):
+                rows = list(rows)
+                self._write_archive(archive_dir, day, rows)
+                files += 1
+            # Les agrégats sont déjà à jour : seules les lignes brutes disparaissent
+            with transaction.atomic():
+                AuditLog.objects.filter(id__in=[row["id"] for row in batch]).delete()
+            archived += len(batch)
+
+        hourly_days = audit_settings.get("HOURLY_ROLLUP_RETENTION_DAYS", 30)
+        pruned = prune_hourly_rollups(bucket_start(now - timedelta(days=hourly_days), "day"))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{archived} événements archivés dans {files} fichiers ({archive_dir}), "
+            f"{pruned} agrégats horaires purgés."
+        ))
+
+    def _write_archive(self, archive_dir, day, rows):
+        directory = os.path.join(archive_dir, f"{day:%Y}", f"{day:%m}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"audit_log_{day:%Y-%m-%d}_{rows[0]['id']}-{rows[-1]['id']}.jsonl.gz")
+        # Écriture dans un fichier temporaire puis renommage : pas d'archive tronquée
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as archive:
+            for row in rows:
+                archive.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False))
+                archive.write("\n")
+        os.replace(tmp_path, path)
+        return path
@@ -0,0 +1,92 @@
+import random
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from depannage.dispatch import FEATURE_FIELDS, Dispatcher, DispatchQuery, TechnicianFeatureTable
+from depannage.utils import haversine_within_radius
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare la sélection de techniciens historique (filtres Python, tri par distance) et le "
+        "moteur d'affectation (table par spécialité, filtre vectorisé, score pondéré), sans base de données."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--technicians", type=int, default=10000, help="Nombre de techniciens simulés")
+        parser.add_argument("--requests", type=int, default=200, help="Nombre de demandes simulées")
+        parser.add_argument("--k", type=int, default=10, help="Nombre de candidats retenus")
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        origin_lat, origin_lon = 12.6392, -8.0029  # Bamako
+        size, k = options["technicians"], options["k"]
+        levels = ["junior", "intermediate", "senior", "expert"]
+
+        technicians = []
+        for tech_id in range(1, size + 1):
+            rating_count = rng.randint(0, 40)
+            technicians.append(SimpleNamespace(
+                id=tech_id,
+                user_id=tech_id,
+                current_latitude=origin_lat + rng.uniform(-0.5, 0.5),
+                current_longitude=origin_lon + rng.uniform(-0.5, 0.5),
+                service_radius_km=rng.choice([5, 10, 20, 30]),
+                rating_sum=rating_count * rng.randint(2, 5),
+                rating_count=rating_count,
+                experience_level=rng.choice(levels),
+                response_time_minutes=rng.randint(5, 180),
+                is_available_urgent=rng.random() < 0.3,
+                has_active_subscription=True,
+            ))
+        for tech in technicians:
+            tech.average_rating = round(tech.rating_sum / tech.rating_count, 1) if tech.rating_count else 0.0
+        busy_ids = {tech.id for tech in technicians if rng.random() < 0.2}
+        points = [
+            (origin_lat + rng.uniform(-0.4, 0.4), origin_lon + rng.uniform(-0.4, 0.4))
+            for _ in range(options["requests"])
+        ]
+
+        def legacy():
+            for lat, lng in points:
+                candidates = [t for t in technicians if t.has_active_subscription]
+                candidates = [t for t in candidates if t.id not in busy_ids]
+                candidates = [t for t in candidates if t.average_rating >= 3.5]
+                distances, in_range = haversine_within_radius(
+                    lat, lng,
+                    [t.current_latitude for t in candidates],
+                    [t.current_longitude for t in candidates],
+                    [t.service_radius_km for t in candidates],
+                )
+                ranked = sorted(
+                    ((t, float(d)) for t, d, ok in zip(candidates, distances, in_range) if ok),
+                    key=lambda item: item[1],
+                )
+                ranked[:k]
+
+        table = TechnicianFeatureTable()
+        table.load({"plumber": [tuple(getattr(t, field) for field in FEATURE_FIELDS) for t in technicians]})
+        engine = Dispatcher(
+            table=table, max_radius_km=30,
+            # Équivalent de la requête « occupés » sur une tranche de candidats
+            busy_lookup=lambda ids, max_active_jobs: busy_ids.intersection(ids),
+        )
+
+        def dispatch():
+            for lat, lng in points:
+                engine.top_k(DispatchQuery(lat, lng, "plumber", min_rating=3.5), k)
+
+        legacy_ms = self._timed(legacy) / len(points)
+        dispatch_ms = self._timed(dispatch) / len(points)
+        self.stdout.write(f"{size} techniciens, {len(points)} demandes, top {k}")
+        self.stdout.write(f"{'historique (ms/demande)':>28} {legacy_ms:>10.3f}")
+        self.stdout.write(f"{'moteur (ms/demande)':>28} {dispatch_ms:>10.3f}")
+        self.stdout.write(self.style.SUCCESS(f"Gain : {legacy_ms / dispatch_ms:.1f}x"))
+
+    @staticmethod
+    def _timed(func):
+        start = time.perf_counter()
+        func()
+        return (time.perf_counter() - start) * 1000
@@ -0,0 +1,57 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from depannage.utils import calculate_distance, haversine_within_radius
+
+
+class Command(BaseCommand):
+    help = "Compare le calcul de distance scalaire (boucle Python) et le calcul vectorisé NumPy."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", nargs="+", type=int, default=[1000, 10000, 100000],
+            help="Nombres de techniciens simulés",
+        )
+        parser.add_argument("--repeat", type=int, default=5, help="Nombre de répétitions par mesure")
+        parser.add_argument("--radius", type=float, default=10.0, help="Rayon de filtrage (km)")
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        origin_lat, origin_lon = 12.6392, -8.0029  # Bamako
+        radius = options["radius"]
+
+        self.stdout.write(f"{'techniciens':>12} {'scalaire (ms)':>15} {'vectorisé (ms)':>15} {'gain':>8}")
+        for size in options["sizes"]:
+            lats = [origin_lat + rng.uniform(-0.5, 0.5) for _ in range(size)]
+            lons = [origin_lon + rng.uniform(-0.5, 0.5) for _ in range(size)]
+
+            def scalar():
+                return [
+                    d for d in (
+                        calculate_distance(origin_lat, origin_lon, lat, lon)
+                        for lat, lon in zip(lats, lons)
+                    ) if d <= radius
+                ]
+
+            def vectorized():
+                distances, mask = haversine_within_radius(origin_lat, origin_lon, lats, lons, radius)
+                return distances[mask]
+
+            scalar_ms = self._best_of(scalar, options["repeat"])
+            vector_ms = self._best_of(vectorized, options["repeat"])
+            self.stdout.write(
+                f"{size:>12} {scalar_ms:>15.2f} {vector_ms:>15.2f} {scalar_ms / vector_ms:>7.1f}x"
+            )
+
+        self.stdout.write(self.style.SUCCESS("Benchmark terminé."))
+
+    @staticmethod
+    def _best_of(func, repeat):
+        best = float("inf")
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best * 1000
@@ -0,0 +1,82 @@
+import ipaddress
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from depannage.geoip import GeoIPLookup, default_db_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare le coût d'une géolocalisation IP : lecteur ouvert à chaque appel (ancien code), "
+        "lecteur MMAP partagé, puis lecteur partagé avec cache par IP."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--db", default=None, help="Chemin de la base GeoLite2-City.mmdb")
+        parser.add_argument("--lookups", type=int, default=5000, help="Nombre de recherches par mesure")
+        parser.add_argument(
+            "--distinct", type=int, default=500,
+            help="Adresses distinctes (trafic réel : peu d'IP, beaucoup de requêtes)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            import geoip2.database
+        except ImportError:
+            raise CommandError("Le paquet geoip2 n'est pas installé.")
+
+        db_path = options["db"] or default_db_path()
+        try:
+            geoip2.database.Reader(db_path).close()
+        except Exception as exc:
+            raise CommandError(f"Base GeoIP illisible ({db_path}) : {exc}")
+
+        rng = random.Random(0)
+        pool = [str(ipaddress.IPv4Address(rng.getrandbits(32))) for _ in range(max(options["distinct"], 1))]
+        ips = [rng.choice(pool) for _ in range(options["lookups"])]
+
+        def reader_per_call():
+            for ip in ips:
+                reader = geoip2.database.Reader(db_path)
+                try:
+                    reader.city(ip)
+                except Exception:
+                    pass
+                reader.close()
+
+        shared = GeoIPLookup(db_path, cache_size=0, ttl=0)
+
+        def shared_reader():
+            for ip in ips:
+                shared._resolve(ip)
+
+        cached = GeoIPLookup(db_path, cache_size=len(pool), ttl=3600)
+
+        def shared_cached():
+            for ip in ips:
+                cached.lookup(ip)
+
+        results = [
+            ("lecteur par appel", self._timed(reader_per_call)),
+            ("lecteur MMAP partagé", self._timed(shared_reader)),
+            ("partagé + cache", self._timed(shared_cached)),
+        ]
+        baseline = results[0][1]
+        self.stdout.write(f"{len(ips)} recherches, {len(pool)} adresses distinctes ({db_path})")
+        self.stdout.write(f"{'mode':>22} {'total (ms)':>12} {'µs/recherche':>14} {'gain':>8}")
+        for label, elapsed in results:
+            self.stdout.write(
+                f"{label:>22} {elapsed * 1000:>12.1f} {elapsed / len(ips) * 1e6:>14.1f} {baseline / elapsed:>7.1f}x"
+            )
+        self.stdout.write(f"Cache : {cached.hits} hits, {cached.misses} misses")
+        shared.close()
+        cached.close()
+        self.stdout.write(self.style.SUCCESS("Benchmark terminé."))
+
+    @staticmethod
+    def _timed(func):
+        start = time.perf_counter()
+        func()
+        return max(time.perf_counter() - start, 1e-9)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from depannage.models import reconcile_technician_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les agrégats dénormalisés des techniciens (notes, interventions, occupation) "
+        "et corrige les écarts. Également exécuté périodiquement par run_dispatch_scheduler "
+        "(DISPATCH_SETTINGS['RECONCILE_SECONDS'])."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Nombre de techniciens traités par lot")
+
+    def handle(self, *args, **options):
+        checked, corrected = reconcile_technician_stats(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"{checked} technicien(s) vérifié(s), {corrected} corrigé(s)."
+        ))
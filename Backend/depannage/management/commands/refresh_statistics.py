@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from depannage.statistics import refresh_statistics_snapshot
+
+
+class Command(BaseCommand):
+    help = "Recalcule l'instantané des statistiques du tableau de bord (à planifier périodiquement)."
+
+    def handle(self, *args, **options):
+        snapshot = refresh_statistics_snapshot()
+        self.stdout.write(self.style.SUCCESS(
+            f"Instantané '{snapshot.key}' recalculé en {snapshot.computation_ms} ms."
+        ))
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import signal
+import time
+
+from asgiref.sync import sync_to_async
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from depannage.dispatch import dispatcher
+from depannage.models import reconcile_technician_stats
+from depannage.sla import SLAScheduler, sla_settings
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Suit les délais de prise en charge des demandes en attente : nouvelles offres en anneaux de "
+        "rayon croissant et alertes aux administrateurs avant l'échéance ; vérifie aussi périodiquement "
+        "les compteurs des techniciens. Un seul processus à la fois."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--resync-seconds", type=float, default=sla_settings().get("RESYNC_SECONDS", 900),
+            help="Intervalle (s) de relecture des demandes en attente",
+        )
+        parser.add_argument(
+            "--reconcile-seconds", type=float,
+            default=getattr(settings, "DISPATCH_SETTINGS", {}).get("RECONCILE_SECONDS", 3600),
+            help="Intervalle (s) de vérification des compteurs des techniciens (0 : jamais)",
+        )
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Charge les demandes en attente, exécute les événements échus puis s'arrête",
+        )
+
+    def handle(self, *args, **options):
+        scheduler = SLAScheduler()
+        if options["once"]:
+            scheduler.load_pending()
+            self._report(scheduler, scheduler.run_due())
+            return
+        asyncio.run(self._serve(scheduler, options["resync_seconds"], options["reconcile_seconds"]))
+
+    async def _serve(self, scheduler, resync_seconds, reconcile_seconds):
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stopping.set)
+
+        channel = sla_settings().get("CHANNEL", "dispatch-sla")
+        channel_layer = get_channel_layer()
+        if channel_layer is None or isinstance(channel_layer, InMemoryChannelLayer):
+            # Les autres processus n'y publient pas : seule la relecture périodique fait foi
+            self.stderr.write(
+                "Channel layer en mémoire : demandes suivies par relecture toutes les "
+                f"{resync_seconds:.0f} s uniquement (configurer REDIS_URL)."
+            )
+            channel_layer = None
+
+        # Accès base dans un seul thread, jamais en parallèle des messages
+        run = sync_to_async(self._with_connection, thread_sensitive=True)
+        stop_waiter = asyncio.ensure_future(stopping.wait())
+        receiver = None
+        next_resync = 0
+        next_reconcile = time.monotonic() + reconcile_seconds if reconcile_seconds else float("inf")
+        while not stopping.is_set():
+            if time.monotonic() >= next_resync:
+                await run(scheduler.load_pending)
+                next_resync = time.monotonic() + resync_seconds
+            if time.monotonic() >= next_reconcile:
+                # Filet de sécurité : occupation et notes lues par le moteur d'affectation
+                checked, corrected = await run(reconcile_technician_stats)
+                if corrected:
+                    dispatcher.table.invalidate()
+                    self.stdout.write(f"{corrected} technicien(s) sur {checked} : compteurs corrigés.")
+                next_reconcile = time.monotonic() + reconcile_seconds
+            if scheduler.seconds_until_next_due(maximum=1) == 0:
+                self._report(scheduler, await run(scheduler.run_due))
+
+            if channel_layer is not None and receiver is None:
+                receiver = asyncio.ensure_future(channel_layer.receive(channel))
+            timeout = scheduler.seconds_until_next_due(
+                maximum=max(0.0, min(next_resync, next_reconcile) - time.monotonic())
+            )
+            done, _ = await asyncio.wait(
+                [task for task in (stop_waiter, receiver) if task is not None],
+                timeout=timeout, return_when=asyncio.FIRST_COMPLETED,
+            )
+            if receiver is not None and receiver in done:
+                try:
+                    scheduler.handle_message(receiver.result())
+                except Exception:
+                    logger.exception("Message du planificateur SLA ignoré")
+                    await asyncio.sleep(1)
+                receiver = None
+
+        for task in (stop_waiter, receiver):
+            if task is not None:
+                task.cancel()
+        self.stdout.write(self.style.SUCCESS(f"Arrêt : {len(scheduler)} demande(s) suivie(s)."))
+
+    @staticmethod
+    def _with_connection(func):
+        close_old_connections()
+        return func()
+
+    def _report(self, scheduler, counts):
+        if any(counts.values()):
+            self.stdout.write(
+                f"{counts['offer']} offre(s), {counts['escalate']} alerte(s), "
+                f"{counts['breach']} dépassement(s) ; {len(scheduler)} demande(s) suivie(s)."
+            )
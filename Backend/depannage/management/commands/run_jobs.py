@@ -0,0 +1,60 @@
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from depannage.jobs import default_worker_id, requeue_stale_jobs, run_pending
+
+
+class Command(BaseCommand):
+    help = "Exécute les tâches de fond en file (emails, PDF...). Lancer un ou plusieurs processus en continu."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=1, help="Threads d'exécution dans ce processus")
+        parser.add_argument("--once", action="store_true", help="Vide la file puis s'arrête")
+        parser.add_argument(
+            "--poll-interval", type=float,
+            default=getattr(settings, "JOB_SETTINGS", {}).get("POLL_INTERVAL_SECONDS", 2),
+            help="Attente (s) quand la file est vide",
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = threading.Event()
+        if not options["once"]:
+            signal.signal(signal.SIGTERM, lambda *_: self.stopping.set())
+
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"{requeued} tâche(s) bloquée(s) remise(s) en file.")
+
+        workers = max(1, options["workers"])
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="run_jobs") as pool:
+            results = [
+                pool.submit(self._work, options["once"], options["poll_interval"])
+                for _ in range(workers)
+            ]
+            try:
+                processed = sum(result.result() for result in results)
+            except KeyboardInterrupt:
+                self.stopping.set()
+                processed = sum(result.result() for result in results)
+        self.stdout.write(self.style.SUCCESS(f"{processed} tâche(s) exécutée(s)."))
+
+    def _work(self, once, poll_interval):
+        worker_id = default_worker_id()
+        processed = 0
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                done = run_pending(limit=100, worker_id=worker_id)
+                processed += done
+                if done == 0:
+                    if once:
+                        break
+                    self.stopping.wait(poll_interval)
+        finally:
+            connection.close()
+        return processed
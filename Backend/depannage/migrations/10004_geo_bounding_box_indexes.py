@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('depannage', '10003_chatconversation_chatmessage_chatmessageattachment'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='technician',
+            index=models.Index(fields=['current_latitude', 'current_longitude'], name='depannage_t_current_410ade_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='repairrequest',
+            index=models.Index(fields=['latitude', 'longitude'], name='depannage_r_latitud_a98f9e_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_technician_stats(apps, schema_editor):
+    Technician = apps.get_model('depannage', 'Technician')
+    Review = apps.get_model('depannage', 'Review')
+    RepairRequest = apps.get_model('depannage', 'RepairRequest')
+
+    ratings = {
+        row['technician']: row
+        for row in Review.objects.values('technician').annotate(n=Count('id'), total=Sum('rating'))
+    }
+    completed = dict(
+        RepairRequest.objects.filter(status='completed', technician__isnull=False)
+        .values('technician').annotate(n=Count('id')).values_list('technician', 'n')
+    )
+    handled = dict(
+        RepairRequest.objects.exclude(status='pending').filter(technician__isnull=False)
+        .values('technician').annotate(n=Count('id')).values_list('technician', 'n')
+    )
+    technicians = list(Technician.objects.all())
+    for technician in technicians:
+        rating = ratings.get(technician.pk, {})
+        technician.rating_count = rating.get('n', 0)
+        technician.rating_sum = rating.get('total') or 0
+        technician.jobs_completed_count = completed.get(technician.pk, 0)
+        technician.jobs_handled_count = handled.get(technician.pk, 0)
+    Technician.objects.bulk_update(
+        technicians,
+        ['rating_count', 'rating_sum', 'jobs_completed_count', 'jobs_handled_count'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('depannage', '10004_geo_bounding_box_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='technician',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name="Nombre d'avis"),
+        ),
+        migrations.AddField(
+            model_name='technician',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Somme des notes'),
+        ),
+        migrations.AddField(
+            model_name='technician',
+            name='jobs_completed_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Interventions terminées'),
+        ),
+        migrations.AddField(
+            model_name='technician',
+            name='jobs_handled_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Interventions prises en charge'),
+        ),
+        migrations.RunPython(populate_technician_stats, migrations.RunPython.noop),
+    ]
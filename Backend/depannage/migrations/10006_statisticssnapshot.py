@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('depannage', '10005_technician_denormalized_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatisticsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50, unique=True, verbose_name='Clé')),
+                ('data', models.JSONField(default=dict, verbose_name='Données')),
+                ('computed_at', models.DateTimeField(verbose_name='Calculé le')),
+                ('computation_ms', models.PositiveIntegerField(default=0, verbose_name='Durée du calcul (ms)')),
+            ],
+            options={
+                'verbose_name': 'Instantané de statistiques',
+                'verbose_name_plural': 'Instantanés de statistiques',
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('depannage', '10007_chatmessage_inbox_indexes'),
+    ]
+
+    operations = [
+        # (conversation, created_at, id) remplace (conversation, created_at)
+        migrations.RemoveIndex(
+            model_name='chatmessage',
+            name='depannage_c_convers_f980d3_idx',
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['conversation', 'created_at', 'id'], name='depannage_c_convers_6e47f8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'created_at', 'id'], name='depannage_n_recipie_4a1b0a_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_active_jobs_count(apps, schema_editor):
+    Technician = apps.get_model('depannage', 'Technician')
+    RepairRequest = apps.get_model('depannage', 'RepairRequest')
+
+    active = (
+        RepairRequest.objects.filter(status__in=['assigned', 'in_progress'], technician__isnull=False)
+        .values('technician').annotate(n=Count('id')).values_list('technician', 'n')
+    )
+    for technician_id, count in active:
+        Technician.objects.filter(pk=technician_id).update(active_jobs_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('depannage', '10009_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='technician',
+            name='active_jobs_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Interventions en cours'),
+        ),
+        migrations.RunPython(populate_active_jobs_count, migrations.RunPython.noop),
+    ]
@@ -3,15 +3,16 @@ from django.conf import settings
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
-from django.db.models import Avg, Q
+from django.db.models import Max, Q
 from decimal import Decimal
 import uuid
 from django.contrib.postgres.fields import ArrayField
 from django.db.models import JSONField
-from django.db.models.signals import post_delete, post_save
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
+from .query_planner import depends_on
 
 
 # ============================================================================
@@ -29,6 +30,141 @@ class BaseTimeStampModel(models.Model):
         abstract = True
 
 
+class DirtyFieldsMixin:
+    """
+    Suivi des champs modifiés depuis le chargement ou le dernier enregistrement.
+
+    Les valeurs chargées sont mémorisées à l'initialisation de l'instance (sans
+    requête : les champs différés ne sont pas suivis tant qu'ils ne sont pas
+    affectés). Pendant ``save``, ``saved_changes`` donne aux récepteurs
+    ``post_save`` les anciennes valeurs des champs réellement modifiés ;
+    ``save_dirty`` n'écrit que ces champs (``update_fields``).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.saved_changes = {}
+        self._snapshot_fields()
+
+    def _snapshot_fields(self, names=None):
+        values = self.__dict__
+        snapshot = self.__dict__.setdefault("_loaded_values", {})
+        for field in self._meta.concrete_fields:
+            if (names is None or field.name in names or field.attname in names) and field.attname in values:
+                snapshot[field.attname] = values[field.attname]
+
+    def get_dirty_fields(self):
+        """``{nom du champ: valeur chargée}`` des champs modifiés (None si la valeur chargée est inconnue)."""
+        snapshot = self._loaded_values
+        values = self.__dict__
+        dirty = {}
+        for field in self._meta.concrete_fields:
+            attname = field.attname
+            if attname not in values:
+                continue
+            if attname not in snapshot:
+                # Champ différé puis affecté : considéré comme modifié
+                dirty[field.name] = None
+            elif values[attname] != snapshot[attname]:
+                dirty[field.name] = snapshot[attname]
+        return dirty
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        changes = self.get_dirty_fields()
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            changes = {name: value for name, value in changes.items() if name in update_fields}
+        self.saved_changes = changes
+        super().save(*args, **kwargs)
+        self._snapshot_fields(update_fields)
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._snapshot_fields(None if fields is None else set(fields))
+
+    def save_dirty(self):
+        """Enregistre uniquement les champs modifiés ; retourne False s'il n'y avait rien à écrire."""
+        if self._state.adding or self.pk is None:
+            self.save()
+            return True
+        dirty = list(self.get_dirty_fields())
+        if not dirty:
+            return False
+        # Les champs auto_now (updated_at) ne sont remplis que s'ils font partie de update_fields
+        dirty += [
+            field.name for field in self._meta.concrete_fields
+            if getattr(field, "auto_now", False) and field.name not in dirty
+        ]
+        self.save(update_fields=dirty)
+        return True
+
+
+class GeoQuerySet(models.QuerySet):
+    """QuerySet avec préfiltre géographique exécuté en SQL."""
+
+    latitude_field = "latitude"
+    longitude_field = "longitude"
+
+    def within_bounding_box(self, latitude, longitude, radius_km):
+        """
+        Restreint aux lignes situées dans la boîte englobant le cercle donné.
+
+        Le filtre s'appuie sur l'index (latitude, longitude) ; la distance exacte
+        reste à calculer sur les lignes retenues.
+        """
+        from .utils import bounding_box
+
+        min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+        return self.filter(**{
+            f"{self.latitude_field}__range": (min_lat, max_lat),
+            f"{self.longitude_field}__range": (min_lon, max_lon),
+        })
+
+
+class TechnicianQuerySet(GeoQuerySet):
+    latitude_field = "current_latitude"
+    longitude_field = "current_longitude"
+
+    def with_computed_stats(self):
+        """
+        Annote les valeurs de référence des agrégats dénormalisés, recalculées
+        depuis Review et RepairRequest (préfixe ``computed_``).
+        """
+        from django.db.models import Count, OuterRef, Subquery, Sum
+        from django.db.models.functions import Coalesce
+
+        reviews = Review.objects.filter(technician=OuterRef("pk")).order_by().values("technician")
+        requests = RepairRequest.objects.filter(technician=OuterRef("pk")).order_by().values("technician")
+        return self.annotate(
+            computed_rating_count=Coalesce(Subquery(reviews.annotate(n=Count("id")).values("n")), 0),
+            computed_rating_sum=Coalesce(Subquery(reviews.annotate(n=Sum("rating")).values("n")), 0),
+            computed_jobs_completed_count=Coalesce(Subquery(
+                requests.filter(status=RepairRequest.Status.COMPLETED).annotate(n=Count("id")).values("n")
+            ), 0),
+            computed_jobs_handled_count=Coalesce(Subquery(
+                requests.exclude(status=RepairRequest.Status.PENDING).annotate(n=Count("id")).values("n")
+            ), 0),
+            computed_active_jobs_count=Coalesce(Subquery(
+                requests.filter(status__in=RepairRequest.ACTIVE_STATUSES).annotate(n=Count("id")).values("n")
+            ), 0),
+        )
+
+    def within_service_radius_of(self, latitude, longitude):
+        """
+        Techniciens dont le rayon d'intervention peut couvrir le point donné.
+
+        La boîte englobante est calculée avec le plus grand ``service_radius_km``
+        des candidats ; le rayon propre à chacun se vérifie ensuite à la distance exacte.
+        """
+        if latitude is None or longitude is None:
+            return self.none()
+        max_radius = self.aggregate(max_radius=Max("service_radius_km"))["max_radius"]
+        if max_radius is None:
+            return self.none()
+        return self.within_bounding_box(latitude, longitude, max_radius)
+
+
 class Client(BaseTimeStampModel):
     """Profil client lié à un utilisateur."""
 
@@ -62,7 +198,7 @@ class Client(BaseTimeStampModel):
         ]
 
 
-class Technician(BaseTimeStampModel):
+class Technician(DirtyFieldsMixin, BaseTimeStampModel):
     """Profil technicien/dépanneur lié à un utilisateur."""
 
     class Specialty(models.TextChoices):
@@ -127,28 +263,53 @@ class Technician(BaseTimeStampModel):
     )
     bio = models.TextField("Présentation", blank=True)
 
+    # Agrégats dénormalisés, tenus à jour par les signaux Review/RepairRequest
+    # (voir reconcile_technician_stats pour corriger une éventuelle dérive)
+    rating_count = models.PositiveIntegerField("Nombre d'avis", default=0, editable=False)
+    rating_sum = models.PositiveIntegerField("Somme des notes", default=0, editable=False)
+    jobs_completed_count = models.PositiveIntegerField("Interventions terminées", default=0, editable=False)
+    jobs_handled_count = models.PositiveIntegerField("Interventions prises en charge", default=0, editable=False)
+    # Demandes assignées ou en cours : occupation lue par le moteur d'affectation
+    active_jobs_count = models.PositiveIntegerField("Interventions en cours", default=0, editable=False)
+
+    objects = TechnicianQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.user.get_full_name() or self.user.username} - {self.get_specialty_display()}"
 
+    def save(self, *args, **kwargs):
+        # Les compteurs ne sont écrits que par des UPDATE F() (apply_technician_stats_delta) :
+        # une instance chargée plus tôt (profil, admin) ne doit pas réécrire ses anciennes valeurs
+        if not self._state.adding and not kwargs.get("force_insert"):
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.attname not in deferred
+                ]
+            kwargs["update_fields"] = [name for name in update_fields if name not in TECHNICIAN_STATS_FIELDS]
+        super().save(*args, **kwargs)
+
     @property
+    @depends_on("rating_count", "rating_sum")
     def average_rating(self):
-        """Calcule la note moyenne du technicien."""
-        avg = self.repair_requests.filter(
-            status="completed", review__isnull=False
-        ).aggregate(avg_rating=Avg("review__rating"))["avg_rating"]
-        return round(avg, 1) if avg else 0.0
+        """Note moyenne du technicien (lue depuis les compteurs, sans requête)."""
+        if not self.rating_count:
+            return 0.0
+        return round(self.rating_sum / self.rating_count, 1)
 
     @property
+    @depends_on("jobs_completed_count")
     def total_jobs_completed(self):
-        return self.repair_requests.filter(status="completed").count()
+        return self.jobs_completed_count
 
     @property
+    @depends_on("jobs_completed_count", "jobs_handled_count")
     def success_rate(self):
-        total = self.repair_requests.exclude(status="pending").count()
-        if total == 0:
+        if not self.jobs_handled_count:
             return 0
-        completed = self.repair_requests.filter(status="completed").count()
-        return round((completed / total) * 100, 1)
+        return round((self.jobs_completed_count / self.jobs_handled_count) * 100, 1)
 
     @property
     def has_active_subscription(self):
@@ -188,6 +349,9 @@ class RepairRequest(BaseTimeStampModel):
         COMPLETED = "completed", "Terminée"
         CANCELLED = "cancelled", "Annulée"
 
+    # Statuts qui occupent le technicien (voir Technician.active_jobs_count)
+    ACTIVE_STATUSES = (Status.ASSIGNED, Status.IN_PROGRESS)
+
     class UrgencyLevel(models.TextChoices):
         NORMAL = "normal", "Normal (48h)"
         SAME_DAY = "same_day", "Dans la journée"
@@ -526,6 +690,36 @@ class Payment(BaseTimeStampModel):
 # SYSTÈME DE MESSAGERIE - NOUVELLE LOGIQUE
 # ============================================================================
 
+class ChatConversationQuerySet(models.QuerySet):
+    def with_inbox_data(self, user):
+        """
+        Annote le dernier message (préfixe ``last_message_``) et le nombre de
+        messages non lus par ``user`` (``unread_count``) en sous-requêtes
+        corrélées : la liste se charge en une seule requête, quel que soit le
+        nombre de conversations et de messages.
+        """
+        from django.db.models import Count, OuterRef, Subquery
+        from django.db.models.functions import Coalesce
+
+        latest = ChatMessage.objects.filter(conversation=OuterRef("pk")).order_by("-created_at", "-id")
+        unread = (
+            ChatMessage.objects.filter(conversation=OuterRef("pk"), is_read=False)
+            .exclude(sender=user)
+            .order_by()
+            .values("conversation")
+        )
+        return self.annotate(
+            last_message_pk=Subquery(latest.values("id")[:1]),
+            last_message_content=Subquery(latest.values("content")[:1]),
+            last_message_type=Subquery(latest.values("message_type")[:1]),
+            last_message_created_at=Subquery(latest.values("created_at")[:1]),
+            last_message_sender_id=Subquery(latest.values("sender_id")[:1]),
+            last_message_sender_first_name=Subquery(latest.values("sender__first_name")[:1]),
+            last_message_sender_last_name=Subquery(latest.values("sender__last_name")[:1]),
+            unread_count=Coalesce(Subquery(unread.annotate(n=Count("id")).values("n")), 0),
+        )
+
+
 class ChatConversation(BaseTimeStampModel):
     """Conversation directe entre un client et un technicien."""
     
@@ -549,6 +743,8 @@ class ChatConversation(BaseTimeStampModel):
     is_active = models.BooleanField("Active", default=True)
     last_message_at = models.DateTimeField("Dernier message", null=True, blank=True)
 
+    objects = ChatConversationQuerySet.as_manager()
+
     class Meta:
         unique_together = ('client', 'technician')
         verbose_name = "Conversation de chat"
@@ -621,14 +817,18 @@ class ChatMessage(BaseTimeStampModel):
         super().save(*args, **kwargs)
         
         if is_new:
-            # Mettre à jour le timestamp du dernier message
-            self.conversation.last_message_at = self.created_at
-            self.conversation.save(update_fields=['last_message_at'])
+            # Mettre à jour le timestamp du dernier message, sans recharger la conversation
+            ChatConversation.objects.filter(pk=self.conversation_id).update(last_message_at=self.created_at)
 
     class Meta:
         verbose_name = "Message de chat"
         verbose_name_plural = "Messages de chat"
         ordering = ["created_at"]
+        indexes = [
+            # Dernier message, non-lus et pagination par curseur (created_at, id)
+            models.Index(fields=["conversation", "created_at", "id"]),
+            models.Index(fields=["conversation", "is_read"]),
+        ]
 
 
 class ChatMessageAttachment(BaseTimeStampModel):
@@ -945,6 +1145,8 @@ class Notification(BaseTimeStampModel):
         ordering = ["-created_at"]
         indexes = [
             models.Index(fields=["recipient", "is_read", "-created_at"]),
+            # Pagination par curseur (created_at, id)
+            models.Index(fields=["recipient", "created_at", "id"]),
         ]
 
 
@@ -1186,12 +1388,72 @@ class PlatformConfiguration(models.Model):
         return f"Configuration Plateforme ({self.platform_name})"
 
 
+class StatisticsSnapshot(models.Model):
+    """Instantané pré-calculé des statistiques du tableau de bord (voir depannage/statistics.py)."""
+
+    key = models.CharField("Clé", max_length=50, unique=True)
+    data = JSONField("Données", default=dict)
+    computed_at = models.DateTimeField("Calculé le")
+    computation_ms = models.PositiveIntegerField("Durée du calcul (ms)", default=0)
+
+    @property
+    def age_seconds(self):
+        return (timezone.now() - self.computed_at).total_seconds()
+
+    def __str__(self):
+        return f"Statistiques {self.key} ({self.computed_at:%d/%m/%Y %H:%M})"
+
+    class Meta:
+        verbose_name = "Instantané de statistiques"
+        verbose_name_plural = "Instantanés de statistiques"
+
+
+class BackgroundJob(models.Model):
+    """Tâche différée exécutée par les workers ``run_jobs`` (voir depannage/jobs.py)."""
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "En attente"
+        RUNNING = "running", "En cours"
+        SUCCEEDED = "succeeded", "Terminée"
+        FAILED = "failed", "Échouée"
+
+    # Plus la valeur est petite, plus la tâche passe tôt
+    PRIORITY_HIGH = 10
+    PRIORITY_NORMAL = 50
+    PRIORITY_LOW = 90
+
+    name = models.CharField("Tâche", max_length=100)
+    payload = JSONField("Paramètres", default=dict, blank=True)
+    priority = models.PositiveSmallIntegerField("Priorité", default=PRIORITY_NORMAL)
+    status = models.CharField("Statut", max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField("Tentatives", default=0)
+    max_attempts = models.PositiveSmallIntegerField("Tentatives maximum", default=3)
+    run_at = models.DateTimeField("Exécuter à partir de", default=timezone.now)
+    locked_by = models.CharField("Worker", max_length=100, blank=True)
+    locked_at = models.DateTimeField("Pris en charge le", null=True, blank=True)
+    finished_at = models.DateTimeField("Terminée le", null=True, blank=True)
+    result = JSONField("Résultat", default=dict, blank=True)
+    last_error = models.TextField("Dernière erreur", blank=True)
+    created_at = models.DateTimeField("Date de création", auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = "Tâche de fond"
+        verbose_name_plural = "Tâches de fond"
+        indexes = [
+            # Sélection de la prochaine tâche : statut, priorité puis échéance
+            models.Index(fields=["status", "priority", "run_at"]),
+        ]
+
+
 # Signaux pour notifier le technicien lors de la suppression ou modification d'un avis
 @receiver(post_delete, sender=Review)
 def notify_technician_on_review_delete(sender, instance, **kwargs):
-    from .models import Notification
-    Notification.objects.create(
-        recipient=instance.technician.user,
+    from .notifications import notify
+    notify(
+        instance.technician.user_id,
         type=Notification.Type.REVIEW_RECEIVED,
         title="Avis supprimé",
         message=f"Un avis laissé par un client sur la demande #{instance.request.id} a été supprimé.",
@@ -1200,35 +1462,198 @@ def notify_technician_on_review_delete(sender, instance, **kwargs):
 
 @receiver(post_save, sender=Review)
 def notify_technician_on_review_update(sender, instance, created, **kwargs):
-    from .models import Notification
+    from .notifications import notify
     if not created:
-        Notification.objects.create(
-            recipient=instance.technician.user,
+        notify(
+            instance.technician.user_id,
             type=Notification.Type.REVIEW_RECEIVED,
             title="Avis modifié",
             message=f"Un avis laissé par un client sur la demande #{instance.request.id} a été modifié.",
             request=instance.request
         )
 
-def send_ws_notification(user_id, content):
+# Maintien incrémental des agrégats dénormalisés de Technician
+TECHNICIAN_STATS_FIELDS = (
+    "rating_count", "rating_sum", "jobs_completed_count", "jobs_handled_count", "active_jobs_count",
+)
+
+
+def apply_technician_stats_delta(technician_id, **deltas):
+    """Applique des variations aux compteurs d'un technicien en une seule requête UPDATE."""
+    from django.db.models import F, Value
+    from django.db.models.functions import Greatest
+
+    updates = {name: Greatest(F(name) + delta, Value(0)) for name, delta in deltas.items() if delta}
+    if technician_id and updates:
+        Technician.objects.filter(pk=technician_id).update(**updates)
+
+
+def refresh_technician_stats(technician_ids):
+    """Recalcule entièrement les compteurs des techniciens donnés. Retourne le nombre corrigé."""
+    corrected = []
+    for technician in Technician.objects.filter(pk__in=technician_ids).with_computed_stats():
+        changed = False
+        for name in TECHNICIAN_STATS_FIELDS:
+            computed = getattr(technician, f"computed_{name}")
+            if getattr(technician, name) != computed:
+                setattr(technician, name, computed)
+                changed = True
+        if changed:
+            corrected.append(technician)
+    if corrected:
+        Technician.objects.bulk_update(corrected, TECHNICIAN_STATS_FIELDS)
+    return len(corrected)
+
+
+def reconcile_technician_stats(batch_size=500):
+    """Vérifie tous les techniciens par lots ; retourne ``(vérifiés, corrigés)``."""
+    ids = list(Technician.objects.order_by("pk").values_list("pk", flat=True))
+    corrected = 0
+    for start in range(0, len(ids), batch_size):
+        corrected += refresh_technician_stats(ids[start:start + batch_size])
+    return len(ids), corrected
+
+
+_UNKNOWN_STATE = object()
+
+
+def _loaded_state(instance, contribution, *attnames):
+    """Contribution de l'instance telle que chargée, sans déclencher de requête sur les champs différés."""
+    if instance.pk is None:
+        return None
+    if any(name not in instance.__dict__ for name in attnames):
+        return _UNKNOWN_STATE
+    return contribution(*(instance.__dict__[name] for name in attnames))
+
+
+def _review_contribution(technician_id, rating):
+    if not technician_id or rating is None:
+        return None
+    return technician_id, {"rating_count": 1, "rating_sum": rating}
+
+
+def _request_contribution(technician_id, status):
+    if not technician_id:
+        return None
+    return technician_id, {
+        "jobs_completed_count": int(status == RepairRequest.Status.COMPLETED),
+        "jobs_handled_count": int(status != RepairRequest.Status.PENDING),
+        "active_jobs_count": int(status in RepairRequest.ACTIVE_STATUSES),
+    }
+
+
+def _apply_contribution_change(old, new):
+    """Retire l'ancienne contribution d'une ligne et ajoute la nouvelle."""
+    if old is _UNKNOWN_STATE:
+        # État initial inconnu (champs différés) : recalcul complet du technicien concerné
+        if new:
+            refresh_technician_stats([new[0]])
+        return
+    if old == new:
+        return
+    if old and new and old[0] == new[0]:
+        technician_id = new[0]
+        deltas = {name: new[1][name] - old[1][name] for name in new[1]}
+        apply_technician_stats_delta(technician_id, **deltas)
+        return
+    if old:
+        apply_technician_stats_delta(old[0], **{name: -value for name, value in old[1].items()})
+    if new:
+        apply_technician_stats_delta(new[0], **new[1])
+
+
+@receiver(post_init, sender=Review)
+def remember_review_stats_state(sender, instance, **kwargs):
+    instance._stats_state = _loaded_state(instance, _review_contribution, "technician_id", "rating")
+
+
+@receiver(post_save, sender=Review)
+def update_technician_stats_on_review_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    new = _review_contribution(instance.technician_id, instance.rating)
+    _apply_contribution_change(getattr(instance, "_stats_state", None), new)
+    instance._stats_state = new
+
+
+@receiver(post_delete, sender=Review)
+def update_technician_stats_on_review_delete(sender, instance, **kwargs):
+    _apply_contribution_change(getattr(instance, "_stats_state", None), None)
+
+
+@receiver(post_init, sender=RepairRequest)
+def remember_request_stats_state(sender, instance, **kwargs):
+    instance._stats_state = _loaded_state(instance, _request_contribution, "technician_id", "status")
+
+
+@receiver(post_save, sender=RepairRequest)
+def update_technician_stats_on_request_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    new = _request_contribution(instance.technician_id, instance.status)
+    _apply_contribution_change(getattr(instance, "_stats_state", None), new)
+    instance._stats_state = new
+
+
+@receiver(post_delete, sender=RepairRequest)
+def update_technician_stats_on_request_delete(sender, instance, **kwargs):
+    _apply_contribution_change(getattr(instance, "_stats_state", None), None)
+
+
+@receiver(post_save, sender=RepairRequest)
+@receiver(post_delete, sender=RepairRequest)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_save, sender="users.AuditLog")
+def invalidate_statistics_snapshot(sender, **kwargs):
+    from .statistics import mark_statistics_dirty
+    mark_statistics_dirty()
+
+
+CHAT_ACCESS_FIELDS = ("client_id", "technician_id", "is_active")
+
+
+def _chat_access_state(instance):
+    # Champs différés non chargés : None, sans requête supplémentaire
+    return tuple(instance.__dict__.get(field) for field in CHAT_ACCESS_FIELDS)
+
+
+@receiver(post_init, sender=ChatConversation)
+def remember_chat_access_state(sender, instance, **kwargs):
+    instance._access_state = _chat_access_state(instance)
+
+
+@receiver(post_save, sender=ChatConversation)
+def notify_chat_access_change(sender, instance, created, **kwargs):
+    """Invalide l'appartenance mise en cache par les ChatConsumer connectés, si elle a changé."""
+    old_state = getattr(instance, "_access_state", None)
+    instance._access_state = _chat_access_state(instance)
+    if created or instance._access_state == old_state:
+        return
     channel_layer = get_channel_layer()
     async_to_sync(channel_layer.group_send)(
-        f"user_{user_id}",
-        {"type": "send.notification", "content": content}
+        f"chat_{instance.pk}",
+        {
+            "type": "conversation.access.changed",
+            "access": {
+                "id": instance.pk,
+                "client_id": instance.client_id,
+                "technician_id": instance.technician_id,
+                "is_active": instance.is_active,
+            },
+        },
     )
 
+
 @receiver(post_save, sender=Notification)
 def notify_ws_on_notification(sender, instance, created, **kwargs):
+    """Push des notifications créées hors de depannage.notifications (qui utilise bulk_create)."""
     if created and instance.recipient_id:
-        send_ws_notification(
-            instance.recipient_id,
-            {
-                "title": instance.title,
-                "message": instance.message,
-                "type": instance.type,
-                "created_at": instance.created_at.isoformat() if instance.created_at else None,
-            }
-        )
+        from django.db import transaction
+        from .notifications import push_notifications
+        transaction.on_commit(lambda: push_notifications([instance]))
 
 class TechnicianSubscription(models.Model):
     technician = models.ForeignKey('Technician', on_delete=models.CASCADE, related_name='subscriptions')
@@ -1305,89 +1730,81 @@ class SubscriptionPaymentRequest(BaseTimeStampModel):
         verbose_name_plural = "Demandes de paiement d'abonnement"
 
 
+# Champs reflétés dans l'index spatial : les autres modifications ne le touchent pas
+SPATIAL_INDEX_FIELDS = frozenset({
+    "current_latitude", "current_longitude", "specialty", "is_available", "is_verified", "service_radius_km",
+})
+
+
+@receiver(post_save, sender=Technician)
+def sync_technician_spatial_index(sender, instance, created, **kwargs):
+    """Répercute position, disponibilité et spécialité dans l'index spatial."""
+    from django.db import transaction
+    from .spatial_index import technician_index
+
+    if not created and not SPATIAL_INDEX_FIELDS.intersection(instance.saved_changes):
+        return
+    if technician_index.is_loaded:
+        transaction.on_commit(lambda: technician_index.upsert_technician(instance))
+
+
+@receiver(post_save, sender=Technician)
+@receiver(post_delete, sender=Technician)
+def invalidate_dispatch_table(sender, instance, created=False, signal=None, **kwargs):
+    """Table des candidats du moteur d'affectation (depannage/dispatch.py) rechargée au prochain appel."""
+    from django.db import transaction
+    from .dispatch import TABLE_FIELDS, dispatcher
+
+    if signal is post_save and not created and not TABLE_FIELDS.intersection(instance.saved_changes):
+        return
+    transaction.on_commit(dispatcher.table.invalidate)
+
+
+@receiver(post_delete, sender=Technician)
+def remove_technician_from_spatial_index(sender, instance, **kwargs):
+    from django.db import transaction
+    from .spatial_index import technician_index
+
+    technician_id = instance.id
+    transaction.on_commit(lambda: technician_index.remove(technician_id))
+
+
 @receiver(post_save, sender=Technician)
 def handle_specialty_change(sender, instance, created, **kwargs):
-    if created:
-        instance._old_specialty = instance.specialty
+    """Changement de spécialité : les demandes en cours sont réaffectées par une tâche de fond."""
+    if created or "specialty" not in instance.saved_changes:
         return
-    # On récupère l'ancienne valeur de la spécialité
-    try:
-        old_instance = sender.objects.get(pk=instance.pk)
-        old_specialty = old_instance.specialty
-    except sender.DoesNotExist:
-        old_specialty = instance.specialty
-    # Si la spécialité a changé
-    if old_specialty != instance.specialty:
-        from depannage.models import RepairRequest
-        from depannage.views import calculate_distance
-        from depannage.models import Notification
-        from django.utils import timezone
-        # Trouver toutes les demandes en cours assignées à ce technicien pour l'ancienne spécialité
-        requests = RepairRequest.objects.filter(
-            technician=instance,
-            status__in=[RepairRequest.Status.ASSIGNED, RepairRequest.Status.IN_PROGRESS],
-            specialty_needed=old_specialty
-        )
-        for req in requests:
-            # Chercher un autre technicien libre de la même spécialité
-            candidates = sender.objects.filter(
-                specialty=old_specialty,
-                is_available=True,
-                is_verified=True,
-                current_latitude__isnull=False,
-                current_longitude__isnull=False,
-            ).exclude(id=instance.id)
-            # Filtrer sur abonnement actif
-            candidates = [t for t in candidates if t.has_active_subscription]
-            # Exclure ceux qui ont déjà une demande en cours
-            busy_tech_ids = set(
-                RepairRequest.objects.filter(
-                    status__in=[RepairRequest.Status.ASSIGNED, RepairRequest.Status.IN_PROGRESS]
-                ).values_list('technician_id', flat=True)
-            )
-            candidates = [t for t in candidates if t.id not in busy_tech_ids]
-            # Filtrer sur note minimale
-            MIN_RATING = 3.5
-            candidates = [t for t in candidates if t.average_rating >= MIN_RATING]
-            # Filtrer sur rayon d'intervention
-            tech_with_distance = []
-            lat, lng = req.latitude, req.longitude
-            for tech in candidates:
-                distance = calculate_distance(lat, lng, tech.current_latitude, tech.current_longitude)
-                if distance <= tech.service_radius_km:
-                    tech_with_distance.append((tech, distance))
-            tech_with_distance.sort(key=lambda x: x[1])
-            if tech_with_distance:
-                new_tech = tech_with_distance[0][0]
-                req.technician = new_tech
-                req.status = RepairRequest.Status.ASSIGNED
-                req.assigned_at = timezone.now()
-                req.save()
-                # Notifier le nouveau technicien
-                Notification.objects.create(
-                    recipient=new_tech.user,
-                    title="Nouvelle demande réassignée",
-                    message=f"Vous avez été réassigné à la demande #{req.id} (suite à un changement de spécialité d'un autre technicien)",
-                    type="new_request_technician",
-                    request=req,
-                )
-                # Notifier le client
-                Notification.objects.create(
-                    recipient=req.client.user,
-                    title="Nouveau technicien en route",
-                    message=f"Votre demande #{req.id} a été réassignée à un nouveau technicien.",
-                    type="technician_assigned",
-                    request=req,
-                )
-            else:
-                # Aucun technicien dispo, désassigner la demande
-                req.technician = None
-                req.status = RepairRequest.Status.PENDING
-                req.save()
-                Notification.objects.create(
-                    recipient=req.client.user,
-                    title="Demande en attente",
-                    message=f"Votre demande #{req.id} est de nouveau en attente, aucun technicien n'est disponible pour le moment.",
-                    type="no_technician_available",
-                    request=req,
-                )
+    from .jobs import enqueue
+
+    enqueue("reassign_after_specialty_change", {
+        "technician_id": instance.pk,
+        "old_specialty": instance.saved_changes["specialty"],
+    })
+
+
+@receiver(post_init, sender=RepairRequest)
+def remember_request_sla_state(sender, instance, **kwargs):
+    instance._sla_state = (instance.__dict__.get("status"), instance.__dict__.get("urgency_level"))
+
+
+@receiver(post_save, sender=RepairRequest)
+def publish_request_sla_change(sender, instance, created, raw=False, **kwargs):
+    """Entrée en attente, changement d'urgence ou sortie de l'attente : message au planificateur SLA."""
+    if raw:
+        return
+    from .sla import publish_release, publish_tracking
+
+    old_status, old_urgency = getattr(instance, "_sla_state", (None, None))
+    instance._sla_state = (instance.status, instance.urgency_level)
+    if not created and instance._sla_state == (old_status, old_urgency):
+        return
+    if instance.status == RepairRequest.Status.PENDING:
+        if created:
+            publish_tracking(instance, instance.created_at)
+        elif old_status == RepairRequest.Status.PENDING:
+            # Seule l'urgence change : l'attente court toujours depuis la même date
+            publish_tracking(instance)
+        else:
+            publish_tracking(instance, timezone.now())
+    elif old_status == RepairRequest.Status.PENDING:
+        publish_release(instance.pk)
@@ -0,0 +1,113 @@
+"""
+Service d'envoi des notifications utilisateur.
+
+Toutes les notifications passent par ``dispatch_notifications`` :
+- les lignes ``Notification`` sont insérées en un seul ``bulk_create`` ;
+- une fois la transaction validée, les pushes WebSocket vers les groupes
+  ``user_<id>`` partent ensemble (``asyncio.gather``) au lieu d'un
+  ``group_send`` synchrone par ligne.
+
+``bulk_create`` n'émet pas ``post_save`` : le receiver
+``notify_ws_on_notification`` ne couvre plus que les créations directes
+(admin Django, consumer de notifications), sans double envoi.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def notification_payload(notification):
+    """Contenu envoyé au client WebSocket pour une notification."""
+    return {
+        "id": notification.id,
+        "title": notification.title,
+        "message": notification.message,
+        "type": notification.type,
+        "created_at": notification.created_at.isoformat() if notification.created_at else None,
+    }
+
+
+def build_notification(recipient, title, message, type, request=None, extra_data=None):
+    """Instance ``Notification`` non enregistrée ; ``recipient`` peut être un utilisateur ou un id."""
+    from .models import Notification
+
+    recipient_field = "recipient" if hasattr(recipient, "pk") else "recipient_id"
+    return Notification(
+        **{recipient_field: recipient},
+        title=title,
+        message=message,
+        type=type,
+        request=request,
+        extra_data=extra_data or {},
+    )
+
+
+def dispatch_notifications(notifications):
+    """Insère les notifications en un lot puis les pousse en WebSocket après validation."""
+    from .models import Notification
+
+    notifications = [n for n in notifications if n.recipient_id]
+    if not notifications:
+        return []
+    created = Notification.objects.bulk_create(notifications)
+    transaction.on_commit(lambda: push_notifications(created))
+    return created
+
+
+def notify(recipient, title, message, type, request=None, extra_data=None):
+    """Crée et pousse une notification unique."""
+    notifications = dispatch_notifications(
+        [build_notification(recipient, title, message, type, request=request, extra_data=extra_data)]
+    )
+    return notifications[0] if notifications else None
+
+
+def notify_many(recipients, title, message, type, request=None, extra_data=None):
+    """Même notification pour plusieurs destinataires, en une insertion et un envoi groupé."""
+    return dispatch_notifications([
+        build_notification(recipient, title, message, type, request=request, extra_data=extra_data)
+        for recipient in recipients
+    ])
+
+
+def notify_admins(title, message, type, request=None, extra_data=None):
+    """Notifie tous les administrateurs actifs."""
+    from users.models import User
+
+    admin_ids = User.objects.filter(is_staff=True, is_active=True).values_list("id", flat=True)
+    return notify_many(admin_ids, title, message, type, request=request, extra_data=extra_data)
+
+
+def push_notifications(notifications):
+    """Envoie les notifications aux groupes ``user_<id>`` en un seul passage asynchrone."""
+    messages = [
+        (f"user_{notification.recipient_id}", {
+            "type": "send.notification",
+            "content": notification_payload(notification),
+        })
+        for notification in notifications
+    ]
+    if not messages:
+        return
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(_fan_out)(channel_layer, messages)
+    except Exception:
+        logger.exception("Échec de l'envoi WebSocket de %s notifications", len(messages))
+
+
+async def _fan_out(channel_layer, messages):
+    results = await asyncio.gather(
+        *(channel_layer.group_send(group, message) for group, message in messages),
+        return_exceptions=True,
+    )
+    failures = [result for result in results if isinstance(result, Exception)]
+    if failures:
+        logger.warning("%s notifications WebSocket non envoyées : %s", len(failures), failures[0])
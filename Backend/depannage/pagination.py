@@ -0,0 +1,147 @@
+"""
+Pagination par curseur (keyset) sur le couple (date, id).
+
+Contrairement à ``PageNumberPagination``, aucune requête COUNT n'est faite et
+la page demandée est lue directement dans l'index composite
+``(…, <date>, id)`` : la page N coûte autant que la première.
+
+Paramètres de requête :
+- ``before=<curseur>`` : éléments plus anciens que le curseur (remonter l'historique) ;
+- ``after=<curseur>`` : éléments plus récents que le curseur (nouveautés) ;
+- ``page_size`` : taille de page, bornée par ``max_page_size``.
+
+La réponse contient ``results`` ainsi que les liens ``before`` et ``after``
+à suivre pour la page suivante dans chaque sens.
+"""
+import base64
+import binascii
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Pagination par curseur sur ``(ordering_field, id)``."""
+
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = "page_size"
+    before_query_param = "before"
+    after_query_param = "after"
+    ordering_field = "created_at"
+    # Ordre d'affichage des résultats : du plus récent au plus ancien, ou chronologique
+    newest_first = True
+    invalid_cursor_message = "Curseur invalide"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        before = self.decode_cursor(request.query_params.get(self.before_query_param))
+        after = self.decode_cursor(request.query_params.get(self.after_query_param))
+        field = self.ordering_field
+
+        # On lit toujours en s'éloignant du curseur, dans l'ordre de l'index
+        self.forward = after is not None
+        if self.forward:
+            queryset = queryset.filter(
+                Q(**{f"{field}__gt": after[0]}) | Q(**{field: after[0], "pk__gt": after[1]})
+            ).order_by(field, "pk")
+        else:
+            if before is not None:
+                queryset = queryset.filter(
+                    Q(**{f"{field}__lt": before[0]}) | Q(**{field: before[0], "pk__lt": before[1]})
+                )
+            queryset = queryset.order_by(f"-{field}", "-pk")
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.cursor = after if self.forward else before
+
+        oldest_first = sorted(rows, key=lambda row: (getattr(row, field), row.pk))
+        self.oldest = oldest_first[0] if oldest_first else None
+        self.newest = oldest_first[-1] if oldest_first else None
+        return oldest_first[::-1] if self.newest_first else oldest_first
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, row):
+        raw = f"{getattr(row, self.ordering_field).isoformat()}|{row.pk}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, value):
+        if not value:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode()
+            timestamp, pk = raw.rsplit("|", 1)
+            moment = parse_datetime(timestamp)
+            if moment is None:
+                raise ValueError(timestamp)
+            return moment, int(pk)
+        except (ValueError, UnicodeDecodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _link(self, param, cursor):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.before_query_param)
+        url = remove_query_param(url, self.after_query_param)
+        return replace_query_param(url, param, cursor)
+
+    def get_before_link(self):
+        """Page plus ancienne : absente quand l'historique est épuisé."""
+        if self.oldest is None or (not self.forward and not self.has_more):
+            return None
+        return self._link(self.before_query_param, self.encode_cursor(self.oldest))
+
+    def get_after_link(self):
+        """Page plus récente ; sans nouveauté, le lien reste utilisable pour interroger plus tard."""
+        if self.newest is not None:
+            return self._link(self.after_query_param, self.encode_cursor(self.newest))
+        if self.forward:
+            return self.request.build_absolute_uri()
+        return None
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("before", self.get_before_link()),
+            ("after", self.get_after_link()),
+            ("results", data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "before": {"type": "string", "nullable": True, "format": "uri"},
+                "after": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class ChatMessagePagination(KeysetPagination):
+    """Historique de chat : dernière page d'abord, messages affichés dans l'ordre chronologique."""
+
+    newest_first = False
+
+
+class NotificationPagination(KeysetPagination):
+    page_size = 20
+
+
+class AuditLogPagination(KeysetPagination):
+    page_size = 100
+    max_page_size = 500
+    ordering_field = "timestamp"
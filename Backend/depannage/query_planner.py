@@ -0,0 +1,284 @@
+"""
+Plan de requête déduit des champs d'un serializer DRF.
+
+``plan_for_serializer`` parcourt les champs déclarés d'un serializer (et de
+ses serializers imbriqués) et en déduit :
+- les ``select_related`` nécessaires (relations vers un seul objet) ;
+- les ``prefetch_related`` nécessaires (relations multiples) ;
+- la projection ``only()`` des colonnes réellement lues ;
+- les annotations demandées par les champs calculés.
+
+Les ``SerializerMethodField`` sont opaques : leur méthode déclare ce qu'elle
+lit avec le décorateur ``query_hints``. Un champ dont les besoins sont
+inconnus (méthode sans indication, attribut Python non décrit) désactive la
+projection du modèle concerné : on charge alors toutes ses colonnes, jamais
+moins que nécessaire.
+
+``QueryPlanMixin`` applique le plan aux viewsets DRF dans ``filter_queryset``.
+
+``SparseFieldsetMixin`` ajoute aux serializers les paramètres ``?fields=``,
+``?exclude=`` et ``?expand=`` ; comme le plan est déduit des champs
+effectivement rendus, la projection SQL suit la liste demandée.
+"""
+from dataclasses import dataclass, field
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+# Méthodes courantes des modèles et colonnes qu'elles lisent
+KNOWN_ATTRIBUTE_FIELDS = {
+    "get_full_name": ("first_name", "last_name"),
+    "get_short_name": ("first_name",),
+    "get_username": ("username",),
+}
+
+
+def depends_on(*field_names):
+    """Déclare les colonnes lues par une méthode ou une propriété de modèle."""
+    def decorator(func):
+        func.query_fields = field_names
+        return func
+    return decorator
+
+
+@dataclass(frozen=True)
+class QueryHints:
+    select_related: tuple = ()
+    prefetch_related: tuple = ()
+    only: tuple = ()
+    # dict d'annotations, ou fonction (request) -> dict pour celles qui dépendent de l'utilisateur
+    annotate: object = None
+
+
+def query_hints(select_related=(), prefetch_related=(), only=(), annotate=None):
+    """Déclare ce que lit la méthode d'un ``SerializerMethodField`` (chemins relatifs au modèle du serializer)."""
+    def decorator(method):
+        method.query_hints = QueryHints(tuple(select_related), tuple(prefetch_related), tuple(only), annotate)
+        return method
+    return decorator
+
+
+@dataclass
+class QueryPlan:
+    select_related: set = field(default_factory=set)
+    prefetch_related: set = field(default_factory=set)
+    only: set = field(default_factory=set)
+    annotations: list = field(default_factory=list)
+    # Préfixes de relation dont on ne connaît pas toutes les colonnes lues ("" = modèle racine)
+    unbounded: set = field(default_factory=set)
+
+    def apply(self, queryset, request=None, project=True):
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*sorted(self.prefetch_related))
+        for annotations in self.annotations:
+            if callable(annotations):
+                annotations = annotations(request)
+            if annotations:
+                queryset = queryset.annotate(**annotations)
+        if project and self.only and "" not in self.unbounded:
+            queryset = queryset.only(*sorted(self._projected_fields(queryset.model)))
+        return queryset
+
+    def _projected_fields(self, model):
+        names = set(self.only)
+        # Une relation traversée par select_related ne peut pas être différée
+        for path in self.select_related:
+            parts = path.split("__")
+            names.update("__".join(parts[:i]) for i in range(1, len(parts) + 1))
+        for prefix in self.unbounded:
+            related_model = _model_at(model, prefix)
+            names.update(f"{prefix}__{f.name}" for f in related_model._meta.concrete_fields)
+        return names
+
+
+def plan_for_serializer(serializer, model=None):
+    """Construit le plan d'un serializer instancié (ses ``fields`` éventuellement filtrés)."""
+    plan = QueryPlan()
+    _walk(plan, serializer, model or serializer.Meta.model, prefix="", in_prefetch=False)
+    return plan
+
+
+def _walk(plan, serializer, model, prefix, in_prefetch):
+    for name, serializer_field in serializer.fields.items():
+        if serializer_field.write_only:
+            continue
+        if isinstance(serializer_field, serializers.SerializerMethodField):
+            method = getattr(serializer, serializer_field.method_name)
+            hints = getattr(method, "query_hints", None)
+            if hints is None:
+                _mark_unbounded(plan, prefix, in_prefetch)
+            else:
+                _apply_hints(plan, hints, prefix, in_prefetch)
+            continue
+        if serializer_field.source == "*":
+            if isinstance(serializer_field, serializers.BaseSerializer):
+                _walk(plan, serializer_field, model, prefix, in_prefetch)
+            else:
+                _mark_unbounded(plan, prefix, in_prefetch)
+            continue
+        _walk_source(plan, serializer_field, model, serializer_field.source_attrs, prefix, in_prefetch)
+
+
+def _walk_source(plan, serializer_field, model, attrs, prefix, in_prefetch):
+    path = prefix
+    for index, attr in enumerate(attrs):
+        last = index == len(attrs) - 1
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            names = _attribute_fields(model, attr)
+            if names is None:
+                _mark_unbounded(plan, path, in_prefetch)
+            elif not in_prefetch:
+                plan.only.update(_join(path, n) for n in names)
+            return
+
+        if not model_field.is_relation:
+            if not in_prefetch:
+                plan.only.add(_join(path, attr))
+            return
+
+        relation_path = _join(path, attr)
+        if model_field.many_to_many or model_field.one_to_many:
+            plan.prefetch_related.add(relation_path)
+            if last and isinstance(serializer_field, serializers.BaseSerializer):
+                child = getattr(serializer_field, "child", serializer_field)
+                _walk(plan, child, model_field.related_model, relation_path, in_prefetch=True)
+            return
+
+        # Relation vers un seul objet
+        if model_field.concrete and not in_prefetch:
+            plan.only.add(relation_path)
+        if last and _pk_only(serializer_field):
+            if not model_field.concrete:
+                # Relation inverse : la clé n'est pas sur ce modèle, une jointure sur la seule clé suffit
+                (plan.prefetch_related if in_prefetch else plan.select_related).add(relation_path)
+                if not in_prefetch:
+                    plan.only.add(_join(relation_path, model_field.related_model._meta.pk.name))
+            return
+        (plan.prefetch_related if in_prefetch else plan.select_related).add(relation_path)
+        if last:
+            if isinstance(serializer_field, serializers.BaseSerializer):
+                _walk(plan, serializer_field, model_field.related_model, relation_path, in_prefetch)
+            else:
+                _mark_unbounded(plan, relation_path, in_prefetch)
+            return
+        model = model_field.related_model
+        path = relation_path
+
+
+def _apply_hints(plan, hints, prefix, in_prefetch):
+    relations = plan.prefetch_related if in_prefetch else plan.select_related
+    relations.update(_join(prefix, p) for p in hints.select_related)
+    plan.prefetch_related.update(_join(prefix, p) for p in hints.prefetch_related)
+    if not in_prefetch:
+        plan.only.update(_join(prefix, p) for p in hints.only)
+        if hints.annotate and not prefix:
+            plan.annotations.append(hints.annotate)
+    if not hints.only:
+        _mark_unbounded(plan, prefix, in_prefetch)
+
+
+def _mark_unbounded(plan, prefix, in_prefetch):
+    if not in_prefetch:
+        plan.unbounded.add(prefix)
+
+
+def _attribute_fields(model, attr):
+    """Colonnes lues par un attribut Python du modèle, ou None si inconnues."""
+    if attr.startswith("get_") and attr.endswith("_display"):
+        return (attr[4:-8],)
+    value = getattr(model, attr, None)
+    func = getattr(value, "fget", None) or getattr(value, "func", None) or value
+    names = getattr(func, "query_fields", None)
+    if names is None:
+        names = KNOWN_ATTRIBUTE_FIELDS.get(attr)
+    return names
+
+
+def _pk_only(serializer_field):
+    return isinstance(serializer_field, serializers.RelatedField) and serializer_field.use_pk_only_optimization()
+
+
+def _model_at(model, path):
+    for attr in path.split("__"):
+        model = model._meta.get_field(attr).related_model
+    return model
+
+
+def _join(prefix, name):
+    return f"{prefix}__{name}" if prefix else name
+
+
+class QueryPlanMixin:
+    """
+    Applique à ``filter_queryset`` le plan déduit du serializer de l'action.
+
+    La projection ``only()`` est limitée aux actions de lecture
+    (``query_plan_actions``) ; les autres actions gardent les jointures et
+    préchargements mais chargent toutes les colonnes.
+    """
+
+    query_plan_actions = ("list", "retrieve")
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer = self.get_serializer()
+        if not isinstance(serializer, serializers.ModelSerializer):
+            return queryset
+        plan = plan_for_serializer(serializer, queryset.model)
+        return plan.apply(queryset, request=self.request, project=self.action in self.query_plan_actions)
+
+
+class SparseFieldsetMixin:
+    """
+    Champs à la demande pour les lectures (GET) d'un serializer de premier niveau.
+
+    - ``?fields=id,title,status`` : ne rend que ces champs ;
+    - ``?exclude=description`` : retire ces champs ;
+    - ``?expand=technician`` : avec ``fields`` ou ``expand``, les champs listés
+      dans ``Meta.expandable_fields`` sont réduits à leur clé primaire, sauf
+      s'ils sont demandés dans ``expand``.
+
+    Sans aucun de ces paramètres, la représentation complète est inchangée.
+    Les champs non rendus ne sont pas calculés et, avec ``QueryPlanMixin``,
+    leurs colonnes et jointures ne sont pas chargées.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        params = self._fieldset_params()
+        if params is None:
+            return fields
+        requested, excluded, expanded = params
+
+        if requested or expanded:
+            for name in getattr(self.Meta, "expandable_fields", ()):
+                if name in fields and name not in expanded:
+                    fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, allow_null=True)
+        if requested:
+            fields = {name: f for name, f in fields.items() if name in requested}
+        for name in excluded:
+            fields.pop(name, None)
+        return fields
+
+    def _fieldset_params(self):
+        request = self.context.get("request")
+        if request is None or request.method not in SAFE_METHODS or not self._is_top_level():
+            return None
+        query_params = getattr(request, "query_params", request.GET)
+        if not any(key in query_params for key in ("fields", "exclude", "expand")):
+            return None
+        return tuple(
+            {name.strip() for name in query_params.get(key, "").split(",") if name.strip()}
+            for key in ("fields", "exclude", "expand")
+        )
+
+    def _is_top_level(self):
+        parent = self.parent
+        if parent is None:
+            return True
+        return isinstance(parent, serializers.ListSerializer) and parent.parent is None
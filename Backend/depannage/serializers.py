@@ -8,6 +8,30 @@ from django.conf import settings
 from django.contrib.auth.models import Permission, Group
 from users.models import AuditLog
 from django.utils import timezone
+from django.db.models import Count, OuterRef, Subquery
+from .query_planner import SparseFieldsetMixin, query_hints
+
+
+def _latest_cinetpay_status():
+    return {
+        'latest_cinetpay_status': Subquery(
+            CinetPayPayment.objects.filter(request=OuterRef('pk')).order_by('-created_at').values('status')[:1]
+        )
+    }
+
+
+def _conversation_unread_count(request):
+    if request is None or not request.user.is_authenticated:
+        return {}
+    unread = (
+        Message.objects.filter(conversation__request=OuterRef('pk'), is_read=False)
+        .exclude(sender=request.user)
+        .order_by()
+        .values('conversation')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    return {'conversation_unread_count': Subquery(unread)}
 
 # Serializers pour les modèles de base
 class ClientUserSerializer(serializers.ModelSerializer):
@@ -21,6 +45,7 @@ class ClientSerializer(serializers.ModelSerializer):
         model = Client
         fields = ['id', 'user', 'address', 'phone', 'is_active', 'created_at']
         read_only_fields = ['id', 'created_at']
+    @query_hints(select_related=['user'], only=['user__first_name', 'user__last_name', 'user__email', 'user__username'])
     def get_user(self, obj):
         return {
             'id': obj.user.id,
@@ -30,7 +55,7 @@ class ClientSerializer(serializers.ModelSerializer):
             'username': obj.user.username,
         }
 
-class TechnicianSerializer(serializers.ModelSerializer):
+class TechnicianSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = serializers.SerializerMethodField()
     
     class Meta:
@@ -41,7 +66,9 @@ class TechnicianSerializer(serializers.ModelSerializer):
             'phone'
         ]
         read_only_fields = ['id', 'created_at']
+        expandable_fields = ['user']
     
+    @query_hints(select_related=['user'], only=['user__first_name', 'user__last_name', 'user__email', 'user__username'])
     def get_user(self, obj):
         return {
             'id': obj.user.id,
@@ -75,6 +102,13 @@ class TechnicianSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Le rayon de service ne peut pas dépasser 100 km.")
         return value
 
+    def update(self, instance, validated_data):
+        """N'écrit que les champs modifiés : pas d'UPDATE complet ni d'écrasement des compteurs."""
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save_dirty()
+        return instance
+
 class ReviewSerializer(serializers.ModelSerializer):
     """Serializer pour les avis."""
     client_name = serializers.CharField(source='client.user.get_full_name', read_only=True)
@@ -110,8 +144,9 @@ class ReviewSerializer(serializers.ModelSerializer):
         )
         # Créer la notification pour le technicien
         from .models import Notification
-        Notification.objects.create(
-            recipient=review.technician.user,
+        from .notifications import notify
+        notify(
+            review.technician.user_id,
             type=Notification.Type.REVIEW_RECEIVED,
             title="Nouvel avis reçu",
             message=f"Vous avez reçu un nouvel avis ({review.rating}/5) de la part d'un client.",
@@ -119,7 +154,7 @@ class ReviewSerializer(serializers.ModelSerializer):
         )
         return review
 
-class RepairRequestSerializer(serializers.ModelSerializer):
+class RepairRequestSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     client = serializers.SerializerMethodField()
     technician = serializers.SerializerMethodField()
     payment_status = serializers.SerializerMethodField()
@@ -144,7 +179,13 @@ class RepairRequestSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             'description': {'required': False, 'allow_blank': True, 'allow_null': True},
         }
+        expandable_fields = ['client', 'technician', 'review', 'conversation']
 
+    @query_hints(
+        select_related=['client__user'],
+        only=['client__phone', 'client__user__first_name', 'client__user__last_name',
+              'client__user__email', 'client__user__username'],
+    )
     def get_client(self, obj):
         if obj.client:
             return {
@@ -160,6 +201,11 @@ class RepairRequestSerializer(serializers.ModelSerializer):
             }
         return None
     
+    @query_hints(
+        select_related=['technician__user'],
+        only=['technician__specialty', 'technician__rating_count', 'technician__rating_sum',
+              'technician__user__first_name', 'technician__user__last_name', 'technician__user__email'],
+    )
     def get_technician(self, obj):
         if obj.technician:
             return {
@@ -175,17 +221,24 @@ class RepairRequestSerializer(serializers.ModelSerializer):
             }
         return None
     
+    @query_hints(only=['id'], annotate=lambda request: _latest_cinetpay_status())
     def get_payment_status(self, obj):
+        if hasattr(obj, 'latest_cinetpay_status'):
+            return obj.latest_cinetpay_status or 'non payé'
         latest_payment = obj.cinetpay_payments.order_by('-created_at').first()
         if latest_payment:
             return latest_payment.status
         return 'non payé'
     
+    @query_hints(select_related=['conversation'], only=['conversation__id'], annotate=_conversation_unread_count)
     def get_conversation(self, obj):
         request = self.context.get('request', None)
         user = request.user if request else None
         if hasattr(obj, 'conversation') and obj.conversation:
-            unread = obj.conversation.unread_count_for_user(user) if user else 0
+            if hasattr(obj, 'conversation_unread_count'):
+                unread = obj.conversation_unread_count or 0
+            else:
+                unread = obj.conversation.unread_count_for_user(user) if user else 0
             return {
                 'id': obj.conversation.id,
                 'unread_count': unread
@@ -297,7 +350,7 @@ class MessageAttachmentSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
-class NotificationSerializer(serializers.ModelSerializer):
+class NotificationSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer pour les notifications."""
     
     class Meta:
@@ -673,6 +726,18 @@ class ChatConversationSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at', 'last_message_at']
     
     def get_last_message(self, obj):
+        if hasattr(obj, 'last_message_pk'):
+            # Valeurs annotées par ChatConversationQuerySet.with_inbox_data
+            if obj.last_message_pk is None:
+                return None
+            return {
+                'id': obj.last_message_pk,
+                'content': obj.last_message_content,
+                'message_type': obj.last_message_type,
+                'created_at': obj.last_message_created_at.isoformat(),
+                'sender_id': obj.last_message_sender_id,
+                'sender_name': f"{obj.last_message_sender_first_name} {obj.last_message_sender_last_name}".strip()
+            }
         last_msg = obj.latest_message
         if last_msg:
             return {
@@ -680,12 +745,14 @@ class ChatConversationSerializer(serializers.ModelSerializer):
                 'content': last_msg.content,
                 'message_type': last_msg.message_type,
                 'created_at': last_msg.created_at.isoformat(),
-                'sender_id': last_msg.sender.id,
+                'sender_id': last_msg.sender_id,
                 'sender_name': last_msg.sender.get_full_name()
             }
         return None
     
     def get_unread_count(self, obj):
+        if hasattr(obj, 'unread_count'):
+            return obj.unread_count
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.unread_count_for_user(request.user)
@@ -0,0 +1,363 @@
+"""
+Délais de prise en charge (SLA) des demandes en attente.
+
+Chaque demande en attente reçoit une échéance selon son niveau d'urgence
+(``SLA_SETTINGS['DEADLINE_MINUTES']``, décomptée depuis sa mise en attente).
+``SLAScheduler`` garde en mémoire un tas d'événements datés :
+
+- ``offer`` : toutes les ``OFFER_INTERVAL_MINUTES``, la demande est proposée
+  aux ``OFFER_TOP_K`` meilleurs techniciens suivants (ceux déjà notifiés sont
+  exclus), dans un rayon élargi d'un anneau à chaque offre
+  (``RADIUS_RINGS_KM``) ; un anneau sans candidat passe au suivant ;
+- ``escalate`` : une fois ``ESCALATE_AT`` du délai écoulé, les administrateurs
+  sont prévenus ;
+- ``breach`` : à l'échéance, nouvelle alerte et fin du suivi automatique.
+
+Le processus ``run_dispatch_scheduler`` dort jusqu'au prochain événement ou
+jusqu'à un message du channel layer : les receivers de ``models.py`` publient
+l'entrée d'une demande en attente (``sla.track``) et sa sortie
+(``sla.release``). Rien n'est relu en base entre deux événements ; à leur
+échéance, les demandes concernées sont relues en une requête et celles qui ne
+sont plus en attente abandonnées.
+
+Un événement devenu caduc (demande libérée, ou suivie de nouveau après un
+changement d'urgence) reste dans le tas et est ignoré à sa sortie grâce à son
+numéro de génération ; le tas est reconstruit quand ces entrées dominent.
+
+``load_pending`` (démarrage, puis toutes les ``RESYNC_SECONDS``) rattrape les
+messages perdus et les ``update()`` en masse, qui n'émettent pas de signal.
+Une demande hors délai reste en attente mais n'est plus suivie : elle est
+retenue dans ``_breached`` tant qu'elle est en attente, et les alertes déjà
+envoyées (``Notification.extra_data['sla']``) sont relues pour les demandes
+inconnues, afin qu'un redémarrage ne renvoie ni alerte ni dépassement.
+"""
+import heapq
+import itertools
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+OFFER = "offer"
+ESCALATE = "escalate"
+BREACH = "breach"
+
+DEFAULT_DEADLINE_MINUTES = {"sos": 30, "urgent": 120, "same_day": 720, "normal": 2880}
+DEFAULT_OFFER_INTERVAL_MINUTES = {"sos": 5, "urgent": 15, "same_day": 60, "normal": 240}
+DEFAULT_RADIUS_RINGS_KM = (10, 20, 35, 50)
+
+
+def sla_settings():
+    return getattr(settings, "SLA_SETTINGS", {})
+
+
+def _minutes(defaults, configured):
+    return {level: timedelta(minutes=minutes) for level, minutes in {**defaults, **(configured or {})}.items()}
+
+
+@dataclass
+class TrackedRequest:
+    """État en mémoire d'une demande suivie."""
+
+    request_id: int
+    urgency_level: str
+    pending_since: datetime
+    deadline: datetime
+    generation: int
+    ring: int = 0  # anneau de la prochaine offre
+
+
+class SLAScheduler:
+    """File des offres et alertes à venir, ordonnée par date d'exécution."""
+
+    def __init__(self, dispatcher=None, deadlines=None, offer_intervals=None, radius_rings_km=None,
+                 offer_top_k=None, escalate_at=None):
+        if dispatcher is None:
+            from .dispatch import dispatcher
+        config = sla_settings()
+        self.dispatcher = dispatcher
+        self.deadlines = _minutes(DEFAULT_DEADLINE_MINUTES, deadlines or config.get("DEADLINE_MINUTES"))
+        self.offer_intervals = _minutes(
+            DEFAULT_OFFER_INTERVAL_MINUTES, offer_intervals or config.get("OFFER_INTERVAL_MINUTES")
+        )
+        self.radius_rings_km = list(radius_rings_km or config.get("RADIUS_RINGS_KM", DEFAULT_RADIUS_RINGS_KM))
+        self.offer_top_k = offer_top_k or config.get("OFFER_TOP_K", 10)
+        self.escalate_at = escalate_at if escalate_at is not None else config.get("ESCALATE_AT", 0.75)
+        self._heap = []
+        self._tracked = {}
+        self._breached = set()  # hors délai, toujours en attente : plus d'offre ni d'alerte
+        self._generations = itertools.count(1)
+        self._sequence = itertools.count()  # départage des événements simultanés
+
+    def __len__(self):
+        return len(self._tracked)
+
+    def __contains__(self, request_id):
+        return request_id in self._tracked
+
+    def track(self, request_id, urgency_level, pending_since, now=None, escalated=False):
+        """
+        (Re)programme les offres et alertes d'une demande en attente depuis ``pending_since`` ;
+        ``escalated`` : alerte aux administrateurs déjà envoyée.
+        """
+        now = now or timezone.now()
+        self._breached.discard(request_id)
+        if urgency_level not in self.deadlines:
+            urgency_level = "normal"
+        deadline = pending_since + self.deadlines[urgency_level]
+        state = TrackedRequest(request_id, urgency_level, pending_since, deadline, next(self._generations))
+        self._tracked[request_id] = state
+
+        self._schedule_offer(state, max(pending_since + self.offer_intervals[urgency_level], now))
+        if now < deadline and self.escalate_at < 1 and not escalated:
+            self._push(pending_since + (deadline - pending_since) * self.escalate_at, state, ESCALATE)
+        self._push(deadline, state, BREACH)
+        return state
+
+    def release(self, request_id):
+        """Arrête le suivi (demande assignée, annulée...) ; ses événements deviennent caducs."""
+        self._breached.discard(request_id)
+        return self._tracked.pop(request_id, None) is not None
+
+    def handle_message(self, message, now=None):
+        """Applique un message publié par ``publish_tracking`` ou ``publish_release``."""
+        if message.get("type") == "sla.track":
+            state = self._tracked.get(message["request_id"])
+            pending_since = (
+                parse_datetime(message.get("pending_since") or "")
+                or (state.pending_since if state else None)
+                or now or timezone.now()
+            )
+            self.track(message["request_id"], message.get("urgency_level"), pending_since, now=now)
+        elif message.get("type") == "sla.release":
+            self.release(message["request_id"])
+
+    def load_pending(self, now=None):
+        """Suit toutes les demandes en attente (deux requêtes) et oublie les autres ; retourne les ajouts."""
+        from .models import Notification, RepairRequest
+
+        now = now or timezone.now()
+        rows = RepairRequest.objects.filter(status=RepairRequest.Status.PENDING).values_list(
+            "id", "urgency_level", "created_at"
+        )
+        pending = set()
+        new_rows = []
+        for request_id, urgency_level, created_at in rows.iterator(chunk_size=2000):
+            pending.add(request_id)
+            state = self._tracked.get(request_id)
+            if request_id in self._breached or (state is not None and state.urgency_level == urgency_level):
+                continue
+            new_rows.append((request_id, urgency_level, created_at, state))
+
+        # Alertes déjà envoyées (processus précédent) pour les demandes qu'on ne suivait pas
+        alerts = {}
+        untracked = [request_id for request_id, _, _, state in new_rows if state is None]
+        if untracked:
+            sent = Notification.objects.filter(
+                request_id__in=untracked, type=Notification.Type.SYSTEM, extra_data__sla__in=[ESCALATE, BREACH],
+            ).values_list("request_id", "extra_data__sla").distinct()
+            for request_id, action in sent:
+                alerts.setdefault(request_id, set()).add(action)
+
+        added = 0
+        for request_id, urgency_level, created_at, state in new_rows:
+            sent = alerts.get(request_id, ())
+            if BREACH in sent:
+                self._breached.add(request_id)
+                continue
+            # Sans message, la date de mise en attente n'est pas connue : date de création à défaut
+            self.track(
+                request_id, urgency_level, state.pending_since if state else created_at,
+                now=now, escalated=ESCALATE in sent,
+            )
+            added += 1
+        for request_id in set(self._tracked) - pending:
+            self.release(request_id)
+        self._breached &= pending
+        return added
+
+    def next_due(self):
+        """Date du prochain événement valide, ou None."""
+        while self._heap and not self._is_live(self._heap[0]):
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return datetime.fromtimestamp(self._heap[0][0], tz=dt_timezone.utc)
+
+    def seconds_until_next_due(self, now=None, maximum=None):
+        due = self.next_due()
+        if due is None:
+            return maximum
+        wait = max(0.0, (due - (now or timezone.now())).total_seconds())
+        return wait if maximum is None else min(wait, maximum)
+
+    def run_due(self, now=None):
+        """Exécute les événements échus à ``now`` ; retourne le nombre d'actions par type."""
+        from .models import RepairRequest
+
+        now = now or timezone.now()
+        counts = dict.fromkeys((OFFER, ESCALATE, BREACH), 0)
+        due = []
+        while self._heap and self._heap[0][0] <= now.timestamp():
+            entry = heapq.heappop(self._heap)
+            if self._is_live(entry):
+                due.append((entry[2], entry[4]))
+        if not due:
+            return counts
+
+        requests = RepairRequest.objects.filter(status=RepairRequest.Status.PENDING).only(
+            "id", "title", "status", "urgency_level", "specialty_needed", "latitude", "longitude",
+            "min_experience_level", "min_rating",
+        ).in_bulk({request_id for request_id, _ in due})
+        offers = []
+        for request_id, action in due:
+            repair_request = requests.get(request_id)
+            state = self._tracked.get(request_id)
+            if state is None:
+                continue
+            if repair_request is None:
+                # Assignée, annulée ou supprimée depuis : plus rien à faire
+                self.release(request_id)
+                continue
+            if action == OFFER:
+                offers.append((state, repair_request))
+            else:
+                self._alert_admins(state, repair_request, breached=action == BREACH)
+                counts[action] += 1
+                if action == BREACH:
+                    self.release(request_id)
+                    self._breached.add(request_id)
+        if offers:
+            counts[OFFER] = self._offer(offers, now)
+        return counts
+
+    def _offer(self, offers, now):
+        """Propose chaque demande aux meilleurs techniciens pas encore notifiés, anneau suivant."""
+        from .dispatch import DispatchQuery
+        from .models import Notification
+        from .notifications import notify_many
+
+        # Techniciens déjà notifiés (création de la demande, offres précédentes) : une requête par lot
+        notified = {}
+        rows = Notification.objects.filter(
+            request_id__in=[repair_request.pk for _, repair_request in offers],
+            type=Notification.Type.URGENT_REQUEST,
+            recipient__technician_depannage__isnull=False,
+        ).values_list("request_id", "recipient__technician_depannage__id")
+        for request_id, technician_id in rows:
+            notified.setdefault(request_id, set()).add(technician_id)
+
+        last_ring = len(self.radius_rings_km) - 1
+        sent = 0
+        for state, repair_request in offers:
+            query = DispatchQuery.from_request(repair_request, exclude_ids=notified.get(repair_request.pk, ()))
+            ranked = []
+            while not ranked:
+                radius_km = self.radius_rings_km[min(state.ring, last_ring)]
+                ranked = self.dispatcher.top_k(query, k=self.offer_top_k, radius_km=radius_km)
+                if state.ring >= last_ring:
+                    break
+                state.ring += 1
+            if ranked:
+                notify_many(
+                    [candidate.user_id for candidate in ranked],
+                    title="Demande toujours en attente",
+                    message=f"La demande {repair_request.title} attend encore un technicien dans votre zone",
+                    type=Notification.Type.URGENT_REQUEST,
+                    request=repair_request,
+                    extra_data={
+                        "request_id": repair_request.pk,
+                        "specialty": repair_request.specialty_needed,
+                        "urgency": repair_request.urgency_level,
+                        "radius_km": radius_km,
+                        "deadline": state.deadline.isoformat(),
+                    },
+                )
+                sent += 1
+            # De nouveaux techniciens peuvent se libérer : offre suivante même si personne ce tour-ci
+            if self._tracked.get(state.request_id) is state:
+                self._schedule_offer(state, now + self.offer_intervals[state.urgency_level])
+        return sent
+
+    def _alert_admins(self, state, repair_request, breached):
+        from .models import Notification
+        from .notifications import notify_admins
+
+        deadline = timezone.localtime(state.deadline)
+        if breached:
+            title = "Délai de prise en charge dépassé"
+            message = f"La demande #{repair_request.pk} n'a trouvé aucun technicien avant le {deadline:%d/%m à %H:%M}."
+        else:
+            title = "Demande bientôt hors délai"
+            message = (
+                f"La demande #{repair_request.pk} attend toujours un technicien, "
+                f"échéance le {deadline:%d/%m à %H:%M}."
+            )
+        notify_admins(
+            title, message, type=Notification.Type.SYSTEM, request=repair_request,
+            extra_data={
+                "request_id": repair_request.pk,
+                "urgency": state.urgency_level,
+                "deadline": state.deadline.isoformat(),
+                "sla": BREACH if breached else ESCALATE,
+            },
+        )
+
+    def _schedule_offer(self, state, at):
+        if at < state.deadline:
+            self._push(at, state, OFFER)
+
+    def _push(self, at, state, action):
+        heapq.heappush(self._heap, (at.timestamp(), next(self._sequence), state.request_id, state.generation, action))
+        # Au plus trois événements valides par demande : au-delà, surtout des entrées caduques
+        if len(self._heap) > 4 * len(self._tracked) + 64:
+            self._heap = [entry for entry in self._heap if self._is_live(entry)]
+            heapq.heapify(self._heap)
+
+    def _is_live(self, entry):
+        state = self._tracked.get(entry[2])
+        return state is not None and state.generation == entry[3]
+
+
+def publish_tracking(repair_request, pending_since=None):
+    """
+    Signale au planificateur une demande entrée en attente, après validation de la transaction.
+    Sans ``pending_since`` (changement d'urgence), la date de mise en attente déjà suivie est conservée.
+    """
+    _publish({
+        "type": "sla.track",
+        "request_id": repair_request.pk,
+        "urgency_level": repair_request.urgency_level,
+        "pending_since": pending_since.isoformat() if pending_since else None,
+    })
+
+
+def publish_release(request_id):
+    """Signale au planificateur une demande sortie de l'attente."""
+    _publish({"type": "sla.release", "request_id": request_id})
+
+
+def _publish(message):
+    config = sla_settings()
+    if not config.get("PUBLISH_EVENTS"):
+        return
+    channel = config.get("CHANNEL", "dispatch-sla")
+    transaction.on_commit(lambda: _send(channel, message))
+
+
+def _send(channel, message):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.send)(channel, message)
+    except Exception:
+        logger.exception("Échec de la publication %s pour la demande %s", message["type"], message["request_id"])
@@ -0,0 +1,380 @@
+"""
+Index spatial en mémoire des positions des techniciens.
+
+Les positions sont rangées dans une grille régulière en degrés (équivalent d'un
+geohash à précision fixe) : une recherche par rayon ne parcourt que les cellules
+qui intersectent le cercle demandé, et une recherche des k plus proches élargit
+la zone anneau par anneau autour du point de départ.
+
+L'index est partagé par tout le processus. Il est chargé paresseusement depuis la
+base, mis à jour à chaque enregistrement d'un technicien (voir les signaux de
+``models.py``) et rechargé périodiquement pour rattraper les écritures faites par
+les autres workers.
+"""
+import heapq
+import math
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from .utils import KM_PER_DEGREE, bounding_box, haversine_distances, haversine_within_radius
+
+
+@dataclass
+class IndexedTechnician:
+    """Entrée de l'index : le strict nécessaire pour filtrer et trier."""
+
+    id: int
+    user_id: int
+    latitude: float
+    longitude: float
+    specialty: str
+    is_available: bool
+    is_verified: bool
+    service_radius_km: int = 0
+
+    def matches(self, specialty=None, available_only=True, verified_only=False):
+        if available_only and not self.is_available:
+            return False
+        if verified_only and not self.is_verified:
+            return False
+        if specialty and self.specialty != specialty:
+            return False
+        return True
+
+
+class TechnicianSpatialIndex:
+    """Grille spatiale thread-safe des techniciens géolocalisés."""
+
+    def __init__(self, cell_size_deg=0.05, refresh_seconds=300):
+        self.cell_size_deg = cell_size_deg
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.RLock()
+        self._cells = {}
+        self._entries = {}
+        self._cell_bounds = None
+        self._loaded_at = None
+
+    # ------------------------------------------------------------------
+    # Chargement et mises à jour
+    # ------------------------------------------------------------------
+
+    def _cell_key(self, latitude, longitude):
+        return (
+            math.floor(latitude / self.cell_size_deg),
+            math.floor(longitude / self.cell_size_deg),
+        )
+
+    def _insert(self, entry):
+        key = self._cell_key(entry.latitude, entry.longitude)
+        self._cells.setdefault(key, {})[entry.id] = entry
+        self._entries[entry.id] = (key, entry)
+        if self._cell_bounds is None:
+            self._cell_bounds = [key[0], key[0], key[1], key[1]]
+        else:
+            bounds = self._cell_bounds
+            bounds[0] = min(bounds[0], key[0])
+            bounds[1] = max(bounds[1], key[0])
+            bounds[2] = min(bounds[2], key[1])
+            bounds[3] = max(bounds[3], key[1])
+
+    def _discard(self, technician_id):
+        previous = self._entries.pop(technician_id, None)
+        if previous is None:
+            return
+        key, _ = previous
+        cell = self._cells.get(key)
+        if cell is not None:
+            cell.pop(technician_id, None)
+            if not cell:
+                del self._cells[key]
+
+    @staticmethod
+    def entry_from_technician(technician):
+        """Construit une entrée depuis une instance ``Technician``, ou None sans position."""
+        if technician.current_latitude is None or technician.current_longitude is None:
+            return None
+        return IndexedTechnician(
+            id=technician.id,
+            user_id=technician.user_id,
+            latitude=float(technician.current_latitude),
+            longitude=float(technician.current_longitude),
+            specialty=technician.specialty,
+            is_available=technician.is_available,
+            is_verified=technician.is_verified,
+            service_radius_km=technician.service_radius_km or 0,
+        )
+
+    def load(self, entries):
+        """Remplace tout le contenu de l'index."""
+        with self._lock:
+            self._cells = {}
+            self._entries = {}
+            self._cell_bounds = None
+            for entry in entries:
+                self._insert(entry)
+            self._loaded_at = time.monotonic()
+
+    def load_from_database(self):
+        from .models import Technician
+
+        rows = Technician.objects.filter(
+            current_latitude__isnull=False,
+            current_longitude__isnull=False,
+        ).values_list(
+            "id", "user_id", "current_latitude", "current_longitude",
+            "specialty", "is_available", "is_verified", "service_radius_km",
+        )
+        self.load(
+            IndexedTechnician(
+                id=row[0], user_id=row[1], latitude=float(row[2]), longitude=float(row[3]),
+                specialty=row[4], is_available=row[5], is_verified=row[6],
+                service_radius_km=row[7] or 0,
+            )
+            for row in rows.iterator(chunk_size=2000)
+        )
+
+    def ensure_loaded(self):
+        with self._lock:
+            expired = (
+                self._loaded_at is None
+                or time.monotonic() - self._loaded_at > self.refresh_seconds
+            )
+            if expired:
+                self.load_from_database()
+
+    def invalidate(self):
+        """Force un rechargement complet à la prochaine requête."""
+        with self._lock:
+            self._loaded_at = None
+
+    @property
+    def is_loaded(self):
+        return self._loaded_at is not None
+
+    def upsert(self, entry):
+        with self._lock:
+            self._discard(entry.id)
+            self._insert(entry)
+
+    def upsert_technician(self, technician):
+        """Reflète l'état d'une instance ``Technician`` (position, disponibilité...)."""
+        entry = self.entry_from_technician(technician)
+        with self._lock:
+            if entry is None:
+                self._discard(technician.id)
+            else:
+                self.upsert(entry)
+
+    def update_position(self, technician_id, latitude, longitude):
+        """Déplace un technicien déjà indexé ; retourne False s'il est inconnu."""
+        with self._lock:
+            previous = self._entries.get(technician_id)
+            if previous is None:
+                return False
+            _, entry = previous
+            self._discard(technician_id)
+            entry.latitude = float(latitude)
+            entry.longitude = float(longitude)
+            self._insert(entry)
+            return True
+
+    def remove(self, technician_id):
+        with self._lock:
+            self._discard(technician_id)
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ------------------------------------------------------------------
+    # Requêtes
+    # ------------------------------------------------------------------
+
+    def _cells_in_window(self, lat_min, lat_max, lon_min, lon_max):
+        i_min, j_min = self._cell_key(lat_min, lon_min)
+        i_max, j_max = self._cell_key(lat_max, lon_max)
+        cell_count = (i_max - i_min + 1) * (j_max - j_min + 1)
+        if cell_count > len(self._cells):
+            # Fenêtre plus large que la grille peuplée : on parcourt les cellules existantes
+            for (i, j), cell in self._cells.items():
+                if i_min <= i <= i_max and j_min <= j <= j_max:
+                    yield cell
+            return
+        for i in range(i_min, i_max + 1):
+            for j in range(j_min, j_max + 1):
+                cell = self._cells.get((i, j))
+                if cell:
+                    yield cell
+
+    def _ring(self, center, radius):
+        ci, cj = center
+        if radius == 0:
+            cell = self._cells.get(center)
+            if cell:
+                yield cell
+            return
+        for j in range(cj - radius, cj + radius + 1):
+            for i in (ci - radius, ci + radius):
+                cell = self._cells.get((i, j))
+                if cell:
+                    yield cell
+        for i in range(ci - radius + 1, ci + radius):
+            for j in (cj - radius, cj + radius):
+                cell = self._cells.get((i, j))
+                if cell:
+                    yield cell
+
+    @staticmethod
+    def _distances(latitude, longitude, entries):
+        if not entries:
+            return ()
+        return haversine_distances(
+            latitude, longitude,
+            [entry.latitude for entry in entries],
+            [entry.longitude for entry in entries],
+        )
+
+    def within_radius(self, latitude, longitude, radius_km=None, specialty=None,
+                      available_only=True, verified_only=False):
+        """
+        Techniciens situés à moins de ``radius_km`` du point, triés par distance.
+
+        Retourne une liste de couples ``(IndexedTechnician, distance_km)``.
+        Sans rayon, tous les techniciens correspondant aux filtres sont retournés.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            if radius_km is None:
+                cells = list(self._cells.values())
+            else:
+                cells = list(self._cells_in_window(*bounding_box(latitude, longitude, radius_km)))
+            candidates = [
+                entry
+                for cell in cells
+                for entry in cell.values()
+                if entry.matches(specialty, available_only, verified_only)
+            ]
+        distances = self._distances(latitude, longitude, candidates)
+        results = [
+            (entry, float(distance))
+            for entry, distance in zip(candidates, distances)
+            if radius_km is None or distance <= radius_km
+        ]
+        results.sort(key=lambda item: item[1])
+        return results
+
+    def nearest(self, latitude, longitude, k=1, specialty=None, available_only=True,
+                verified_only=False, max_radius_km=None):
+        """
+        Les ``k`` techniciens les plus proches du point, triés par distance.
+
+        La recherche progresse anneau par anneau et s'arrête dès que l'anneau
+        suivant ne peut plus contenir de technicien plus proche que le k-ième trouvé.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            if not self._cells:
+                return []
+            center = self._cell_key(latitude, longitude)
+            bounds = self._cell_bounds
+            max_ring = max(
+                abs(center[0] - bounds[0]), abs(center[0] - bounds[1]),
+                abs(center[1] - bounds[2]), abs(center[1] - bounds[3]),
+            )
+            # Plus petite dimension d'une cellule, en km, sur la plage de latitudes peuplées
+            extreme_lat = max(abs(bounds[0]), abs(bounds[1] + 1), abs(center[0]), abs(center[0] + 1))
+            cos_min = max(math.cos(math.radians(min(extreme_lat * self.cell_size_deg, 90.0))), 1e-6)
+            cell_km = self.cell_size_deg * KM_PER_DEGREE * cos_min
+
+            best = []  # tas max sur la distance : (-distance, id, entry)
+            for ring in range(max_ring + 1):
+                # Toute cellule de cet anneau est à au moins (ring - 1) cellules du point
+                floor_km = max(ring - 1, 0) * cell_km
+                if len(best) >= k and -best[0][0] <= floor_km:
+                    break
+                if max_radius_km is not None and floor_km > max_radius_km:
+                    break
+                candidates = [
+                    entry
+                    for cell in self._ring(center, ring)
+                    for entry in cell.values()
+                    if entry.matches(specialty, available_only, verified_only)
+                ]
+                for entry, distance in zip(candidates, self._distances(latitude, longitude, candidates)):
+                    distance = float(distance)
+                    if max_radius_km is not None and distance > max_radius_km:
+                        continue
+                    item = (-distance, entry.id, entry)
+                    if len(best) < k:
+                        heapq.heappush(best, item)
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, item)
+        return [(entry, -neg) for neg, _, entry in sorted(best, reverse=True)]
+
+
+def hydrate_technicians(results, queryset=None):
+    """
+    Charge les instances ``Technician`` correspondant à un résultat d'index.
+
+    L'ordre est conservé et la distance est exposée dans ``distance_km``.
+    Les techniciens supprimés entre-temps sont ignorés.
+    """
+    from .models import Technician
+
+    if queryset is None:
+        queryset = Technician.objects.select_related("user")
+    by_id = queryset.in_bulk([entry.id for entry, _ in results])
+    technicians = []
+    for entry, distance in results:
+        technician = by_id.get(entry.id)
+        if technician is not None:
+            technician.distance_km = round(distance, 2)
+            technicians.append(technician)
+    return technicians
+
+
+def technicians_within_radius(latitude, longitude, radius_km, queryset, specialty=None,
+                              verified_only=False):
+    """
+    Techniciens disponibles à moins de ``radius_km`` du point, triés par distance.
+
+    Passe par l'index spatial lorsqu'il est activé. Sinon la recherche se fait en
+    base : préfiltre SQL par boîte englobante (index latitude/longitude), puis
+    distance exacte vectorisée sur les seules lignes retenues.
+    """
+    if _geo_settings.get("SPATIAL_INDEX_ENABLED", True):
+        results = technician_index.within_radius(
+            latitude, longitude, radius_km,
+            specialty=specialty, verified_only=verified_only,
+        )
+        return hydrate_technicians(results, queryset)
+
+    queryset = queryset.filter(is_available=True)
+    if specialty:
+        queryset = queryset.filter(specialty=specialty)
+    if verified_only:
+        queryset = queryset.filter(is_verified=True)
+    candidates = list(queryset.within_bounding_box(latitude, longitude, radius_km))
+    distances, in_range = haversine_within_radius(
+        latitude, longitude,
+        [t.current_latitude for t in candidates],
+        [t.current_longitude for t in candidates],
+        radius_km,
+    )
+    technicians = []
+    for technician, distance, ok in zip(candidates, distances, in_range):
+        if ok:
+            technician.distance_km = round(float(distance), 2)
+            technicians.append(technician)
+    technicians.sort(key=lambda t: t.distance_km)
+    return technicians
+
+
+_geo_settings = getattr(settings, "GEOLOCATION_SETTINGS", {})
+
+technician_index = TechnicianSpatialIndex(
+    cell_size_deg=_geo_settings.get("SPATIAL_INDEX_CELL_DEGREES", 0.05),
+    refresh_seconds=_geo_settings.get("SPATIAL_INDEX_REFRESH_SECONDS", 300),
+)
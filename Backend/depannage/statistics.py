@@ -0,0 +1,269 @@
+"""
+Instantané des statistiques du tableau de bord administrateur.
+
+Les statistiques sont calculées en un nombre fixe de requêtes agrégées et
+stockées dans ``StatisticsSnapshot``. ``project_statistics`` et les exports
+Excel/PDF lisent l'instantané au lieu de parcourir les tables à chaque appel.
+
+L'instantané est recalculé :
+- par la commande ``refresh_statistics`` (à planifier, par exemple en cron) ;
+- à la lecture lorsqu'il dépasse ``MAX_AGE_SECONDS`` ;
+- à la lecture lorsqu'une modification a été signalée (voir les signaux de
+  ``models.py``) et qu'il a plus de ``MIN_REFRESH_SECONDS``.
+"""
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+PROJECT_STATISTICS_KEY = "project_statistics"
+DIRTY_CACHE_KEY = "statistics_snapshot:dirty"
+
+DEFAULT_STATISTICS_SETTINGS = {
+    "MAX_AGE_SECONDS": 900,
+    "MIN_REFRESH_SECONDS": 60,
+}
+
+
+def get_statistics_settings():
+    return {**DEFAULT_STATISTICS_SETTINGS, **getattr(settings, "STATISTICS_SETTINGS", {})}
+
+
+def _as_float(value):
+    return float(value) if isinstance(value, Decimal) else (value or 0)
+
+
+def compute_project_statistics(now=None):
+    """Calcule toutes les statistiques du tableau de bord en passes agrégées uniques."""
+    from users.models import User
+    from users.rollups import security_totals
+    from .models import Payment, RepairRequest, Review, Technician
+
+    now = now or timezone.now()
+    last_30_days = now - timedelta(days=30)
+    last_7_days = now - timedelta(days=7)
+    last_24_hours = now - timedelta(hours=24)
+
+    users = User.objects.aggregate(
+        total=Count("id"),
+        clients=Count("id", filter=Q(user_type="client")),
+        technicians=Count("id", filter=Q(user_type="technician")),
+        admins=Count("id", filter=Q(user_type="admin")),
+    )
+    active_users_30d = User.objects.filter(
+        Q(client_profile__repair_requests__created_at__gte=last_30_days)
+        | Q(technician_depannage__repair_requests__created_at__gte=last_30_days)
+    ).distinct().count()
+
+    requests = RepairRequest.objects.aggregate(
+        total=Count("id"),
+        pending=Count("id", filter=Q(status="pending")),
+        in_progress=Count("id", filter=Q(status="in_progress")),
+        completed=Count("id", filter=Q(status="completed")),
+        cancelled=Count("id", filter=Q(status="cancelled")),
+        recent_24h=Count("id", filter=Q(created_at__gte=last_24_hours)),
+        recent_7d=Count("id", filter=Q(created_at__gte=last_7_days)),
+        recent_30d=Count("id", filter=Q(created_at__gte=last_30_days)),
+    )
+
+    # Évolution sur 7 jours (aujourd'hui inclus) en une seule requête groupée
+    today = timezone.localdate(now)
+    first_day = today - timedelta(days=6)
+    per_day = dict(
+        RepairRequest.objects.filter(created_at__date__gte=first_day)
+        .annotate(day=TruncDate("created_at"))
+        .values("day")
+        .annotate(count=Count("id"))
+        .values_list("day", "count")
+    )
+    daily_requests = [
+        {"date": day.strftime("%Y-%m-%d"), "count": per_day.get(day, 0)}
+        for day in (first_day + timedelta(days=offset) for offset in range(7))
+    ]
+
+    payments = Payment.objects.filter(status="completed").aggregate(
+        revenue=Sum("amount", filter=Q(payment_type="client_payment")),
+        payouts=Sum("amount", filter=Q(payment_type="technician_payout")),
+    )
+    total_revenue = payments["revenue"] or Decimal("0.00")
+    total_payouts = payments["payouts"] or Decimal("0.00")
+    payment_methods = [
+        {**row, "total": _as_float(row["total"])}
+        for row in Payment.objects.filter(status="completed")
+        .values("method")
+        .annotate(count=Count("id"), total=Sum("amount"))
+        .order_by("-total")
+    ]
+
+    specialty_stats = [
+        {**row, "avg_price": _as_float(row["avg_price"]) if row["avg_price"] is not None else None}
+        for row in RepairRequest.objects.values("specialty_needed")
+        .annotate(
+            count=Count("id"),
+            completed=Count("id", filter=Q(status="completed")),
+            avg_price=Avg("final_price"),
+        )
+        .order_by("-count")
+    ]
+
+    technicians = Technician.objects.aggregate(
+        verified=Count("id", filter=Q(is_verified=True)),
+        available=Count("id", filter=Q(is_verified=True, is_available=True)),
+    )
+    top_technicians = (
+        Technician.objects.filter(is_verified=True, jobs_completed_count__gt=0)
+        .select_related("user")
+        .annotate(
+            total_earnings=Sum(
+                "repair_requests__payments__amount",
+                filter=Q(repair_requests__payments__status="completed"),
+            )
+        )
+        .order_by("-jobs_completed_count")[:10]
+    )
+
+    reviews = Review.objects.aggregate(
+        total=Count("id"),
+        avg=Avg("rating"),
+        satisfied=Count("id", filter=Q(rating__gte=4)),
+    )
+    avg_rating = reviews["avg"] or 0
+    satisfaction_rate = (reviews["satisfied"] / reviews["total"] * 100) if reviews["total"] else 0
+
+    # Agrégats du journal d'audit (le journal brut peut être archivé)
+    security = security_totals()
+    login_attempts = security["total_logins"] + security["failed_logins"]
+
+    city_stats = list(
+        RepairRequest.objects.values("city")
+        .annotate(count=Count("id"))
+        .filter(city__isnull=False)
+        .exclude(city="")
+        .order_by("-count")[:10]
+    )
+
+    return {
+        "overview": {
+            "total_users": users["total"],
+            "total_clients": users["clients"],
+            "total_technicians": users["technicians"],
+            "total_admins": users["admins"],
+            "active_users_30d": active_users_30d,
+            "total_requests": requests["total"],
+            "completed_requests": requests["completed"],
+            "total_revenue": float(total_revenue),
+            "platform_fees": float(total_revenue - total_payouts),
+            "avg_rating": round(avg_rating, 1),
+            "satisfaction_rate": round(satisfaction_rate, 1),
+        },
+        "requests": {
+            "total": requests["total"],
+            "pending": requests["pending"],
+            "in_progress": requests["in_progress"],
+            "completed": requests["completed"],
+            "cancelled": requests["cancelled"],
+            "recent_24h": requests["recent_24h"],
+            "recent_7d": requests["recent_7d"],
+            "recent_30d": requests["recent_30d"],
+            "daily_evolution": daily_requests,
+        },
+        "financial": {
+            "total_revenue": float(total_revenue),
+            "total_payouts": float(total_payouts),
+            "platform_fees": float(total_revenue - total_payouts),
+            "payment_methods": payment_methods,
+        },
+        "specialties": {
+            "stats": specialty_stats,
+            "top_technicians": [
+                {
+                    "id": tech.id,
+                    "name": tech.user.get_full_name() or tech.user.username,
+                    "specialty": tech.get_specialty_display(),
+                    "total_jobs": tech.jobs_completed_count,
+                    "avg_rating": tech.average_rating,
+                    "total_earnings": float(tech.total_earnings or 0),
+                }
+                for tech in top_technicians
+            ],
+        },
+        "technicians": {
+            "total": users["technicians"],
+            "verified": technicians["verified"],
+            "available": technicians["available"],
+            "availability_rate": round(
+                (technicians["available"] / technicians["verified"] * 100) if technicians["verified"] else 0, 1
+            ),
+        },
+        "satisfaction": {
+            "total_reviews": reviews["total"],
+            "avg_rating": round(avg_rating, 1),
+            "satisfaction_rate": round(satisfaction_rate, 1),
+        },
+        "security": {
+            "total_logins": security["total_logins"],
+            "failed_logins": security["failed_logins"],
+            "security_alerts": security["security_alerts"],
+            "success_rate": round(
+                (security["total_logins"] / login_attempts * 100) if login_attempts else 0, 1
+            ),
+        },
+        "geography": {
+            "top_cities": city_stats,
+        },
+    }
+
+
+def refresh_statistics_snapshot():
+    """Recalcule et enregistre l'instantané ; retourne l'instance mise à jour."""
+    from .models import StatisticsSnapshot
+
+    cache.delete(DIRTY_CACHE_KEY)
+    started = time.perf_counter()
+    now = timezone.now()
+    data = compute_project_statistics(now)
+    snapshot, _ = StatisticsSnapshot.objects.update_or_create(
+        key=PROJECT_STATISTICS_KEY,
+        defaults={
+            "data": data,
+            "computed_at": now,
+            "computation_ms": int((time.perf_counter() - started) * 1000),
+        },
+    )
+    return snapshot
+
+
+def mark_statistics_dirty():
+    """Signale qu'une donnée source a changé ; l'instantané sera recalculé à la prochaine lecture."""
+    cache.set(DIRTY_CACHE_KEY, True, timeout=None)
+
+
+def get_statistics_snapshot(force_refresh=False):
+    """Retourne l'instantané courant, recalculé seulement s'il est trop ancien ou invalidé."""
+    from .models import StatisticsSnapshot
+
+    config = get_statistics_settings()
+    snapshot = StatisticsSnapshot.objects.filter(key=PROJECT_STATISTICS_KEY).first()
+    if snapshot is None or force_refresh:
+        return refresh_statistics_snapshot()
+    age = snapshot.age_seconds
+    if age > config["MAX_AGE_SECONDS"]:
+        return refresh_statistics_snapshot()
+    if age > config["MIN_REFRESH_SECONDS"] and cache.get(DIRTY_CACHE_KEY):
+        return refresh_statistics_snapshot()
+    return snapshot
+
+
+def snapshot_freshness(snapshot):
+    """Métadonnées de fraîcheur exposées avec les statistiques."""
+    return {
+        "computed_at": snapshot.computed_at.isoformat(),
+        "age_seconds": round(snapshot.age_seconds, 1),
+        "computation_ms": snapshot.computation_ms,
+        "has_pending_changes": bool(cache.get(DIRTY_CACHE_KEY)),
+    }
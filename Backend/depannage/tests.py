@@ -1,12 +1,18 @@
-from django.test import TestCase
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, override_settings
 from .models import SystemConfiguration, Technician, TechnicianSubscription, CinetPayPayment
 from django.utils import timezone
 from rest_framework.test import APIClient
 import json
+import os
+import unittest
 from django.contrib.auth import get_user_model
 
 # Create your tests here.
 
+# File seule, comme avec des workers run_jobs : un TestCase ne valide jamais sa transaction
+QUEUE_ONLY_JOBS = override_settings(JOB_SETTINGS={**settings.JOB_SETTINGS, "IN_PROCESS_WORKERS": 0, "EAGER": False})
+
 class SystemConfigurationTestCase(TestCase):
     def setUp(self):
         SystemConfiguration.objects.create(
@@ -115,3 +121,1154 @@ class NewTechnicianSubscriptionTest(TestCase):
         sub = subs.first()
         self.assertTrue(sub.is_active)
         self.assertEqual(sub.payment, self.payment)
+
+
+class TechnicianSpatialIndexTest(TestCase):
+    def setUp(self):
+        import random
+        from .spatial_index import TechnicianSpatialIndex, IndexedTechnician
+        rng = random.Random(42)
+        self.entries = [
+            IndexedTechnician(
+                id=i, user_id=i,
+                latitude=12.64 + rng.uniform(-0.3, 0.3),
+                longitude=-8.0 + rng.uniform(-0.3, 0.3),
+                specialty=rng.choice(["electrician", "plumber"]),
+                is_available=rng.random() > 0.2,
+                is_verified=True,
+            )
+            for i in range(500)
+        ]
+        self.index = TechnicianSpatialIndex(cell_size_deg=0.05, refresh_seconds=3600)
+        self.index.load(self.entries)
+
+    def brute_force(self, lat, lon, specialty=None):
+        from .utils import calculate_distance
+        return sorted(
+            (calculate_distance(lat, lon, e.latitude, e.longitude), e.id)
+            for e in self.entries
+            if e.is_available and (specialty is None or e.specialty == specialty)
+        )
+
+    def test_radius_query_matches_brute_force(self):
+        """La recherche par rayon retourne exactement les techniciens du cercle, triés."""
+        expected = [i for d, i in self.brute_force(12.65, -8.01, "plumber") if d <= 7]
+        results = self.index.within_radius(12.65, -8.01, 7, specialty="plumber")
+        self.assertEqual([entry.id for entry, _ in results], expected)
+
+    def test_nearest_matches_brute_force_and_follows_moves(self):
+        """Les k plus proches correspondent au calcul exhaustif, y compris après déplacement."""
+        expected = [i for _, i in self.brute_force(12.5, -7.9)[:5]]
+        self.assertEqual([e.id for e, _ in self.index.nearest(12.5, -7.9, k=5)], expected)
+        mover = next(e for e in self.entries if e.is_available)
+        self.index.update_position(mover.id, 30.0, 10.0)
+        nearest = self.index.nearest(30.0, 10.0, k=1)
+        self.assertEqual(nearest[0][0].id, mover.id)
+        self.assertAlmostEqual(nearest[0][1], 0.0)
+
+
+class BatchHaversineTest(TestCase):
+    def test_batch_matches_scalar_distance(self):
+        """Les distances vectorisées et le masque de rayon correspondent au calcul scalaire."""
+        from .utils import calculate_distance, haversine_within_radius, pairwise_haversine_distances
+        lats = [12.64, 12.70, 13.10]
+        lons = [-8.00, -7.95, -8.40]
+        radii = [5, 10, 20]
+        distances, mask = haversine_within_radius(12.65, -8.01, lats, lons, radii)
+        expected = [calculate_distance(12.65, -8.01, lat, lon) for lat, lon in zip(lats, lons)]
+        for got, want in zip(distances, expected):
+            self.assertAlmostEqual(got, want, places=6)
+        self.assertEqual(list(mask), [d <= r for d, r in zip(expected, radii)])
+        matrix = pairwise_haversine_distances([12.65, 12.0], [-8.01, -8.0], lats, lons)
+        self.assertEqual(matrix.shape, (2, 3))
+        self.assertAlmostEqual(matrix[0, 2], expected[2], places=6)
+
+
+class BoundingBoxPrefilterTest(TestCase):
+    def test_bounding_box_keeps_only_nearby_technicians(self):
+        """Le préfiltre SQL écarte les techniciens hors de la boîte englobant le rayon."""
+        User = get_user_model()
+        positions = [(12.64, -8.00), (12.70, -8.00), (13.50, -8.00), (12.64, -9.50)]
+        for i, (lat, lon) in enumerate(positions):
+            user = User.objects.create_user(username=f"geo{i}", email=f"geo{i}@example.com", password="x")
+            Technician.objects.create(user=user, current_latitude=lat, current_longitude=lon, service_radius_km=10)
+        inside = Technician.objects.within_bounding_box(12.64, -8.00, 10)
+        self.assertEqual(
+            sorted(inside.values_list("current_latitude", flat=True)), [12.64, 12.70]
+        )
+        self.assertEqual(Technician.objects.within_service_radius_of(12.64, -8.00).count(), 2)
+
+
+class TechnicianStatsCountersTest(TestCase):
+    def setUp(self):
+        from .models import Client
+        User = get_user_model()
+        tech_user = User.objects.create_user(username="stats_tech", email="stats_tech@example.com", password="x")
+        client_user = User.objects.create_user(username="stats_client", email="stats_client@example.com", password="x")
+        self.technician = Technician.objects.create(user=tech_user)
+        self.client_profile = Client.objects.create(user=client_user, address="Bamako")
+
+    def create_request(self, status):
+        from .models import RepairRequest
+        return RepairRequest.objects.create(
+            client=self.client_profile, technician=self.technician,
+            title="Panne", address="Bamako", status=status,
+        )
+
+    def test_counters_follow_reviews_and_status_changes(self):
+        """Les compteurs suivent avis et changements de statut ; la réconciliation corrige la dérive."""
+        from django.core.management import call_command
+        from .models import RepairRequest, Review
+        done = self.create_request(RepairRequest.Status.ASSIGNED)
+        other = self.create_request(RepairRequest.Status.ASSIGNED)
+        done.status = RepairRequest.Status.COMPLETED
+        done.save()
+        review = Review.objects.create(request=done, client=self.client_profile, technician=self.technician, rating=4)
+        review.rating = 5
+        review.save()
+
+        self.technician.refresh_from_db()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.technician.average_rating, 5.0)
+            self.assertEqual(self.technician.total_jobs_completed, 1)
+            self.assertEqual(self.technician.success_rate, 50.0)
+
+        other.delete()
+        Technician.objects.filter(pk=self.technician.pk).update(rating_count=7)
+        call_command("reconcile_technician_stats", stdout=open(os.devnull, "w"))
+        self.technician.refresh_from_db()
+        self.assertEqual((self.technician.rating_count, self.technician.jobs_handled_count), (1, 1))
+
+    def test_stale_instance_save_keeps_counters(self):
+        """Un enregistrement complet d'une instance chargée avant un changement ne réécrit pas les compteurs."""
+        from .models import RepairRequest
+        stale = Technician.objects.get(pk=self.technician.pk)
+        request = self.create_request(RepairRequest.Status.PENDING)
+        request.assign_to_technician(self.technician)
+        stale.bio = "Plombier"
+        stale.save()
+        request.complete_work()
+        stale.save()
+
+        self.technician.refresh_from_db()
+        self.assertEqual(self.technician.bio, "Plombier")
+        self.assertEqual(
+            (self.technician.jobs_handled_count, self.technician.jobs_completed_count,
+             self.technician.active_jobs_count),
+            (1, 1, 0),
+        )
+
+
+class StatisticsSnapshotTest(TestCase):
+    def test_snapshot_is_reused_until_stale(self):
+        """L'instantané est relu sans recalcul tant qu'il est frais, puis recalculé après une modification."""
+        from datetime import timedelta
+        from .models import StatisticsSnapshot
+        from .statistics import get_statistics_snapshot, mark_statistics_dirty
+
+        first = get_statistics_snapshot()
+        self.assertIn("daily_evolution", first.data["requests"])
+        self.assertEqual(len(first.data["requests"]["daily_evolution"]), 7)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_statistics_snapshot().computed_at, first.computed_at)
+
+        mark_statistics_dirty()
+        StatisticsSnapshot.objects.filter(pk=first.pk).update(computed_at=timezone.now() - timedelta(minutes=5))
+        self.assertGreater(get_statistics_snapshot().computed_at, first.computed_at)
+
+
+try:
+    import channels_redis  # noqa: F401
+    import fakeredis  # noqa: F401
+    import lupa  # noqa: F401  (EVAL utilisé par channels_redis)
+    HAS_FAKE_REDIS = True
+except ImportError:
+    HAS_FAKE_REDIS = False
+
+
+@unittest.skipUnless(HAS_FAKE_REDIS, "channels_redis et fakeredis[lua] requis")
+class RedisFanOutTest(TestCase):
+    def setUp(self):
+        from auth.redis_config import start_fake_redis_server
+        self.redis_url = start_fake_redis_server()
+
+    def test_group_message_crosses_workers(self):
+        """Un message de groupe envoyé par un worker est reçu par un autre via Redis."""
+        import asyncio
+        from asgiref.sync import async_to_sync
+        from channels_redis.core import RedisChannelLayer
+
+        async def scenario():
+            worker_a = RedisChannelLayer(hosts=[self.redis_url])
+            worker_b = RedisChannelLayer(hosts=[self.redis_url])
+            channel = await worker_a.new_channel()
+            await worker_a.group_add("user_42", channel)
+            await worker_b.group_send("user_42", {"type": "send.notification", "content": {"title": "Test"}})
+            message = await asyncio.wait_for(worker_a.receive(channel), timeout=5)
+            await worker_a.flush()
+            return message
+
+        message = async_to_sync(scenario)()
+        self.assertEqual(message["content"], {"title": "Test"})
+
+    def test_cache_is_shared_between_clients(self):
+        """Deux instances du cache Redis (deux workers) voient les mêmes clés."""
+        from django.core.cache.backends.redis import RedisCache
+        from auth.redis_config import build_cache_settings
+
+        config = build_cache_settings(self.redis_url)["default"]
+        params = {"TIMEOUT": config["TIMEOUT"], "KEY_PREFIX": config["KEY_PREFIX"], "OPTIONS": config["OPTIONS"]}
+        worker_a = RedisCache(self.redis_url, params)
+        worker_b = RedisCache(self.redis_url, params)
+        worker_a.set("statistics_snapshot:dirty", True)
+        self.assertTrue(worker_b.get("statistics_snapshot:dirty"))
+
+
+class LocationWriteBufferTest(TestCase):
+    def test_positions_are_coalesced_and_written_in_batch(self):
+        """Seule la dernière position de chaque technicien est écrite, en un nombre fixe de requêtes."""
+        from .location_buffer import LocationWriteBuffer, write_technician_positions
+        from .models import TechnicianLocation
+        User = get_user_model()
+        technicians = [
+            Technician.objects.create(
+                user=User.objects.create_user(username=f"gps{i}", email=f"gps{i}@example.com", password="x")
+            )
+            for i in range(2)
+        ]
+        TechnicianLocation.objects.create(technician=technicians[0], latitude=0, longitude=0)
+        buffer = LocationWriteBuffer("test", write_technician_positions, flush_interval=0)
+        for step in range(20):
+            for technician in technicians:
+                buffer.record(technician.id, 12.6 + step * 0.001, -8.0)
+        buffer.record(999999, 12.6, -8.0)  # technicien inexistant : ignoré
+
+        with self.assertNumQueries(5):
+            self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(buffer.pending_count(), 0)
+        for technician in technicians:
+            technician.refresh_from_db()
+            self.assertAlmostEqual(technician.current_latitude, 12.619)
+            self.assertAlmostEqual(technician.location.latitude, 12.619)
+        self.assertFalse(buffer.record(technicians[0].id, 12.6191, -8.0))
+
+        # Déconnexion d'un technicien : seule sa position est écrite, les autres restent groupées
+        buffer.record(technicians[0].id, 12.7, -8.0)
+        buffer.record(technicians[1].id, 12.7, -8.0)
+        self.assertEqual(buffer.flush(technicians[0].id), 1)
+        self.assertEqual(buffer.flush(technicians[0].id), 0)
+        self.assertEqual(buffer.pending_count(), 1)
+        technicians[1].refresh_from_db()
+        self.assertAlmostEqual(technicians[1].current_latitude, 12.619)
+
+
+class ChatConsumerAccessCacheTest(TransactionTestCase):
+    def test_membership_is_checked_once_and_revoked_on_archive(self):
+        """Les messages ne relisent pas la conversation ; l'archivage ferme la connexion."""
+        from asgiref.sync import async_to_sync
+        from channels.db import database_sync_to_async
+        from channels.testing import WebsocketCommunicator
+        from unittest import mock
+        from .consumers import ChatConsumer
+        from .models import ChatConversation, ChatMessage
+        User = get_user_model()
+        client = User.objects.create_user(username="chatclient", email="cc@example.com", password="x")
+        technician = User.objects.create_user(username="chattech", email="ct@example.com", password="x")
+        conversation = ChatConversation.objects.create(client=client, technician=technician)
+
+        async def scenario():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f"/ws/chat/{conversation.id}/")
+            communicator.scope["user"] = client
+            communicator.scope["url_route"] = {"kwargs": {"conversation_id": str(conversation.id)}}
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            for content in ("Bonjour", "Vous arrivez quand ?"):
+                await communicator.send_json_to({"type": "message", "content": content})
+                message = await communicator.receive_json_from()
+                self.assertEqual(message["message"]["sender_name"], "chatclient")
+
+            conversation.is_active = False
+            await database_sync_to_async(conversation.save)()
+            self.assertIn("error", await communicator.receive_json_from())
+            self.assertEqual((await communicator.receive_output())["type"], "websocket.close")
+
+        with mock.patch.object(
+            ChatConsumer, "get_conversation_access", autospec=True, side_effect=ChatConsumer.get_conversation_access
+        ) as access_lookup:
+            async_to_sync(scenario)()
+        self.assertEqual(access_lookup.call_count, 1)
+        self.assertEqual(ChatMessage.objects.filter(conversation=conversation).count(), 2)
+
+    def test_access_change_is_broadcast_only_when_membership_changes(self):
+        """Un save() qui ne touche ni aux participants ni à is_active ne prévient pas les sockets."""
+        from unittest import mock
+        from .models import ChatConversation
+        User = get_user_model()
+        client = User.objects.create_user(username="quietclient", email="qc@example.com", password="x")
+        technician = User.objects.create_user(username="quiettech", email="qt@example.com", password="x")
+        conversation = ChatConversation.objects.create(client=client, technician=technician)
+        layer = mock.Mock(group_send=mock.AsyncMock())
+        with mock.patch("depannage.models.get_channel_layer", return_value=layer):
+            conversation.last_message_at = timezone.now()
+            conversation.save()
+            ChatConversation.objects.get(pk=conversation.pk).save()
+            self.assertEqual(layer.group_send.call_count, 0)
+
+            conversation.is_active = False
+            conversation.save()
+            conversation.save()
+        self.assertEqual(layer.group_send.call_count, 1)
+        self.assertFalse(layer.group_send.call_args.args[1]["access"]["is_active"])
+
+
+class ChatPersistencePipelineTest(TransactionTestCase):
+    def test_concurrent_messages_are_written_in_one_ordered_batch(self):
+        """Des envois simultanés sont écrits en un lot, dans l'ordre, avec leurs ids rendus aux expéditeurs."""
+        import asyncio
+        from asgiref.sync import async_to_sync
+        from unittest import mock
+        from .chat_pipeline import ChatPersistencePipeline
+        from .models import ChatConversation, ChatMessage
+        User = get_user_model()
+        users = [
+            User.objects.create_user(username=f"pipe{i}", email=f"pipe{i}@example.com", password="x")
+            for i in range(3)
+        ]
+        first = ChatConversation.objects.create(client=users[0], technician=users[1])
+        second = ChatConversation.objects.create(client=users[2], technician=users[1])
+        earlier = ChatMessage.objects.create(conversation=first, sender=users[1], content="Je suis en route")
+        pipeline = ChatPersistencePipeline(flush_interval=0.01)
+
+        async def scenario():
+            return await asyncio.gather(
+                pipeline.mark_read(first.id, users[0].id, earlier.id),
+                *(
+                    pipeline.save_message(conversation_id=conversation.id, sender_id=users[0].id, content=str(i))
+                    for i, conversation in enumerate([first, second, first, first])
+                ),
+                pipeline.save_message(conversation_id=first.id, sender_id=users[0].id, content=None),
+                return_exceptions=True,
+            )
+
+        with mock.patch.object(pipeline, "persist", wraps=pipeline.persist) as persist:
+            results = async_to_sync(scenario)()
+        self.assertEqual(persist.call_count, 1)
+        saved, rejected = results[1:-1], results[-1]
+        self.assertIsInstance(rejected, Exception)
+        self.assertEqual([m.content for m in saved], ["0", "1", "2", "3"])
+        self.assertEqual([m.id for m in saved], sorted(m.id for m in saved))
+        self.assertEqual(
+            list(first.messages.values_list("content", flat=True).order_by("id")),
+            ["Je suis en route", "0", "2", "3"],
+        )
+        first.refresh_from_db()
+        self.assertEqual(first.last_message_at, saved[3].created_at)
+        earlier.refresh_from_db()
+        self.assertTrue(earlier.is_read)
+
+
+class NotificationDispatchTest(TestCase):
+    def test_bulk_notifications_are_pushed_after_commit(self):
+        """Insertion en une requête, puis un push WebSocket par destinataire après validation."""
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from .models import Notification
+        from .notifications import notify_many
+        User = get_user_model()
+        recipients = [
+            User.objects.create_user(username=f"notif{i}", email=f"notif{i}@example.com", password="x")
+            for i in range(5)
+        ]
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(f"user_{recipients[3].id}", channel)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertNumQueries(1):
+                created = notify_many(
+                    [user.id for user in recipients], "Nouvelle demande urgente", "Fuite d'eau", Notification.Type.URGENT_REQUEST
+                )
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(Notification.objects.filter(type=Notification.Type.URGENT_REQUEST).count(), 5)
+        message = async_to_sync(channel_layer.receive)(channel)
+        self.assertEqual(message["content"]["id"], created[3].id)
+        self.assertEqual(message["content"]["title"], "Nouvelle demande urgente")
+
+
+class ChatInboxQueryCountTest(TestCase):
+    def test_inbox_query_count_does_not_grow_with_conversations(self):
+        """Dernier message et non-lus sont annotés : le nombre de requêtes reste constant."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from .models import ChatConversation, ChatMessage
+        from .views import ChatConversationViewSet
+        User = get_user_model()
+        client = User.objects.create_user(username="inbox", email="inbox@example.com", password="x")
+        view = ChatConversationViewSet.as_view({"get": "list"})
+
+        def load_inbox(conversation_count):
+            for i in range(ChatConversation.objects.count(), conversation_count):
+                technician = User.objects.create_user(
+                    username=f"inboxtech{i}", email=f"inboxtech{i}@example.com", password="x", first_name="Tech", last_name=str(i)
+                )
+                conversation = ChatConversation.objects.create(client=client, technician=technician)
+                for content in ("Bonjour", "J'arrive", "Je suis devant"):
+                    ChatMessage.objects.create(conversation=conversation, sender=technician, content=content)
+            request = APIRequestFactory().get("/conversations/")
+            force_authenticate(request, user=client)
+            with CaptureQueriesContext(connection) as queries:
+                response = view(request)
+            return response, len(queries)
+
+        _, few_queries = load_inbox(2)
+        response, many_queries = load_inbox(6)
+        self.assertEqual(few_queries, many_queries)
+        results = response.data["results"]
+        self.assertEqual(len(results), 6)
+        self.assertEqual(results[0]["unread_count"], 3)
+        self.assertEqual(results[0]["last_message"]["content"], "Je suis devant")
+        self.assertEqual(results[0]["last_message"]["sender_name"], "Tech 5")
+
+
+class KeysetPaginationTest(TestCase):
+    def test_cursor_walks_history_without_gaps_or_count(self):
+        """Les curseurs before/after parcourent tout l'historique, y compris à date égale, sans COUNT."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from .models import ChatConversation, ChatMessage
+        from .views import ChatMessageViewSet
+        User = get_user_model()
+        client = User.objects.create_user(username="keyset", email="keyset@example.com", password="x")
+        technician = User.objects.create_user(username="keysettech", email="keysettech@example.com", password="x")
+        conversation = ChatConversation.objects.create(client=client, technician=technician)
+        messages = [
+            ChatMessage.objects.create(conversation=conversation, sender=technician, content=str(i)) for i in range(8)
+        ]
+        # Plusieurs messages à la même date : le départage se fait sur l'id
+        ChatMessage.objects.filter(id__in=[m.id for m in messages[2:6]]).update(created_at=messages[2].created_at)
+        view = ChatMessageViewSet.as_view({"get": "conversation_messages"})
+
+        def get(url):
+            request = APIRequestFactory().get(url)
+            force_authenticate(request, user=client)
+            with CaptureQueriesContext(connection) as queries:
+                response = view(request)
+            self.assertFalse(any("COUNT(" in q["sql"] for q in queries.captured_queries))
+            return response.data
+
+        url = f"/chat/messages/conversation_messages/?conversation_id={conversation.id}&page_size=3"
+        pages = [get(url)]
+        while pages[-1]["before"]:
+            pages.append(get(pages[-1]["before"]))
+        seen = [m["content"] for page in reversed(pages) for m in page["results"]]
+        self.assertEqual(seen, [str(i) for i in range(8)])
+
+        newer = ChatMessage.objects.create(conversation=conversation, sender=technician, content="8")
+        self.assertEqual([m["id"] for m in get(pages[0]["after"])["results"]], [newer.id])
+
+
+class SerializerQueryPlanTest(TestCase):
+    def test_repair_request_list_uses_constant_queries(self):
+        """Le plan déduit du serializer évite les requêtes par ligne (paiement, conversation, technicien)."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from .models import Client, Conversation, Message, RepairRequest
+        from .views import RepairRequestViewSet
+        User = get_user_model()
+        client_user = User.objects.create_user(username="plan_client", email="plan_client@example.com", password="x")
+        tech_user = User.objects.create_user(username="plan_tech", email="plan_tech@example.com", password="x")
+        client = Client.objects.create(user=client_user, address="Bamako")
+        technician = Technician.objects.create(user=tech_user, rating_count=2, rating_sum=9)
+        view = RepairRequestViewSet.as_view({"get": "list"})
+
+        def add_requests(count):
+            for i in range(count):
+                repair_request = RepairRequest.objects.create(
+                    client=client, technician=technician, title="Fuite d'eau", address="Bamako"
+                )
+                CinetPayPayment.objects.create(
+                    transaction_id=f"TXN-PLAN-{repair_request.id}", amount=5000, description="Paiement",
+                    customer_name="A", customer_surname="B", customer_email="plan@example.com",
+                    customer_phone_number="+22300000000", customer_address="Bamako", customer_city="Bamako",
+                    customer_zip_code="1000", status="completed", user=client_user, request=repair_request,
+                )
+                conversation = Conversation.objects.create(request=repair_request)
+                Message.objects.create(conversation=conversation, sender=tech_user, content="J'arrive")
+
+        def list_requests():
+            request = APIRequestFactory().get("/repair-requests/")
+            force_authenticate(request, user=client_user)
+            with CaptureQueriesContext(connection) as queries:
+                response = view(request)
+            return response.data["results"], len(queries)
+
+        add_requests(2)
+        _, few_queries = list_requests()
+        add_requests(4)
+        results, many_queries = list_requests()
+        self.assertEqual(few_queries, many_queries)
+        self.assertEqual(len(results), 6)
+        self.assertEqual(results[0]["payment_status"], "completed")
+        self.assertEqual(results[0]["conversation"]["unread_count"], 1)
+        self.assertEqual(results[0]["technician"]["average_rating"], 4.5)
+
+
+class SparseFieldsetTest(TestCase):
+    def test_fields_and_expand_narrow_payload_and_columns(self):
+        """?fields= réduit la réponse et les colonnes lues ; ?expand= rétablit l'objet imbriqué."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from .models import Client, RepairRequest
+        from .views import RepairRequestViewSet
+        User = get_user_model()
+        client_user = User.objects.create_user(username="sparse_client", email="sparse_client@example.com", password="x")
+        tech_user = User.objects.create_user(username="sparse_tech", email="sparse_tech@example.com", password="x")
+        client = Client.objects.create(user=client_user, address="Bamako")
+        technician = Technician.objects.create(user=tech_user)
+        RepairRequest.objects.create(
+            client=client, technician=technician, title="Fuite d'eau", description="Sous l'évier", address="Bamako"
+        )
+        view = RepairRequestViewSet.as_view({"get": "list"})
+
+        def get(query):
+            request = APIRequestFactory().get(f"/repair-requests/?{query}")
+            force_authenticate(request, user=client_user)
+            with CaptureQueriesContext(connection) as queries:
+                response = view(request)
+            return response.data["results"][0], queries[-1]["sql"]
+
+        row, sql = get("fields=id,title,technician")
+        self.assertEqual(set(row), {"id", "title", "technician"})
+        self.assertEqual(row["technician"], technician.id)
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn("users_user", sql)
+
+        row, sql = get("fields=id,technician&expand=technician")
+        self.assertEqual(row["technician"]["user"]["id"], tech_user.id)
+        self.assertIn("users_user", sql)
+
+        row, _ = get("exclude=description")
+        self.assertNotIn("description", row)
+        self.assertEqual(row["client"]["user"]["id"], client_user.id)
+
+
+class StreamingExportTest(TestCase):
+    def test_audit_log_export_streams_csv_and_xlsx(self):
+        """L'export du journal d'audit est diffusé en flux, sans requête par ligne."""
+        from io import BytesIO
+        import openpyxl
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from users.models import AuditLog
+        from .views import export_audit_logs
+        User = get_user_model()
+        admin = User.objects.create_user(username="export_admin", email="export_admin@example.com", password="x", is_staff=True)
+        for index in range(5):
+            user = User.objects.create_user(username=f"audit_{index}", email=f"audit_{index}@example.com", password="x")
+            AuditLog.objects.create(
+                user=user, ip_address="127.0.0.1", user_agent="test", event_type="login", status="success",
+                metadata={"essai": index} if index else {},
+            )
+
+        def export(query):
+            request = APIRequestFactory().get(f"/admin/audit-logs/export/?{query}")
+            force_authenticate(request, user=admin)
+            response = export_audit_logs(request)
+            with CaptureQueriesContext(connection) as queries:
+                content = b"".join(response.streaming_content)
+            return response, content, len(queries)
+
+        response, content, query_count = export("format=csv&user_email=audit_")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('filename="audit_log.csv"', response["Content-Disposition"])
+        lines = content.decode().splitlines()
+        self.assertEqual(lines[0], "Date,Utilisateur,Type,Statut,IP,Pays,Ville,User Agent,Risque,Détails")
+        self.assertEqual(len(lines), 6)
+        self.assertIn("audit_4@example.com", lines[1])
+        self.assertEqual(query_count, 1)
+
+        response, content, _ = export("format=excel")
+        self.assertEqual(response.status_code, 200)
+        rows = list(openpyxl.load_workbook(BytesIO(content), read_only=True).active.iter_rows(values_only=True))
+        self.assertEqual(rows[0][1], "Utilisateur")
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][9], "{'essai': 4}")
+
+
+@QUEUE_ONLY_JOBS
+class BackgroundJobTest(TestCase):
+    def test_priority_retry_and_failure(self):
+        """Les tâches passent par priorité ; un échec est relancé avec délai puis abandonné."""
+        from datetime import timedelta
+        from unittest import mock
+        from . import jobs
+        from .models import BackgroundJob
+        calls = []
+        attempts = {"flaky": 0}
+
+        def record(label):
+            calls.append(label)
+
+        def flaky():
+            attempts["flaky"] += 1
+            raise RuntimeError("SMTP indisponible")
+
+        with mock.patch.dict(jobs.JOB_HANDLERS, {"record": record, "flaky": flaky}):
+            jobs.enqueue("record", {"label": "bas"}, priority=BackgroundJob.PRIORITY_LOW)
+            jobs.enqueue("record", {"label": "haut"}, priority=BackgroundJob.PRIORITY_HIGH)
+            failing = jobs.enqueue("flaky", max_attempts=2)
+            self.assertEqual(jobs.run_pending(), 3)
+            self.assertEqual(calls, ["haut", "bas"])
+
+            failing.refresh_from_db()
+            self.assertEqual(failing.status, BackgroundJob.Status.PENDING)
+            self.assertGreater(failing.run_at, timezone.now())
+            self.assertEqual(jobs.run_pending(), 0)
+
+            BackgroundJob.objects.filter(pk=failing.pk).update(run_at=timezone.now() - timedelta(seconds=1))
+            self.assertEqual(jobs.run_pending(), 1)
+            failing.refresh_from_db()
+            self.assertEqual(failing.status, BackgroundJob.Status.FAILED)
+            self.assertEqual(attempts["flaky"], 2)
+            self.assertIn("SMTP indisponible", failing.last_error)
+
+    def test_login_otp_email_is_enqueued(self):
+        """La connexion à risque met l'email OTP en file au lieu de l'envoyer dans la requête."""
+        from unittest import mock
+        from django.contrib.auth.models import AnonymousUser
+        from django.core import mail
+        from rest_framework.test import APIRequestFactory
+        from users.models import OTPChallenge
+        from users.views import UserViewSet
+        from . import jobs
+        from .models import BackgroundJob
+        User = get_user_model()
+        User.objects.create_user(username="otp_user", email="otp_user@example.com", password="secret")
+        request = APIRequestFactory().post(
+            "/users/login/", {"email": "otp_user@example.com", "password": "secret"}, format="json"
+        )
+        # Attributs posés par les middlewares d'authentification et de géolocalisation
+        request.user = AnonymousUser()
+        request.geoip_country = "Mali"
+        with mock.patch("users.views.calculate_risk_score", return_value=85):
+            response = UserViewSet.as_view({"post": "login"})(request)
+        self.assertTrue(response.data["otp_required"])
+        self.assertEqual(len(mail.outbox), 0)
+        job = BackgroundJob.objects.get(name="otp_email")
+        self.assertEqual(job.priority, BackgroundJob.PRIORITY_HIGH)
+        # Le code reste hors de la file : seule la référence au challenge est stockée
+        otp = OTPChallenge.objects.get()
+        self.assertEqual(job.payload, {"otp_challenge_id": otp.pk})
+        self.assertTrue(BackgroundJob.objects.filter(name="security_notification").exists())
+
+        jobs.run_pending()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].to, ["otp_user@example.com"])
+        self.assertIn(otp.code, mail.outbox[0].body)
+
+    def test_statistics_pdf_export_is_queued_by_default(self):
+        """L'export PDF répond 202 avec la tâche à suivre ; le rendu n'a pas lieu dans la requête."""
+        from unittest import mock
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from .export_statistics_pdf import export_statistics_pdf
+        from .models import BackgroundJob
+        admin = get_user_model().objects.create_user(
+            username="pdf_queue", email="pdf_queue@example.com", password="x", is_staff=True
+        )
+        request = APIRequestFactory().get("/api/export_statistics_pdf/")
+        force_authenticate(request, user=admin)
+        with mock.patch("depannage.export_statistics_pdf.render_statistics_pdf") as render:
+            response = export_statistics_pdf(request)
+        render.assert_not_called()
+        self.assertEqual(response.status_code, 202)
+        job = BackgroundJob.objects.get(name="statistics_pdf")
+        self.assertEqual(response.data["job_id"], job.pk)
+        self.assertEqual(job.payload, {"user_id": admin.pk})
+
+    def test_statistics_pdf_is_stored_outside_media(self):
+        """Le PDF généré en tâche de fond est hors de MEDIA_ROOT et réservé aux administrateurs."""
+        import tempfile
+        from unittest import mock
+        from django.conf import settings
+        from django.test import override_settings
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from .export_statistics_pdf import download_statistics_pdf
+        from .jobs import statistics_pdf_job
+        User = get_user_model()
+        admin = User.objects.create_user(username="pdf_admin", email="pdf_admin@example.com", password="x", is_staff=True)
+        user = User.objects.create_user(username="pdf_user", email="pdf_user@example.com", password="x")
+        with tempfile.TemporaryDirectory() as private_dir, override_settings(
+            EXPORT_SETTINGS={**settings.EXPORT_SETTINGS, "PRIVATE_DIR": private_dir}
+        ), mock.patch(
+            "depannage.export_statistics_pdf.render_statistics_pdf",
+            return_value=("statistiques_20260101_120000.pdf", b"%PDF-1.4"),
+        ), mock.patch("django.urls.reverse", side_effect=lambda name, args: f"/{args[0]}"):
+            result = statistics_pdf_job()
+            name = result["path"]
+            self.assertEqual(result["url"], f"/{name}")
+            self.assertRegex(name, r"^statistiques_20260101_120000_[\w-]{16,}\.pdf$")
+            self.assertTrue(os.path.exists(os.path.join(private_dir, name)))
+
+            def download(requester, filename):
+                request = APIRequestFactory().get(f"/api/export_statistics_pdf/{filename}/")
+                force_authenticate(request, user=requester)
+                return download_statistics_pdf(request, name=filename)
+
+            self.assertEqual(download(user, name).status_code, 403)
+            self.assertEqual(download(admin, "statistiques_inconnu.pdf").status_code, 404)
+            self.assertEqual(download(admin, "../secret.pdf").status_code, 404)
+            response = download(admin, name)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b"".join(response.streaming_content), b"%PDF-1.4")
+            response.close()
+
+
+@override_settings(JOB_SETTINGS={**settings.JOB_SETTINGS, "IN_PROCESS_WORKERS": 2, "EAGER": False})
+class InProcessJobTest(TransactionTestCase):
+    """Réglage par défaut : tâche réservée à l'insertion, exécutée après commit par le pool du processus web."""
+
+    def hold_handlers(self, *names):
+        """Remplace les tâches ``names`` par des versions qui attendent ``release`` et notent leur thread."""
+        import threading
+        from unittest import mock
+        from . import jobs
+        release, threads = threading.Event(), []
+
+        def holding(handler):
+            def run(**payload):
+                threads.append(threading.current_thread())
+                release.wait(5)
+                return handler(**payload)
+            return run
+
+        patcher = mock.patch.dict(jobs.JOB_HANDLERS, {name: holding(jobs.JOB_HANDLERS[name]) for name in names})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(release.set)
+        return release, threads
+
+    def wait_for(self, job):
+        import time
+        from .models import BackgroundJob
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            job.refresh_from_db()
+            if job.status != BackgroundJob.Status.RUNNING:
+                return job
+            time.sleep(0.05)
+        self.fail(f"Tâche {job} toujours en cours")
+
+    def test_login_returns_before_otp_email_is_sent(self):
+        """La connexion répond sans attendre SMTP ; un worker run_jobs ne reprend pas la tâche réservée."""
+        import threading
+        from unittest import mock
+        from django.contrib.auth.models import AnonymousUser
+        from django.core import mail
+        from rest_framework.test import APIRequestFactory
+        from users.models import OTPChallenge
+        from users.views import UserViewSet
+        from . import jobs
+        from .models import BackgroundJob
+        User = get_user_model()
+        User.objects.create_user(username="otp_async", email="otp_async@example.com", password="secret")
+        release, threads = self.hold_handlers("otp_email", "security_notification")
+        request = APIRequestFactory().post(
+            "/users/login/", {"email": "otp_async@example.com", "password": "secret"}, format="json"
+        )
+        request.user = AnonymousUser()
+        request.geoip_country = "Mali"
+        with mock.patch("users.views.calculate_risk_score", return_value=85):
+            response = UserViewSet.as_view({"post": "login"})(request)
+        self.assertTrue(response.data["otp_required"])
+        self.assertEqual(len(mail.outbox), 0)
+        job = BackgroundJob.objects.get(name="otp_email")
+        self.assertEqual((job.status, job.locked_by), (BackgroundJob.Status.RUNNING, jobs.in_process_worker_id()))
+        self.assertEqual(jobs.run_pending(), 0)
+
+        release.set()
+        self.assertEqual(self.wait_for(job).status, BackgroundJob.Status.SUCCEEDED)
+        self.wait_for(BackgroundJob.objects.get(name="security_notification"))
+        self.assertNotIn(threading.current_thread(), threads)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertTrue(any(OTPChallenge.objects.get().code in message.body for message in mail.outbox))
+
+    def test_specialty_change_is_reassigned_outside_the_save(self):
+        """Le save() d'un changement de spécialité rend la main avant la réaffectation, faite par le pool."""
+        import threading
+        from .models import BackgroundJob, Client, RepairRequest
+        User = get_user_model()
+
+        def technician(name):
+            user = User.objects.create_user(username=name, email=f"{name}@example.com", password="x")
+            return Technician.objects.create(
+                user=user, specialty="plumber", is_available=True, is_verified=True,
+                current_latitude=12.6392, current_longitude=-8.0029, rating_count=1, rating_sum=5,
+            )
+
+        leaving = technician("async_leaving")
+        replacement = technician("async_replacement")
+        client = Client.objects.create(
+            user=User.objects.create_user(username="async_client", email="async_client@example.com", password="x"),
+            address="Bamako",
+        )
+        repair_request = RepairRequest.objects.create(
+            client=client, title="Fuite", address="Bamako", specialty_needed="plumber",
+            latitude=12.64, longitude=-8.0,
+        )
+        repair_request.assign_to_technician(leaving)
+        release, threads = self.hold_handlers("reassign_after_specialty_change")
+
+        leaving.specialty = "electrician"
+        leaving.save()
+        job = BackgroundJob.objects.get(name="reassign_after_specialty_change")
+        self.assertEqual(job.status, BackgroundJob.Status.RUNNING)
+        repair_request.refresh_from_db()
+        self.assertEqual(repair_request.technician_id, leaving.pk)
+
+        release.set()
+        self.assertEqual(self.wait_for(job).result, {"reassigned": 1, "unassigned": 0})
+        self.assertNotIn(threading.current_thread(), threads)
+        repair_request.refresh_from_db()
+        self.assertEqual(repair_request.technician_id, replacement.pk)
+
+
+class GeoIPLookupTest(TestCase):
+    def test_single_reader_and_lru_ttl_cache(self):
+        """Le lecteur est ouvert une fois ; les résultats sont mis en cache par IP (LRU + durée de vie)."""
+        from types import SimpleNamespace
+        from .geoip import GeoIPLookup
+        opened, resolved = [], []
+        now = [0.0]
+
+        class FakeReader:
+            def city(self, ip):
+                resolved.append(ip)
+                if ip == "10.0.0.1":
+                    raise ValueError("adresse inconnue")
+                return SimpleNamespace(country=SimpleNamespace(name="Mali"), city=SimpleNamespace(name="Bamako"))
+
+        def factory(path):
+            opened.append(path)
+            return FakeReader()
+
+        lookup = GeoIPLookup("geo.mmdb", cache_size=2, ttl=60, reader_factory=factory, clock=lambda: now[0])
+        self.assertEqual(lookup.lookup("41.73.0.1").label, "Bamako, Mali")
+        self.assertEqual(lookup.lookup("41.73.0.1").country, "Mali")
+        self.assertIsNone(lookup.lookup("10.0.0.1").label)
+        self.assertIsNone(lookup.lookup("127.0.0.1").label)
+        self.assertEqual(opened, ["geo.mmdb"])
+        self.assertEqual(resolved, ["41.73.0.1", "10.0.0.1"])
+        self.assertEqual((lookup.hits, lookup.misses), (1, 2))
+
+        lookup.lookup("41.73.0.2")  # évince l'entrée la moins récente (41.73.0.1)
+        lookup.lookup("41.73.0.1")
+        self.assertEqual(resolved.count("41.73.0.1"), 2)
+
+        now[0] = 61
+        lookup.lookup("41.73.0.1")
+        self.assertEqual(resolved.count("41.73.0.1"), 3)
+        self.assertEqual(opened, ["geo.mmdb"])
+
+
+class SlidingWindowRateLimitTest(TestCase):
+    def test_sliding_window_on_local_and_cache_storage(self):
+        """La fenêtre précédente compte au prorata ; les refus ne consomment pas de quota."""
+        from auth.ratelimit import CacheStorage, LocalStorage, RateLimiter, RatePolicy
+        policy = RatePolicy(name="login", limit=4, period=60, path="/users/login/")
+        for storage in (LocalStorage(max_keys=10), CacheStorage("default")):
+            storage.clear()
+            now = [120.0]
+            limiter = RateLimiter([policy], storage=storage, clock=lambda: now[0])
+            results = [limiter.check(policy, "ip1.2.3.4") for _ in range(5)]
+            self.assertEqual([r.allowed for r in results], [True] * 4 + [False])
+            self.assertEqual(results[3].remaining, 0)
+            self.assertGreaterEqual(results[4].retry_after, 1)
+            self.assertTrue(limiter.check(policy, "ip5.6.7.8").allowed)
+
+            # Mi-fenêtre suivante : 4 * 0.5 = 2 requêtes encore comptées
+            now[0] = 210.0
+            self.assertEqual([limiter.check(policy, "ip1.2.3.4").allowed for _ in range(3)], [True, True, False])
+            now[0] = 300.0
+            self.assertTrue(limiter.check(policy, "ip1.2.3.4").allowed)
+
+    def test_middleware_applies_route_policy(self):
+        """/users/login/ a sa propre limite, plus stricte que la politique par défaut."""
+        from django.http import HttpResponse
+        from django.test import RequestFactory, override_settings
+        from auth.middleware import RateLimitMiddleware
+        config = {
+            "STORAGE": "local",
+            "DEFAULT": {"rate": "100/m", "key": "user_or_ip"},
+            "POLICIES": [{"name": "login", "path": "/users/login/", "methods": ["POST"], "rate": "2/m"}],
+        }
+        with override_settings(RATE_LIMIT_SETTINGS=config):
+            middleware = RateLimitMiddleware(lambda request: HttpResponse("ok"))
+        factory = RequestFactory()
+        statuses = [middleware(factory.post("/users/login/")).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        response = middleware(factory.get("/depannage/api/repair-requests/"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-RateLimit-Limit"], "100")
+        blocked = middleware(factory.post("/users/login/"))
+        self.assertIn("Retry-After", blocked)
+
+    def test_forwarded_for_is_only_trusted_behind_configured_proxies(self):
+        """Un X-Forwarded-For aléatoire ne change pas la clé comptée."""
+        from django.test import RequestFactory
+        from auth.ratelimit import client_ip
+        request = RequestFactory().post(
+            "/users/login/", REMOTE_ADDR="10.0.0.2", HTTP_X_FORWARDED_FOR="6.6.6.6, 41.73.0.1, 10.0.0.1"
+        )
+        self.assertEqual(client_ip(request, trusted_proxy_count=0), "10.0.0.2")
+        self.assertEqual(client_ip(request, trusted_proxy_count=2), "41.73.0.1")
+        self.assertEqual(client_ip(request, trusted_proxy_count=5), "10.0.0.2")
+
+
+class DispatchEngineTest(TestCase):
+    def test_rank_filters_busy_rating_radius_and_scores(self):
+        """Un seul pipeline : rayon propre, note minimale, occupés et exclusions écartés, tri par score."""
+        from .dispatch import Dispatcher, DispatchQuery
+        from .models import Client, RepairRequest
+        User = get_user_model()
+
+        def technician(name, lat_offset, radius=10, rating=(2, 10), level="senior"):
+            user = User.objects.create_user(username=name, email=f"{name}@example.com", password="x")
+            return Technician.objects.create(
+                user=user, specialty="plumber", is_available=True, is_verified=True,
+                current_latitude=12.6392 + lat_offset, current_longitude=-8.0029, service_radius_km=radius,
+                rating_count=rating[0], rating_sum=rating[1], experience_level=level,
+            )
+
+        near = technician("near", 0.01, level="expert")
+        farther = technician("farther", 0.05, rating=(2, 9))
+        busy = technician("busy", 0.0)
+        technician("low_rated", 0.0, rating=(2, 4))
+        technician("out_of_radius", 0.2, radius=5)
+        client_user = User.objects.create_user(username="dispatch_client", email="dc@example.com", password="x")
+        client = Client.objects.create(user=client_user, address="Bamako")
+        RepairRequest.objects.create(
+            client=client, technician=busy, title="En cours", address="Bamako", status="assigned",
+        )
+        request = RepairRequest(
+            client=client, title="Fuite", address="Bamako", specialty_needed="plumber",
+            latitude=12.6392, longitude=-8.0029,
+        )
+
+        engine = Dispatcher()
+        ranked = engine.top_k(DispatchQuery.from_request(request, min_rating=3.5), k=10)
+        self.assertEqual([c.technician_id for c in ranked], [near.id, farther.id])
+        self.assertGreater(ranked[0].score, ranked[1].score)
+
+        query = DispatchQuery.from_request(request, exclude_ids=[near.id], min_rating=3.5)
+        self.assertEqual(engine.best_technician(query), farther)
+        request.min_experience_level = "expert"
+        self.assertEqual([c.technician_id for c in engine.top_k(DispatchQuery.from_request(request))], [near.id])
+
+
+class ActiveJobsCounterTest(TestCase):
+    def test_transitions_maintain_active_jobs_and_reconcile_fixes_drift(self):
+        """Assignation, début, fin, annulation et réaffectation tiennent le compteur ; la réconciliation corrige."""
+        from .dispatch import busy_technician_ids
+        from .models import Client, RepairRequest, refresh_technician_stats
+        User = get_user_model()
+        first = Technician.objects.create(
+            user=User.objects.create_user(username="busy_1", email="busy_1@example.com", password="x"))
+        second = Technician.objects.create(
+            user=User.objects.create_user(username="busy_2", email="busy_2@example.com", password="x"))
+        client = Client.objects.create(
+            user=User.objects.create_user(username="busy_client", email="busy_client@example.com", password="x"),
+            address="Bamako",
+        )
+
+        def active(technician):
+            technician.refresh_from_db(fields=["active_jobs_count"])
+            return technician.active_jobs_count
+
+        done = RepairRequest.objects.create(client=client, title="A", address="Bamako")
+        cancelled = RepairRequest.objects.create(client=client, title="B", address="Bamako")
+        done.assign_to_technician(first)
+        cancelled.assign_to_technician(first)
+        self.assertEqual(active(first), 2)
+        done.start_work()
+        self.assertEqual(active(first), 2)
+        done.complete_work()
+        cancelled.status = RepairRequest.Status.CANCELLED
+        cancelled.save()
+        self.assertEqual(active(first), 0)
+
+        moved = RepairRequest.objects.create(client=client, title="C", address="Bamako")
+        moved.assign_to_technician(first)
+        moved.assign_to_technician(second)  # réaffectation
+        self.assertEqual((active(first), active(second)), (0, 1))
+        self.assertEqual(busy_technician_ids([first.id, second.id]), {second.id})
+
+        Technician.objects.filter(pk=first.pk).update(active_jobs_count=5)
+        self.assertEqual(refresh_technician_stats([first.pk, second.pk]), 1)
+        self.assertEqual(active(first), 0)
+
+
+@QUEUE_ONLY_JOBS
+class DirtyFieldsTrackingTest(TestCase):
+    def test_saves_write_only_changed_fields_and_specialty_change_is_deferred(self):
+        """Pas de SELECT après save ; update_fields réduit aux champs modifiés ; réaffectation en tâche de fond."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .dispatch import dispatcher
+        from .jobs import run_pending
+        from .models import BackgroundJob, Client, RepairRequest
+        User = get_user_model()
+
+        def technician(name, **fields):
+            user = User.objects.create_user(username=name, email=f"{name}@example.com", password="x")
+            return Technician.objects.create(
+                user=user, specialty="plumber", is_available=True, is_verified=True,
+                current_latitude=12.6392, current_longitude=-8.0029, rating_count=1, rating_sum=5, **fields,
+            )
+
+        leaving = technician("leaving")
+        replacement = technician("replacement")
+        client = Client.objects.create(
+            user=User.objects.create_user(username="dirty_client", email="dirty_client@example.com", password="x"),
+            address="Bamako",
+        )
+        repair_request = RepairRequest.objects.create(
+            client=client, title="Fuite", address="Bamako", specialty_needed="plumber",
+            latitude=12.64, longitude=-8.0,
+        )
+        repair_request.assign_to_technician(leaving)
+
+        leaving = Technician.objects.get(pk=leaving.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(leaving.save_dirty())
+        self.assertEqual(len(queries), 0)
+
+        leaving.bio = "Plombier depuis 10 ans"
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(leaving.save_dirty())
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"bio"', queries[0]["sql"])
+        self.assertNotIn("rating_count", queries[0]["sql"])
+        self.assertFalse(BackgroundJob.objects.exists())
+
+        leaving.specialty = "electrician"
+        with CaptureQueriesContext(connection) as queries:
+            leaving.save()
+        self.assertFalse(any(q["sql"].startswith("SELECT") for q in queries))
+        job = BackgroundJob.objects.get(name="reassign_after_specialty_change")
+        self.assertEqual(job.payload, {"technician_id": leaving.pk, "old_specialty": "plumber"})
+
+        # Pas de commit dans un TestCase : la table du moteur n'est pas invalidée par on_commit
+        dispatcher.table.invalidate()
+        run_pending()
+        repair_request.refresh_from_db()
+        self.assertEqual(repair_request.technician_id, replacement.pk)
+
+
+class SLASchedulerTest(TestCase):
+    def test_offers_widen_by_ring_then_escalate_and_stop_once_assigned(self):
+        """Offres aux techniciens suivants par anneau, alerte admin à 75 % du délai, rien après l'affectation."""
+        from datetime import timedelta
+        from django.test import override_settings
+        from channels.layers import get_channel_layer
+        from asgiref.sync import async_to_sync
+        from .dispatch import dispatcher
+        from .models import Client, Notification, RepairRequest
+        from .sla import SLAScheduler
+        User = get_user_model()
+
+        def technician(name, latitude):
+            user = User.objects.create_user(username=name, email=f"{name}@example.com", password="x")
+            return Technician.objects.create(
+                user=user, specialty="plumber", is_available=True, is_verified=True, service_radius_km=50,
+                current_latitude=latitude, current_longitude=-8.0, rating_count=1, rating_sum=5,
+            )
+
+        near = technician("sla_near", 12.64)
+        far = technician("sla_far", 12.775)  # ~15 km
+        admin = User.objects.create_user(username="sla_admin", email="sla_admin@example.com", password="x", is_staff=True)
+        client = Client.objects.create(
+            user=User.objects.create_user(username="sla_client", email="sla_client@example.com", password="x"),
+            address="Bamako",
+        )
+        with override_settings(SLA_SETTINGS={"PUBLISH_EVENTS": True, "CHANNEL": "sla-test"}), \
+                self.captureOnCommitCallbacks(execute=True):
+            repair_request = RepairRequest.objects.create(
+                client=client, title="Fuite", address="Bamako", specialty_needed="plumber",
+                urgency_level=RepairRequest.UrgencyLevel.SOS, latitude=12.64, longitude=-8.0,
+            )
+        message = async_to_sync(get_channel_layer().receive)("sla-test")
+        self.assertEqual(message["type"], "sla.track")
+        self.assertEqual(message["request_id"], repair_request.pk)
+
+        dispatcher.table.invalidate()
+        scheduler = SLAScheduler(radius_rings_km=[5, 20], offer_top_k=1)
+        start = repair_request.created_at
+        scheduler.handle_message(message, now=start)
+        self.assertEqual(scheduler.seconds_until_next_due(now=start), 300)
+        with self.assertNumQueries(0):
+            self.assertEqual(scheduler.run_due(start)["offer"], 0)
+
+        def offered(tech):
+            return Notification.objects.filter(
+                recipient=tech.user, request=repair_request, type=Notification.Type.URGENT_REQUEST
+            ).count()
+
+        scheduler.run_due(start + timedelta(minutes=5))
+        self.assertEqual((offered(near), offered(far)), (1, 0))
+        scheduler.run_due(start + timedelta(minutes=10))
+        self.assertEqual((offered(near), offered(far)), (1, 1))
+
+        counts = scheduler.run_due(start + timedelta(minutes=23))
+        self.assertEqual(counts["escalate"], 1)
+        self.assertTrue(Notification.objects.filter(recipient=admin, type=Notification.Type.SYSTEM).exists())
+
+        repair_request.assign_to_technician(near)
+        counts = scheduler.run_due(start + timedelta(minutes=31))
+        self.assertEqual(counts["breach"], 0)
+        self.assertEqual(len(scheduler), 0)
+        self.assertIsNone(scheduler.next_due())
+
+    def test_load_pending_tracks_pending_requests_and_breaches_once(self):
+        from datetime import timedelta
+        from .models import Client, Notification, RepairRequest
+        from .sla import SLAScheduler
+        User = get_user_model()
+
+        admin = User.objects.create_user(username="sla_admin2", email="sla_admin2@example.com", password="x", is_staff=True)
+
+        client = Client.objects.create(
+            user=User.objects.create_user(username="sla_client2", email="sla_client2@example.com", password="x"),
+            address="Bamako",
+        )
+        pending = RepairRequest.objects.create(
+            client=client, title="Panne", address="Bamako", specialty_needed="electrician",
+            urgency_level=RepairRequest.UrgencyLevel.URGENT,
+        )
+        RepairRequest.objects.create(
+            client=client, title="Brouillon", address="Bamako", specialty_needed="electrician",
+            status=RepairRequest.Status.DRAFT,
+        )
+        scheduler = SLAScheduler()
+        self.assertEqual(scheduler.load_pending(now=pending.created_at), 1)
+        self.assertEqual(scheduler.load_pending(now=pending.created_at), 0)
+        self.assertIn(pending.pk, scheduler)
+
+        counts = scheduler.run_due(pending.created_at + timedelta(hours=3))
+        self.assertEqual(counts["breach"], 1)
+        self.assertNotIn(pending.pk, scheduler)
+
+        # Toujours en attente : ni la relecture périodique ni un redémarrage ne réalertent
+        later = pending.created_at + timedelta(hours=4)
+        self.assertEqual(scheduler.load_pending(now=later), 0)
+        self.assertEqual(scheduler.run_due(later)["breach"], 0)
+        restarted = SLAScheduler()
+        self.assertEqual(restarted.load_pending(now=later), 0)
+        self.assertEqual(restarted.run_due(later)["breach"], 0)
+        alerts = Notification.objects.filter(recipient=admin).values_list("extra_data__sla", flat=True)
+        self.assertEqual(sorted(alerts), ["breach", "escalate"])
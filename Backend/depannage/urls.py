@@ -46,9 +46,10 @@ from .views import (
     admin_security_trends,
     # CinetPayNotificationAPIView,  # Supprimé - plus de notifications CinetPay
     export_audit_logs,
+    background_job_status,
 )
 from .export_statistics import export_statistics_excel
-from .export_statistics_pdf import export_statistics_pdf
+from .export_statistics_pdf import download_statistics_pdf, export_statistics_pdf
 
 router = DefaultRouter()
 router.register(r"clients", ClientViewSet)
@@ -93,6 +94,7 @@ urlpatterns = [
     # Endpoints d'export
     path("api/export_statistics_excel/", export_statistics_excel, name="export_statistics_excel"),
     path("api/export_statistics_pdf/", export_statistics_pdf, name="export_statistics_pdf"),
+    path("api/export_statistics_pdf/<str:name>/", download_statistics_pdf, name="download_statistics_pdf"),
     
     # Endpoints de géolocalisation
     path("api/find_nearest_technician/", find_nearest_technician, name="find_nearest_technician"),
@@ -118,6 +120,7 @@ urlpatterns = [
     path("api/admin/security/login-locations/", admin_login_locations, name="admin_login_locations"),
     path("api/admin/audit-logs/", AuditLogListView.as_view(), name="admin_audit_logs"),
     path("api/admin/audit-logs/export/", export_audit_logs, name="admin_audit_logs_export"),
+    path("api/admin/jobs/<int:pk>/", background_job_status, name="background_job_status"),
     path("api/configuration/", system_configuration, name="system_configuration"),
     path("api/technicians/dashboard/", technician_dashboard_data, name="technician_dashboard_data"),
     path("api/admin/security/stats/", admin_security_stats, name="admin_security_stats"),
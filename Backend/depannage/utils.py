@@ -4,10 +4,7 @@ import hmac
 from django.conf import settings
 from datetime import datetime
 from math import radians, sin, cos, sqrt, atan2
-import os
-import geoip2.database
-
-GEOIP_DB_PATH = os.path.join(os.path.dirname(__file__), '../geoip/GeoLite2-City.mmdb')
+import numpy as np
 
 
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -35,6 +32,93 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
 
     return distance
 
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+
+def haversine_distances(origin_lat, origin_lon, latitudes, longitudes) -> np.ndarray:
+    """Vectorized Haversine distances from one origin to many points.
+
+    Args:
+        origin_lat: Latitude of the origin
+        origin_lon: Longitude of the origin
+        latitudes: Sequence (or array) of latitudes
+        longitudes: Sequence (or array) of longitudes, same length as ``latitudes``
+
+    Returns:
+        Array of distances in kilometers, aligned with the input points
+    """
+    lat1 = np.radians(float(origin_lat))
+    lon1 = np.radians(float(origin_lon))
+    lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon2 = np.radians(np.asarray(longitudes, dtype=np.float64))
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def pairwise_haversine_distances(origin_lats, origin_lons, latitudes, longitudes) -> np.ndarray:
+    """Vectorized Haversine distances between N origins and M points.
+
+    Args:
+        origin_lats: Latitudes of the N origins
+        origin_lons: Longitudes of the N origins
+        latitudes: Latitudes of the M points
+        longitudes: Longitudes of the M points
+
+    Returns:
+        Array of shape (N, M) where ``[i, j]`` is the distance in kilometers
+        between origin ``i`` and point ``j``
+    """
+    lat1 = np.radians(np.asarray(origin_lats, dtype=np.float64))[:, np.newaxis]
+    lon1 = np.radians(np.asarray(origin_lons, dtype=np.float64))[:, np.newaxis]
+    lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))[np.newaxis, :]
+    lon2 = np.radians(np.asarray(longitudes, dtype=np.float64))[np.newaxis, :]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def haversine_within_radius(origin_lat, origin_lon, latitudes, longitudes, radius_km):
+    """Distances from one origin plus the mask of points inside a radius.
+
+    Args:
+        origin_lat: Latitude of the origin
+        origin_lon: Longitude of the origin
+        latitudes: Latitudes of the points
+        longitudes: Longitudes of the points
+        radius_km: Single radius, or one radius per point (e.g. each
+            technician's ``service_radius_km``)
+
+    Returns:
+        Tuple ``(distances, mask)`` of arrays aligned with the input points
+    """
+    distances = haversine_distances(origin_lat, origin_lon, latitudes, longitudes)
+    mask = distances <= np.asarray(radius_km, dtype=np.float64)
+    return distances, mask
+
+def bounding_box(latitude, longitude, radius_km):
+    """Lat/lon bounding box enclosing a circle, for index-friendly SQL prefilters.
+
+    Args:
+        latitude: Latitude of the center
+        longitude: Longitude of the center
+        radius_km: Radius of the circle in kilometers
+
+    Returns:
+        Tuple ``(min_lat, max_lat, min_lon, max_lon)`` in degrees
+    """
+    delta_lat = radius_km / KM_PER_DEGREE
+    cos_lat = max(cos(radians(latitude)), 1e-6)
+    delta_lon = min(radius_km / (KM_PER_DEGREE * cos_lat), 180.0)
+    return (
+        max(latitude - delta_lat, -90.0),
+        min(latitude + delta_lat, 90.0),
+        longitude - delta_lon,
+        longitude + delta_lon,
+    )
+
 def generate_transaction_id():
     """Génère un identifiant de transaction unique."""
     return f"TXN-{uuid.uuid4().hex[:12].upper()}"
@@ -128,19 +212,7 @@ def validate_payment_data(data):
     return True, "Données valides"
 
 def get_location_from_ip(ip_address):
-    # Retourne None pour localhost
-    if ip_address in ("127.0.0.1", "::1", "localhost"):
-        return None
-    try:
-        reader = geoip2.database.Reader(GEOIP_DB_PATH)
-        response = reader.city(ip_address)
-        city = response.city.name
-        country = response.country.name
-        reader.close()
-        if city and country:
-            return f"{city}, {country}"
-        elif country:
-            return country
-        return None
-    except Exception:
-        return None
+    """Libellé "Ville, Pays" de l'adresse, via le lecteur GeoIP partagé et son cache (None si inconnue)."""
+    from .geoip import geoip_lookup
+
+    return geoip_lookup.lookup(ip_address).label
@@ -1,16 +1,23 @@
 from django.shortcuts import render
 from rest_framework import viewsets, permissions
 import rest_framework.status as rf_status
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes, renderer_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied
 from django.shortcuts import get_object_or_404
 from django.conf import settings
 from django.utils import timezone
 from django.db.models import Q, Count, F, Avg, Sum
 from django.core.paginator import Paginator
-from .utils import calculate_distance
+from .spatial_index import technician_index, hydrate_technicians, technicians_within_radius
+from .dispatch import DispatchQuery, dispatcher
+from .statistics import get_statistics_snapshot, snapshot_freshness
+from .query_planner import QueryPlanMixin
+from .pagination import AuditLogPagination, ChatMessagePagination, NotificationPagination
+from .notifications import build_notification, dispatch_notifications, notify, notify_admins, notify_many
+from .jobs import enqueue_email
+from .exports import EXPORT_RENDERER_CLASSES, ExportColumn, export_response, format_datetime, format_full_name
 import requests
 import json
 import logging
@@ -20,7 +27,6 @@ from datetime import timedelta
 # Temporairement commenté pour éviter l'erreur GDAL
 # from django.contrib.gis.geos import Point
 # from django.contrib.gis.db.models.functions import Distance
-from django.core.mail import send_mail
 # Ajout import Twilio
 try:
     from twilio.rest import Client as TwilioClient
@@ -62,7 +68,7 @@ from .serializers import (
 from .models import (
     Client, Technician, RepairRequest, RequestDocument, Review, Payment, Conversation, Message, Notification, MessageAttachment, TechnicianLocation, SystemConfiguration, CinetPayPayment, PlatformConfiguration, ClientLocation,
     Report, AdminNotification, SubscriptionPaymentRequest, TechnicianSubscription,
-    ChatConversation, ChatMessage, ChatMessageAttachment,
+    ChatConversation, ChatMessage, ChatMessageAttachment, BackgroundJob,
 )
 from rest_framework.views import APIView
 from users.models import AuditLog
@@ -72,9 +78,6 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.utils.decorators import classonlymethod
 from .cinetpay import init_cinetpay_payment
-from django.http import HttpResponse
-import csv
-import openpyxl
 
 logger = logging.getLogger(__name__)
 
@@ -120,30 +123,22 @@ def find_nearest_technician(request):
             status=400,
         )
 
-    # Récupérer tous les techniciens disponibles
-    available_technicians = Technician.objects.filter(is_available=True)
+    # Technicien disponible le plus proche selon l'index spatial
+    nearest = hydrate_technicians(
+        technician_index.nearest(user_latitude, user_longitude, k=1)
+    )
 
-    if not available_technicians:
+    if not nearest:
         return Response(
             {"error": "Aucun technicien disponible pour le moment"},
             status=404,
         )
 
-    # Calculer la distance pour chaque technicien
-    technicians_with_distance = []
-    for technician in available_technicians:
-        distance = calculate_distance(
-            user_latitude, user_longitude, technician.current_latitude, technician.current_longitude
-        )
-        technicians_with_distance.append((technician, distance))
-
-    # Trier par distance et prendre le plus proche
-    nearest_technician, distance = min(technicians_with_distance, key=lambda x: x[1])
-
     # Sérialiser le technicien et ajouter la distance
+    nearest_technician = nearest[0]
     serializer = TechnicianSerializer(nearest_technician)
     response_data = serializer.data
-    response_data["distance"] = round(distance, 2)
+    response_data["distance"] = nearest_technician.distance_km
 
     return Response(response_data)
 
@@ -197,7 +192,7 @@ class CsrfExemptMixin(object):
         view = super().as_view(*args, **kwargs)
         return csrf_exempt(view)
 
-class RepairRequestViewSet(CsrfExemptMixin, viewsets.ModelViewSet):
+class RepairRequestViewSet(CsrfExemptMixin, QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les demandes de réparation."""
 
     serializer_class = RepairRequestSerializer
@@ -210,19 +205,11 @@ class RepairRequestViewSet(CsrfExemptMixin, viewsets.ModelViewSet):
         return RepairRequestSerializer
 
     def get_queryset(self):
-        """Optimise les requêtes avec select_related et prefetch_related."""
+        """Demandes visibles par l'utilisateur selon son type."""
         user = self.request.user
         
-        # Base queryset avec optimisations
-        queryset = RepairRequest.objects.select_related(
-            'client__user',
-            'technician__user'
-        ).prefetch_related(
-            'documents',
-            'review',
-            'payments',
-            'notifications'
-        )
+        # Jointures, préchargements et colonnes déduits du serializer (QueryPlanMixin)
+        queryset = RepairRequest.objects.all()
         
         # Filtrage selon le type d'utilisateur
         if user.is_superuser or user.user_type == 'admin':
@@ -272,33 +259,31 @@ class RepairRequestViewSet(CsrfExemptMixin, viewsets.ModelViewSet):
     def notify_available_technicians(self, repair_request):
         """Notifie les techniciens disponibles de la nouvelle demande."""
         try:
-            # Trouver les techniciens disponibles dans la spécialité
-            available_technicians = Technician.objects.filter(
-                is_available=True,
-                specialty=repair_request.specialty_needed,
-                is_verified=True
-            ).select_related('user')
-            
-            # Créer des notifications pour chaque technicien
-            notifications = []
-            for technician in available_technicians:
-                notification = Notification(
-                    recipient=technician.user,
-                    type=Notification.Type.URGENT_REQUEST,
-                    title="Nouvelle demande urgente",
-                    message=f"Nouvelle demande {repair_request.title} dans votre zone",
-                    request=repair_request,
-                    extra_data={
-                        'request_id': repair_request.id,
-                        'specialty': repair_request.specialty_needed,
-                        'urgency': repair_request.urgency_level
-                    }
-                )
-                notifications.append(notification)
-            
-            # Bulk create pour optimiser les performances
+            # Meilleurs techniciens proches selon le moteur d'affectation
+            ranked = dispatcher.top_k(DispatchQuery.from_request(repair_request), k=dispatcher.notify_top_k)
+            recipient_ids = [candidate.user_id for candidate in ranked]
+            if not recipient_ids:
+                # Personne dans les rayons d'intervention : toute la spécialité est prévenue
+                recipient_ids = Technician.objects.filter(
+                    is_available=True,
+                    specialty=repair_request.specialty_needed,
+                    is_verified=True
+                ).values_list('user_id', flat=True)
+            
+            # Insertion groupée puis push WebSocket groupé
+            notifications = notify_many(
+                recipient_ids,
+                title="Nouvelle demande urgente",
+                message=f"Nouvelle demande {repair_request.title} dans votre zone",
+                type=Notification.Type.URGENT_REQUEST,
+                request=repair_request,
+                extra_data={
+                    'request_id': repair_request.id,
+                    'specialty': repair_request.specialty_needed,
+                    'urgency': repair_request.urgency_level
+                }
+            )
             if notifications:
-                Notification.objects.bulk_create(notifications)
                 logger.info(f"Notifications envoyées à {len(notifications)} techniciens")
                 
         except Exception as e:
@@ -341,23 +326,23 @@ class RepairRequestViewSet(CsrfExemptMixin, viewsets.ModelViewSet):
             # Assignation du technicien
             repair_request.assign_to_technician(technician)
             
-            # Notification au client
-            Notification.objects.create(
-                recipient=repair_request.client.user,
-                type=Notification.Type.REQUEST_ASSIGNED,
-                title="Technicien assigné",
-                message=f"Un technicien a accepté votre demande: {repair_request.title}",
-                request=repair_request
-            )
-            
-            # Notification au technicien
-            Notification.objects.create(
-                recipient=technician.user,
-                type=Notification.Type.REQUEST_ASSIGNED,
-                title="Demande acceptée",
-                message=f"Vous avez accepté la demande: {repair_request.title}",
-                request=repair_request
-            )
+            # Notifications au client et au technicien
+            dispatch_notifications([
+                build_notification(
+                    repair_request.client.user_id,
+                    type=Notification.Type.REQUEST_ASSIGNED,
+                    title="Technicien assigné",
+                    message=f"Un technicien a accepté votre demande: {repair_request.title}",
+                    request=repair_request
+                ),
+                build_notification(
+                    technician.user_id,
+                    type=Notification.Type.REQUEST_ASSIGNED,
+                    title="Demande acceptée",
+                    message=f"Vous avez accepté la demande: {repair_request.title}",
+                    request=repair_request
+                ),
+            ])
             
             serializer = self.get_serializer(repair_request)
             return Response(serializer.data)
@@ -429,25 +414,19 @@ class RepairRequestViewSet(CsrfExemptMixin, viewsets.ModelViewSet):
         
         message = status_messages.get(new_status, f"Statut changé vers {new_status}")
         
-        # Notification au client
+        # Notification au client et au technicien
+        recipients = []
         if repair_request.client:
-            Notification.objects.create(
-                recipient=repair_request.client.user,
-                type=Notification.Type.REQUEST_STARTED if new_status == RepairRequest.Status.IN_PROGRESS else Notification.Type.REQUEST_COMPLETED,
-                title=f"Demande {new_status}",
-                message=f"{message}: {repair_request.title}",
-                request=repair_request
-            )
-        
-        # Notification au technicien
+            recipients.append(repair_request.client.user_id)
         if repair_request.technician:
-            Notification.objects.create(
-                recipient=repair_request.technician.user,
-                type=Notification.Type.REQUEST_STARTED if new_status == RepairRequest.Status.IN_PROGRESS else Notification.Type.REQUEST_COMPLETED,
-                title=f"Demande {new_status}",
-                message=f"{message}: {repair_request.title}",
-                request=repair_request
-            )
+            recipients.append(repair_request.technician.user_id)
+        notify_many(
+            recipients,
+            type=Notification.Type.REQUEST_STARTED if new_status == RepairRequest.Status.IN_PROGRESS else Notification.Type.REQUEST_COMPLETED,
+            title=f"Demande {new_status}",
+            message=f"{message}: {repair_request.title}",
+            request=repair_request
+        )
 
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
     def dashboard_stats(self, request):
@@ -559,21 +538,14 @@ class RepairRequestViewSet(CsrfExemptMixin, viewsets.ModelViewSet):
                 try:
                     user_lat = float(latitude)
                     user_lon = float(longitude)
-                    
-                    technicians_with_distance = []
-                    for technician in queryset:
-                        if technician.current_latitude and technician.current_longitude:
-                            distance = calculate_distance(
-                                user_lat, user_lon,
-                                technician.current_latitude, technician.current_longitude
-                            )
-                            if distance <= max_distance:
-                                technicians_with_distance.append((technician, distance))
-                    
-                    # Tri par distance
-                    technicians_with_distance.sort(key=lambda x: x[1])
-                    technicians = [tech for tech, _ in technicians_with_distance]
-                    
+
+                    # Recherche par rayon (index spatial ou boîte englobante SQL), triée par distance
+                    technicians = technicians_within_radius(
+                        user_lat, user_lon, max_distance, queryset,
+                        specialty=specialty or None,
+                        verified_only=True,
+                    )
+
                 except (ValueError, TypeError):
                     return Response(
                         {"error": "Coordonnées géographiques invalides"},
@@ -608,214 +580,11 @@ class RepairRequestViewSet(CsrfExemptMixin, viewsets.ModelViewSet):
                 {"error": "Accès non autorisé"}, status=403
             )
 
-        from django.utils import timezone
-        from django.db.models import Count, Sum, Avg, Q
-        from datetime import timedelta
-        from users.models import User, AuditLog
-        from decimal import Decimal
-
-        now = timezone.now()
-        last_30_days = now - timedelta(days=30)
-        last_7_days = now - timedelta(days=7)
-        last_24_hours = now - timedelta(hours=24)
-
-        # Statistiques utilisateurs
-        total_users = User.objects.count()
-        total_clients = User.objects.filter(user_type='client').count()
-        total_technicians = User.objects.filter(user_type='technician').count()
-        total_admins = User.objects.filter(user_type='admin').count()
-        
-        # Utilisateurs actifs (avec activité récente) - version robuste
-        active_client_ids = Client.objects.filter(
-            repair_requests__created_at__gte=last_30_days
-        ).values_list('user_id', flat=True)
-        active_technician_ids = Technician.objects.filter(
-            repair_requests__created_at__gte=last_30_days
-        ).values_list('user_id', flat=True)
-        active_users_30d = User.objects.filter(
-            Q(id__in=active_client_ids) | Q(id__in=active_technician_ids)
-        ).distinct().count()
-
-        # Statistiques demandes
-        total_requests = RepairRequest.objects.count()
-        pending_requests = RepairRequest.objects.filter(status="pending").count()
-        in_progress_requests = RepairRequest.objects.filter(status="in_progress").count()
-        completed_requests = RepairRequest.objects.filter(status="completed").count()
-        cancelled_requests = RepairRequest.objects.filter(status="cancelled").count()
-        
-        # Demandes récentes
-        requests_24h = RepairRequest.objects.filter(created_at__gte=last_24_hours).count()
-        requests_7d = RepairRequest.objects.filter(created_at__gte=last_7_days).count()
-        requests_30d = RepairRequest.objects.filter(created_at__gte=last_30_days).count()
-
-        # Statistiques financières
-        total_revenue = Payment.objects.filter(
-            status='completed', 
-            payment_type='client_payment'
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        
-        total_payouts = Payment.objects.filter(
-            status='completed', 
-            payment_type='technician_payout'
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        
-        platform_fees = total_revenue - total_payouts
-
-        # Statistiques par spécialité
-        specialty_stats = (
-            RepairRequest.objects.values("specialty_needed")
-            .annotate(
-                count=Count("id"),
-                completed=Count("id", filter=Q(status="completed")),
-                avg_price=Avg("final_price")
-            )
-            .order_by("-count")
-        )
-
-        # Statistiques techniciens
-        total_verified_technicians = Technician.objects.filter(is_verified=True).count()
-        total_available_technicians = Technician.objects.filter(is_available=True, is_verified=True).count()
-        
-        # Top techniciens par performance
-        top_technicians = (
-            Technician.objects.filter(is_verified=True)
-            .annotate(
-                total_jobs=Count("repair_requests", filter=Q(repair_requests__status="completed")),
-                avg_rating=Avg("repair_requests__review__rating", filter=Q(repair_requests__status="completed")),
-                total_earnings=Sum("repair_requests__payments__amount", filter=Q(repair_requests__payments__status="completed"))
-            )
-            .filter(total_jobs__gt=0)
-            .order_by("-total_jobs")[:10]
-        )
-
-        # Statistiques de satisfaction
-        total_reviews = Review.objects.count()
-        avg_rating = Review.objects.aggregate(avg=Avg('rating'))['avg'] or 0
-        satisfaction_rate = (
-            Review.objects.filter(rating__gte=4).count() / total_reviews * 100
-        ) if total_reviews > 0 else 0
-
-        # Statistiques de sécurité
-        total_logins = AuditLog.objects.filter(event_type='login', status='success').count()
-        failed_logins = AuditLog.objects.filter(event_type='login', status='failure').count()
-        security_alerts = AuditLog.objects.filter(risk_score__gte=80).count()
-        
-        # Statistiques temporelles (évolution)
-        daily_requests = []
-        for i in range(7):
-            date = now - timedelta(days=i)
-            count = RepairRequest.objects.filter(
-                created_at__date=date.date()
-            ).count()
-            daily_requests.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'count': count
-            })
-        daily_requests.reverse()
-
-        # Statistiques géographiques
-        city_stats = (
-            RepairRequest.objects.values("city")
-            .annotate(count=Count("id"))
-            .filter(city__isnull=False)
-            .exclude(city="")
-            .order_by("-count")[:10]
-        )
-
-        # Statistiques de paiement
-        payment_methods = (
-            Payment.objects.values("method")
-            .annotate(count=Count("id"), total=Sum("amount"))
-            .filter(status="completed")
-            .order_by("-total")
-        )
-
-        # Préparer les données de réponse
-        response_data = {
-            # Vue d'ensemble
-            'overview': {
-                'total_users': total_users,
-                'total_clients': total_clients,
-                'total_technicians': total_technicians,
-                'total_admins': total_admins,
-                'active_users_30d': active_users_30d,
-                'total_requests': total_requests,
-                'completed_requests': completed_requests,
-                'total_revenue': float(total_revenue),
-                'platform_fees': float(platform_fees),
-                'avg_rating': round(avg_rating, 1),
-                'satisfaction_rate': round(satisfaction_rate, 1)
-            },
-            
-            # Demandes
-            'requests': {
-                'total': total_requests,
-                'pending': pending_requests,
-                'in_progress': in_progress_requests,
-                'completed': completed_requests,
-                'cancelled': cancelled_requests,
-                'recent_24h': requests_24h,
-                'recent_7d': requests_7d,
-                'recent_30d': requests_30d,
-                'daily_evolution': daily_requests
-            },
-            
-            # Financier
-            'financial': {
-                'total_revenue': float(total_revenue),
-                'total_payouts': float(total_payouts),
-                'platform_fees': float(platform_fees),
-                'payment_methods': list(payment_methods)
-            },
-            
-            # Spécialités
-            'specialties': {
-                'stats': list(specialty_stats),
-                'top_technicians': [
-                    {
-                        'id': tech.id,
-                        'name': tech.user.get_full_name() or tech.user.username,
-                        'specialty': tech.get_specialty_display(),
-                        'total_jobs': tech.total_jobs,
-                        'avg_rating': round(tech.avg_rating or 0, 1),
-                        'total_earnings': float(tech.total_earnings or 0)
-                    }
-                    for tech in top_technicians
-                ]
-            },
-            
-            # Techniciens
-            'technicians': {
-                'total': total_technicians,
-                'verified': total_verified_technicians,
-                'available': total_available_technicians,
-                'availability_rate': round((total_available_technicians / total_verified_technicians * 100) if total_verified_technicians > 0 else 0, 1)
-            },
-            
-            # Satisfaction
-            'satisfaction': {
-                'total_reviews': total_reviews,
-                'avg_rating': round(avg_rating, 1),
-                'satisfaction_rate': round(satisfaction_rate, 1)
-            },
-            
-            # Sécurité
-            'security': {
-                'total_logins': total_logins,
-                'failed_logins': failed_logins,
-                'security_alerts': security_alerts,
-                'success_rate': round((total_logins / (total_logins + failed_logins) * 100) if (total_logins + failed_logins) > 0 else 0, 1)
-            },
-            
-            # Géographie
-            'geography': {
-                'top_cities': list(city_stats)
-            }
-        }
-
-        # DEBUG : Affiche la réponse dans la console
-        print("=== project_statistics response ===")
-        import pprint; pprint.pprint(response_data)
+        # Lecture de l'instantané pré-calculé (voir depannage/statistics.py)
+        force_refresh = request.query_params.get("refresh") in ("1", "true")
+        snapshot = get_statistics_snapshot(force_refresh=force_refresh)
+        response_data = dict(snapshot.data)
+        response_data["snapshot"] = snapshot_freshness(snapshot)
         return Response(response_data)
 
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
@@ -831,22 +600,17 @@ class RepairRequestViewSet(CsrfExemptMixin, viewsets.ModelViewSet):
             lng = float(lng)
         except ValueError:
             return Response({"error": "lat/lng invalides"}, status=400)
-        technicians = Technician.objects.filter(
-            specialty=specialty,
-            is_available=True,
-            is_verified=True,
-            current_latitude__isnull=False,
-            current_longitude__isnull=False,
+        results = technician_index.within_radius(
+            lat, lng, specialty=specialty, verified_only=True
         )
         tech_with_distance = []
-        for tech in technicians:
-            distance = calculate_distance(lat, lng, tech.current_latitude, tech.current_longitude)
+        for tech in hydrate_technicians(results):
             tech_with_distance.append({
                 "tech_id": tech.id,
                 "user_id": tech.user.id,
                 "username": tech.user.username,
                 "specialty": tech.specialty,
-                "distance_km": round(distance, 2),
+                "distance_km": tech.distance_km,
                 "is_available": tech.is_available,
                 "is_verified": tech.is_verified,
                 "lat": tech.current_latitude,
@@ -860,88 +624,61 @@ class RepairRequestViewSet(CsrfExemptMixin, viewsets.ModelViewSet):
         """Signaler que le technicien n'est pas venu : notification admin + réassignation automatique (max 2 fois)."""
         repair_request = self.get_object()
         user = request.user
-        from users.models import User
         # Incrémenter le compteur d'absence
         repair_request.no_show_count = (repair_request.no_show_count or 0) + 1
         repair_request.save()
         # Notifier l'admin
-        admin_users = User.objects.filter(is_staff=True, is_active=True)
-        for admin in admin_users:
-            Notification.objects.create(
-                recipient=admin,
-                title="Technicien non venu",
-                message=f"Le client a signalé l'absence du technicien pour la demande #{repair_request.id}",
-                type="technician_no_show",
-                request=repair_request,
-            )
+        notify_admins(
+            title="Technicien non venu",
+            message=f"Le client a signalé l'absence du technicien pour la demande #{repair_request.id}",
+            type="technician_no_show",
+            request=repair_request,
+        )
         # Limite de réaffectation automatique
         if repair_request.no_show_count > 2:
-            for admin in admin_users:
-                Notification.objects.create(
-                    recipient=admin,
-                    title="Intervention humaine requise",
-                    message=f"La demande #{repair_request.id} a déjà été réaffectée 2 fois. Intervention manuelle nécessaire.",
-                    type="manual_reassignment_required",
-                    request=repair_request,
-                )
-            Notification.objects.create(
-                recipient=repair_request.client.user,
+            notify_admins(
+                title="Intervention humaine requise",
+                message=f"La demande #{repair_request.id} a déjà été réaffectée 2 fois. Intervention manuelle nécessaire.",
+                type="manual_reassignment_required",
+                request=repair_request,
+            )
+            notify(
+                repair_request.client.user_id,
                 title="Intervention admin requise",
                 message=f"Nous n'avons pas pu réassigner automatiquement un technicien pour votre demande #{repair_request.id}. Un admin va vous contacter.",
                 type="manual_reassignment_required",
                 request=repair_request,
             )
             return Response({"success": False, "message": "Limite de réaffectation automatique atteinte. Intervention admin requise."}, status=400)
-        # Exclure le technicien précédent
+        # Relancer l'affectation (mêmes critères, hors technicien précédent)
         previous_technician = repair_request.technician
-        # Relancer le matching (mêmes critères, hors technicien précédent)
-        lat = repair_request.latitude
-        lng = repair_request.longitude
-        technicians = Technician.objects.filter(
-            specialty=repair_request.specialty_needed,
-            is_available=True,
-            is_verified=True,
-            current_latitude__isnull=False,
-            current_longitude__isnull=False,
-        ).exclude(id=previous_technician.id if previous_technician else None)
-        technicians = [t for t in technicians if t.has_active_subscription]
-        busy_tech_ids = set(
-            RepairRequest.objects.filter(
-                status__in=[RepairRequest.Status.ASSIGNED, RepairRequest.Status.IN_PROGRESS]
-            ).values_list('technician_id', flat=True)
-        )
-        technicians = [t for t in technicians if t.id not in busy_tech_ids]
-        MIN_RATING = 3.5
-        technicians = [t for t in technicians if t.average_rating >= MIN_RATING]
-        tech_with_distance = []
-        for tech in technicians:
-            distance = calculate_distance(lat, lng, tech.current_latitude, tech.current_longitude)
-            if distance <= tech.service_radius_km:
-                tech_with_distance.append((tech, distance))
-        tech_with_distance.sort(key=lambda x: x[1])
-        closest_techs = [t[0] for t in tech_with_distance[:10]]
-        # Réassigner au premier dispo
-        if closest_techs:
-            new_technician = closest_techs[0]
+        new_technician = dispatcher.best_technician(DispatchQuery.from_request(
+            repair_request,
+            exclude_ids=[previous_technician.id] if previous_technician else (),
+            min_rating=dispatcher.reassign_min_rating,
+        ))
+        # Réassigner au meilleur candidat
+        if new_technician is not None:
             repair_request.technician = new_technician
             repair_request.status = RepairRequest.Status.ASSIGNED
             repair_request.save()
-            # Notifier le nouveau technicien
-            Notification.objects.create(
-                recipient=new_technician.user,
-                title="Nouvelle demande réassignée",
-                message=f"Vous avez été réassigné à la demande #{repair_request.id}",
-                type="new_request_technician",
-                request=repair_request,
-            )
-            # Notifier le client avec le nom du nouveau technicien
-            Notification.objects.create(
-                recipient=repair_request.client.user,
-                title="Nouveau technicien en route",
-                message=f"{new_technician.user.get_full_name() or new_technician.user.username} a été réassigné à votre demande #{repair_request.id}",
-                type="technician_assigned",
-                request=repair_request,
-            )
+            # Notifier le nouveau technicien et le client (avec le nom du nouveau technicien)
+            dispatch_notifications([
+                build_notification(
+                    new_technician.user_id,
+                    title="Nouvelle demande réassignée",
+                    message=f"Vous avez été réassigné à la demande #{repair_request.id}",
+                    type="new_request_technician",
+                    request=repair_request,
+                ),
+                build_notification(
+                    repair_request.client.user_id,
+                    title="Nouveau technicien en route",
+                    message=f"{new_technician.user.get_full_name() or new_technician.user.username} a été réassigné à votre demande #{repair_request.id}",
+                    type="technician_assigned",
+                    request=repair_request,
+                ),
+            ])
             # Retirer l'ancien technicien des participants si différent du nouveau
             old_technician = None
             if repair_request.conversation.participants.count() > 1:
@@ -960,16 +697,14 @@ class RepairRequestViewSet(CsrfExemptMixin, viewsets.ModelViewSet):
             return Response({"success": True, "message": f"Demande réassignée à {new_technician.user.get_full_name() or new_technician.user.username}."})
         else:
             # Aucun technicien dispo
-            for admin in admin_users:
-                Notification.objects.create(
-                    recipient=admin,
-                    title="Aucun technicien disponible",
-                    message=f"Aucun technicien n'a pu être réassigné à la demande #{repair_request.id}",
-                    type="no_technician_available",
-                    request=repair_request,
-                )
-            Notification.objects.create(
-                recipient=repair_request.client.user,
+            notify_admins(
+                title="Aucun technicien disponible",
+                message=f"Aucun technicien n'a pu être réassigné à la demande #{repair_request.id}",
+                type="no_technician_available",
+                request=repair_request,
+            )
+            notify(
+                repair_request.client.user_id,
                 title="Aucun technicien disponible",
                 message=f"Nous n'avons pas pu réassigner un technicien pour votre demande #{repair_request.id}. Un admin va vous contacter.",
                 type="no_technician_available",
@@ -993,7 +728,7 @@ class RepairRequestViewSet(CsrfExemptMixin, viewsets.ModelViewSet):
         # Marquer comme validée
         repair_request.mission_validated = True
         repair_request.save()
-        # Envoi du reçu par email
+        # Envoi du reçu par email (worker run_jobs)
         try:
             subject = "Reçu de mission - Merci pour votre confiance !"
             message = (
@@ -1006,32 +741,26 @@ class RepairRequestViewSet(CsrfExemptMixin, viewsets.ModelViewSet):
                 f"Paiement : effectué en main propre au technicien.\n\n"
                 f"Merci d'avoir choisi notre plateforme !"
             )
-            send_mail(
-                subject,
-                message,
-                'no-reply@votreservice.ml',
-                [user.email],
-                fail_silently=True,
-            )
+            enqueue_email(subject, message, [user.email], from_email='no-reply@votreservice.ml')
         except Exception as e:
-            logger.error(f"Erreur lors de l'envoi du reçu de mission : {e}")
-        # Notification pour le reçu
-        Notification.objects.create(
-            recipient=user,
-            title="Reçu de mission",
-            message=f"Votre reçu de mission #{repair_request.id} est disponible.",
-            type="system",
-            request=repair_request,
-        )
-        
-        # Notification pour encourager la notation
-        Notification.objects.create(
-            recipient=user,
-            title="Partagez votre expérience !",
-            message=f"Votre mission avec {repair_request.technician.user.get_full_name() or repair_request.technician.user.username} est terminée. Aidez d'autres clients en notant votre technicien !",
-            type="review_reminder",
-            request=repair_request
-        )
+            logger.error(f"Erreur lors de la mise en file du reçu de mission : {e}")
+        # Notifications du reçu et d'encouragement à la notation
+        dispatch_notifications([
+            build_notification(
+                user,
+                title="Reçu de mission",
+                message=f"Votre reçu de mission #{repair_request.id} est disponible.",
+                type="system",
+                request=repair_request,
+            ),
+            build_notification(
+                user,
+                title="Partagez votre expérience !",
+                message=f"Votre mission avec {repair_request.technician.user.get_full_name() or repair_request.technician.user.username} est terminée. Aidez d'autres clients en notant votre technicien !",
+                type="review_reminder",
+                request=repair_request
+            ),
+        ])
         # Retourner les infos du reçu
         data = {
             "success": True,
@@ -1050,7 +779,7 @@ class RepairRequestViewSet(CsrfExemptMixin, viewsets.ModelViewSet):
 # ============================================================================
 
 
-class ClientViewSet(viewsets.ModelViewSet):
+class ClientViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les clients."""
 
     queryset = Client.objects.all()
@@ -1063,7 +792,7 @@ class ClientViewSet(viewsets.ModelViewSet):
         return Client.objects.select_related('user').all()
 
 
-class TechnicianViewSet(viewsets.ModelViewSet):
+class TechnicianViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les techniciens."""
 
     queryset = Technician.objects.all()
@@ -1301,7 +1030,7 @@ class TechnicianViewSet(viewsets.ModelViewSet):
             )
 
 
-class RequestDocumentViewSet(viewsets.ModelViewSet):
+class RequestDocumentViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les documents de demande."""
 
     queryset = RequestDocument.objects.all()
@@ -1314,7 +1043,19 @@ class RequestDocumentViewSet(viewsets.ModelViewSet):
         return RequestDocument.objects.select_related('request', 'uploaded_by').all()
 
 
-class ReviewViewSet(viewsets.ModelViewSet):
+REVIEW_EXPORT_COLUMNS = [
+    ExportColumn('id', 'id'),
+    ExportColumn('request_id', 'request_id'),
+    ExportColumn('technician_id', 'technician_id'),
+    ExportColumn('client_name', ('client__user__first_name', 'client__user__last_name'), format_full_name),
+    ExportColumn('technician_name', ('technician__user__first_name', 'technician__user__last_name'), format_full_name),
+    ExportColumn('rating', 'rating'),
+    ExportColumn('comment', 'comment'),
+    ExportColumn('created_at', 'created_at', format_datetime),
+]
+
+
+class ReviewViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les avis."""
 
     queryset = Review.objects.all()
@@ -1326,6 +1067,25 @@ class ReviewViewSet(viewsets.ModelViewSet):
         """Optimise les requêtes avec select_related."""
         return Review.objects.select_related('request', 'client__user', 'technician__user').all()
 
+    def get_renderers(self):
+        # La route "api/reviews/export/" appelle l'action hors routeur : pas d'initkwargs de @action
+        if self.action == "export":
+            return [renderer() for renderer in EXPORT_RENDERER_CLASSES]
+        return super().get_renderers()
+
+    @action(detail=False, methods=["get"], permission_classes=[IsAdminUser])
+    def export(self, request):
+        """Export CSV (ou Excel avec ``?format=excel``) de tous les avis, en flux."""
+        if not request.user.is_staff:
+            return Response({"error": "Accès non autorisé"}, status=403)
+        return export_response(
+            Review.objects.order_by('-created_at', '-id'),
+            REVIEW_EXPORT_COLUMNS,
+            filename='export_reviews',
+            export_format=request.GET.get('format', 'csv'),
+            sheet_title='Avis',
+        )
+
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
     def received(self, request):
         """Avis reçus optimisés pour les techniciens."""
@@ -1466,8 +1226,8 @@ class ReviewViewSet(viewsets.ModelViewSet):
             review.save()
             
             # Notification au technicien
-            Notification.objects.create(
-                recipient=review.technician.user,
+            notify(
+                review.technician.user_id,
                 type=Notification.Type.REVIEW_RECEIVED,
                 title="Avis mis à jour",
                 message=f"Un client a mis à jour son avis sur votre travail",
@@ -1548,7 +1308,7 @@ class ReviewViewSet(viewsets.ModelViewSet):
             )
 
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les paiements."""
 
     queryset = Payment.objects.all()
@@ -1594,7 +1354,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
             )
 
 
-class ConversationViewSet(viewsets.ModelViewSet):
+class ConversationViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les conversations."""
 
     queryset = Conversation.objects.all()
@@ -1628,7 +1388,7 @@ class ConversationViewSet(viewsets.ModelViewSet):
             )
 
 
-class MessageViewSet(viewsets.ModelViewSet):
+class MessageViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les messages."""
 
     queryset = Message.objects.all()
@@ -1678,7 +1438,7 @@ class MessageViewSet(viewsets.ModelViewSet):
             )
 
 
-class MessageAttachmentViewSet(viewsets.ModelViewSet):
+class MessageAttachmentViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les pièces jointes des messages."""
 
     queryset = MessageAttachment.objects.all()
@@ -1691,17 +1451,17 @@ class MessageAttachmentViewSet(viewsets.ModelViewSet):
         return MessageAttachment.objects.select_related('message').all()
 
 
-class NotificationViewSet(viewsets.ModelViewSet):
+class NotificationViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les notifications."""
 
     queryset = Notification.objects.all()
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = PageNumberPagination
+    pagination_class = NotificationPagination
 
     def get_queryset(self):
-        """Optimise les requêtes avec select_related."""
-        return Notification.objects.select_related('recipient', 'request').all()
+        """Notifications de l'utilisateur connecté, lues via l'index (recipient, created_at, id)."""
+        return Notification.objects.filter(recipient=self.request.user).select_related('recipient', 'request')
 
     @action(detail=True, methods=["post"])
     def mark_as_read(self, request, pk=None):
@@ -1749,7 +1509,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
             )
 
 
-class TechnicianLocationViewSet(viewsets.ModelViewSet):
+class TechnicianLocationViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les localisations des techniciens."""
 
     queryset = TechnicianLocation.objects.all()
@@ -1762,7 +1522,7 @@ class TechnicianLocationViewSet(viewsets.ModelViewSet):
         return TechnicianLocation.objects.select_related('technician__user').all()
 
 
-class SystemConfigurationViewSet(viewsets.ModelViewSet):
+class SystemConfigurationViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer la configuration système."""
 
     queryset = SystemConfiguration.objects.all()
@@ -1806,21 +1566,14 @@ class TechnicianNearbyViewSet(viewsets.GenericViewSet):
                 try:
                     user_lat = float(latitude)
                     user_lon = float(longitude)
-                    
-                    technicians_with_distance = []
-                    for technician in queryset:
-                        if technician.current_latitude and technician.current_longitude:
-                            distance = calculate_distance(
-                                user_lat, user_lon,
-                                technician.current_latitude, technician.current_longitude
-                            )
-                            if distance <= max_distance:
-                                technicians_with_distance.append((technician, distance))
-                    
-                    # Tri par distance
-                    technicians_with_distance.sort(key=lambda x: x[1])
-                    technicians = [tech for tech, _ in technicians_with_distance]
-                    
+
+                    # Recherche par rayon (index spatial ou boîte englobante SQL), triée par distance
+                    technicians = technicians_within_radius(
+                        user_lat, user_lon, max_distance, queryset,
+                        specialty=specialty or None,
+                        verified_only=True,
+                    )
+
                 except (ValueError, TypeError):
                     return Response(
                         {"error": "Coordonnées géographiques invalides"},
@@ -1845,28 +1598,8 @@ class TechnicianNearbyViewSet(viewsets.GenericViewSet):
                 status=500
             )
 
-    def calculate_haversine_distance(self, lat1, lon1, lat2, lon2):
-        """Calcule la distance entre deux points géographiques."""
-        from math import radians, cos, sin, asin, sqrt
-        
-        # Convertir en radians
-        lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-        
-        # Différences de coordonnées
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        
-        # Formule de Haversine
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * asin(sqrt(a))
-        
-        # Rayon de la Terre en km
-        r = 6371
-        
-        return c * r
-
 
-class ClientLocationViewSet(viewsets.ModelViewSet):
+class ClientLocationViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les localisations des clients."""
     queryset = ClientLocation.objects.all()
     serializer_class = ClientLocationSerializer
@@ -1878,7 +1611,7 @@ class ClientLocationViewSet(viewsets.ModelViewSet):
         return ClientLocation.objects.select_related('client__user').all()
 
 
-class ReportViewSet(viewsets.ModelViewSet):
+class ReportViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les signalements."""
     queryset = Report.objects.all().order_by('-created_at')
     serializer_class = ReportSerializer
@@ -1895,16 +1628,21 @@ class ReportViewSet(viewsets.ModelViewSet):
         """Crée un signalement avec notification admin."""
         report = serializer.save()
         
-        # Notification aux admins
-        admin_users = User.objects.filter(is_staff=True, is_active=True)
-        for admin in admin_users:
-            AdminNotification.objects.create(
-                title="Nouveau signalement",
-                message=f"Signalement créé par {report.sender.username}",
-                severity="warning",
-                related_request=report.request,
-                triggered_by=report.sender
-            )
+        # Une seule entrée dans le journal admin (elle n'a pas de destinataire),
+        # et une notification poussée en direct à chaque administrateur
+        AdminNotification.objects.create(
+            title="Nouveau signalement",
+            message=f"Signalement créé par {report.sender.username}",
+            severity="warning",
+            related_request=report.request,
+            triggered_by=report.sender
+        )
+        notify_admins(
+            title="Nouveau signalement",
+            message=f"Signalement créé par {report.sender.username}",
+            type=Notification.Type.SYSTEM,
+            request=report.request,
+        )
 
     def update(self, request, *args, **kwargs):
         """Met à jour un signalement avec validation."""
@@ -1932,7 +1670,7 @@ class ReportViewSet(viewsets.ModelViewSet):
             )
 
 
-class AdminNotificationViewSet(viewsets.ModelViewSet):
+class AdminNotificationViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les notifications admin."""
     queryset = AdminNotification.objects.order_by('-created_at')
     serializer_class = AdminNotificationSerializer
@@ -1947,101 +1685,85 @@ class AdminNotificationViewSet(viewsets.ModelViewSet):
         logger.info(f"Notification admin mise à jour: {notification.id}")
 
 
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def background_job_status(request, pk):
+    """État d'une tâche de fond (par exemple un export PDF des statistiques)."""
+    job = get_object_or_404(BackgroundJob, pk=pk)
+    return Response({
+        "id": job.id,
+        "name": job.name,
+        "status": job.status,
+        "attempts": job.attempts,
+        "result": job.result,
+        "error": job.last_error if job.status == BackgroundJob.Status.FAILED else None,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    })
+
+
+def filter_audit_logs(request):
+    """Journal d'audit filtré selon les paramètres de la requête (liste et export)."""
+    logs = AuditLog.objects.all()
+    # Filtres dynamiques
+    event_type = request.GET.get('event_type')
+    status = request.GET.get('status')
+    user_email = request.GET.get('user_email')
+    start_date = request.GET.get('start_date')
+    end_date = request.GET.get('end_date')
+    if event_type:
+        logs = logs.filter(event_type__icontains=event_type)
+    if status:
+        logs = logs.filter(status__icontains=status)
+    if user_email:
+        logs = logs.filter(user__email__icontains=user_email)
+    if start_date:
+        logs = logs.filter(timestamp__gte=start_date)
+    if end_date:
+        logs = logs.filter(timestamp__lte=end_date)
+    return logs
+
+
+AUDIT_LOG_EXPORT_COLUMNS = [
+    ExportColumn('Date', 'timestamp', format_datetime),
+    ExportColumn('Utilisateur', 'user__email'),
+    ExportColumn('Type', 'event_type'),
+    ExportColumn('Statut', 'status'),
+    ExportColumn('IP', 'ip_address'),
+    ExportColumn('Pays', 'geo_country'),
+    ExportColumn('Ville', 'geo_city'),
+    ExportColumn('User Agent', 'user_agent'),
+    ExportColumn('Risque', 'risk_score'),
+    ExportColumn('Détails', 'metadata', lambda metadata: str(metadata) if metadata else ''),
+]
+
+
 class AuditLogListView(APIView):
     permission_classes = [permissions.IsAdminUser]
     def get(self, request):
-        logs = AuditLog.objects.all()
-        # Filtres dynamiques
-        event_type = request.GET.get('event_type')
-        status = request.GET.get('status')
-        user_email = request.GET.get('user_email')
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
-        if event_type:
-            logs = logs.filter(event_type__icontains=event_type)
-        if status:
-            logs = logs.filter(status__icontains=status)
-        if user_email:
-            logs = logs.filter(user__email__icontains=user_email)
-        if start_date:
-            logs = logs.filter(timestamp__gte=start_date)
-        if end_date:
-            logs = logs.filter(timestamp__lte=end_date)
-        logs = logs.order_by('-timestamp')[:100]
-        serializer = AuditLogSerializer(logs, many=True)
-        return Response(serializer.data)
-
-    @action(detail=False, methods=["get"], url_path="export", permission_classes=[permissions.IsAdminUser])
-    def export(self, request):
-        logs = AuditLog.objects.all()
-        # Filtres dynamiques
-        event_type = request.GET.get('event_type')
-        status = request.GET.get('status')
-        user_email = request.GET.get('user_email')
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
-        if event_type:
-            logs = logs.filter(event_type__icontains=event_type)
-        if status:
-            logs = logs.filter(status__icontains=status)
-        if user_email:
-            logs = logs.filter(user__email__icontains=user_email)
-        if start_date:
-            logs = logs.filter(timestamp__gte=start_date)
-        if end_date:
-            logs = logs.filter(timestamp__lte=end_date)
-        logs = logs.order_by('-timestamp')
-        export_format = request.GET.get('format', 'csv')
-        fields = [
-            'timestamp', 'user__email', 'event_type', 'status', 'ip_address', 'geo_country', 'geo_city', 'user_agent', 'risk_score', 'metadata'
-        ]
-        if export_format == 'excel':
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = "Audit Log"
-            ws.append(['Date', 'Utilisateur', 'Type', 'Statut', 'IP', 'Pays', 'Ville', 'User Agent', 'Risque', 'Détails'])
-            for log in logs:
-                ws.append([
-                    log.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                    getattr(log.user, 'email', ''),
-                    log.event_type,
-                    log.status,
-                    log.ip_address,
-                    log.geo_country,
-                    log.geo_city,
-                    log.user_agent,
-                    log.risk_score,
-                    str(log.metadata) if log.metadata else ''
-                ])
-            from io import BytesIO
-            output = BytesIO()
-            wb.save(output)
-            output.seek(0)
-            response = HttpResponse(output, content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-            response['Content-Disposition'] = 'attachment; filename="audit_log.xlsx"'
-            return response
-        else:
-            response = HttpResponse(content_type='text/csv')
-            response['Content-Disposition'] = 'attachment; filename="audit_log.csv"'
-            writer = csv.writer(response)
-            writer.writerow(['Date', 'Utilisateur', 'Type', 'Statut', 'IP', 'Pays', 'Ville', 'User Agent', 'Risque', 'Détails'])
-            for log in logs:
-                writer.writerow([
-                    log.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                    getattr(log.user, 'email', ''),
-                    log.event_type,
-                    log.status,
-                    log.ip_address,
-                    log.geo_country,
-                    log.geo_city,
-                    log.user_agent,
-                    log.risk_score,
-                    str(log.metadata) if log.metadata else ''
-                ])
-            return response
-
-
-class ChatConversationViewSet(viewsets.ModelViewSet):
+        logs = filter_audit_logs(request)
+        paginator = AuditLogPagination()
+        page = paginator.paginate_queryset(logs.select_related('user'), request, view=self)
+        serializer = AuditLogSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+@renderer_classes(EXPORT_RENDERER_CLASSES)
+def export_audit_logs(request):
+    """Export CSV (par défaut) ou Excel (``?format=excel``) du journal d'audit, en flux."""
+    logs = filter_audit_logs(request).order_by('-timestamp', '-id')
+    return export_response(
+        logs,
+        AUDIT_LOG_EXPORT_COLUMNS,
+        filename='audit_log',
+        export_format=request.GET.get('format', 'csv'),
+        sheet_title='Audit Log',
+    )
+
+
+class ChatConversationViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les conversations de chat optimisées."""
     
     serializer_class = ChatConversationSerializer
@@ -2049,13 +1771,13 @@ class ChatConversationViewSet(viewsets.ModelViewSet):
     pagination_class = PageNumberPagination
 
     def get_queryset(self):
-        """Optimise les requêtes avec select_related."""
+        """Dernier message et non-lus annotés : une requête pour toute la boîte de réception."""
         user = self.request.user
         return ChatConversation.objects.filter(
             Q(client=user) | Q(technician=user)
         ).select_related(
             'client', 'technician', 'request'
-        ).prefetch_related('messages').order_by('-last_message_at')
+        ).with_inbox_data(user).order_by('-last_message_at')
 
     @action(detail=False, methods=['post'], url_path='get_or_create', url_name='get_or_create')
     def get_or_create_conversation(self, request):
@@ -2136,7 +1858,7 @@ class ChatConversationViewSet(viewsets.ModelViewSet):
             )
 
 
-class ChatMessageViewSet(viewsets.ModelViewSet):
+class ChatMessageViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les messages de chat optimisés."""
     
     serializer_class = ChatMessageSerializer
@@ -2163,9 +1885,9 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
             conversation.save()
             
             # Notification à l'autre utilisateur
-            other_user = conversation.client if message.sender == conversation.technician else conversation.technician
-            Notification.objects.create(
-                recipient=other_user,
+            other_user_id = conversation.client_id if message.sender_id == conversation.technician_id else conversation.technician_id
+            notify(
+                other_user_id,
                 type=Notification.Type.MESSAGE_RECEIVED,
                 title="Nouveau message",
                 message=f"Nouveau message de {message.sender.get_full_name()}",
@@ -2185,16 +1907,15 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
             
             # Vérifier les permissions
             user = request.user
-            if user not in [conversation.client, conversation.technician]:
+            if user.id not in (conversation.client_id, conversation.technician_id):
                 return Response({"error": "Accès non autorisé"}, status=403)
             
             messages = ChatMessage.objects.filter(
                 conversation=conversation
-            ).select_related('sender').prefetch_related('attachments').order_by('created_at')
+            ).select_related('sender').prefetch_related('attachments')
             
-            # Pagination
-            paginator = PageNumberPagination()
-            paginator.page_size = 50
+            # Pagination par curseur : dernière page d'abord, ?before= pour remonter l'historique
+            paginator = ChatMessagePagination()
             paginated_messages = paginator.paginate_queryset(messages, request)
             
             serializer = ChatMessageSerializer(paginated_messages, many=True)
@@ -2202,6 +1923,8 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
             
         except ChatConversation.DoesNotExist:
             return Response({"error": "Conversation non trouvée"}, status=404)
+        except NotFound as e:
+            return Response({"error": str(e.detail)}, status=404)
         except Exception as e:
             logger.error(f"Erreur lors de la récupération des messages: {e}")
             return Response(
@@ -2266,7 +1989,7 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
             )
 
 
-class ChatMessageAttachmentViewSet(viewsets.ModelViewSet):
+class ChatMessageAttachmentViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les pièces jointes de chat optimisées."""
     
     serializer_class = ChatMessageAttachmentSerializer
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.html import format_html
-from .models import User, AuditLog, OTPChallenge, PasswordResetToken, PieceJointe, TechnicianProfile
+from .models import User, AuditLog, AuditLogRollup, OTPChallenge, PasswordResetToken, PieceJointe, TechnicianProfile
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
@@ -45,6 +45,12 @@ class AuditLogAdmin(admin.ModelAdmin):
     list_filter = ('event_type', 'status', 'geo_country')
     readonly_fields = ('timestamp',)
 
+@admin.register(AuditLogRollup)
+class AuditLogRollupAdmin(admin.ModelAdmin):
+    list_display = ('bucket', 'granularity', 'event_type', 'status', 'geo_country', 'user_id', 'high_risk', 'count')
+    list_filter = ('granularity', 'event_type', 'status', 'high_risk')
+    date_hierarchy = 'bucket'
+
 @admin.register(OTPChallenge)
 class OTPChallengeAdmin(admin.ModelAdmin):
     list_display = ('user', 'code', 'created_at', 'is_used', 'session_uuid', 'expires_at')
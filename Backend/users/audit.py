@@ -0,0 +1,145 @@
+"""
+Écriture différée du journal d'audit.
+
+``log_event`` ne fait plus d'aller-retour en base : l'événement est déposé
+dans une file bornée et un thread d'écriture l'enregistre avec les suivants
+en un ``bulk_create`` (au plus ``BATCH_SIZE`` lignes, toutes les
+``FLUSH_INTERVAL_SECONDS`` au plus tard). La géolocalisation (lecteur GeoIP
+partagé, voir depannage/geoip.py) est faite par lot, une fois par IP, et les
+agrégats horaires/journaliers (users/rollups.py) sont mis à jour par lot.
+
+- contre-pression : si la file est pleine (``MAX_BUFFER``), l'appelant vide
+  lui-même un lot avant d'ajouter son événement ; rien n'est perdu ;
+- arrêt : ``close`` (enregistré avec ``atexit``) écrit ce qui reste en file ;
+- ``AUDIT_SETTINGS['ASYNC'] = False`` écrit chaque lot de façon synchrone
+  (tests, commandes de gestion).
+"""
+import atexit
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class AuditBuffer:
+    def __init__(self, max_size=10000, batch_size=500, flush_interval=0.5, asynchronous=True):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.asynchronous = asynchronous
+        self._queue = queue.Queue(maxsize=max_size)
+        self._thread = None
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        # Une seule écriture à la fois : le thread et un appelant en contre-pression
+        self._write_lock = threading.Lock()
+
+    def record(self, **fields):
+        """Ajoute un événement (champs d'``AuditLog`` ; ``location`` est calculée au moment de l'écriture)."""
+        if not self.asynchronous:
+            self.write([fields])
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(fields)
+        except queue.Full:
+            # Contre-pression : l'appelant écrit un lot pour libérer de la place
+            self.flush(limit=self.batch_size)
+            self._queue.put(fields)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first] + self._drain(self.batch_size - 1)
+            self.write(batch)
+            close_old_connections()
+
+    def _drain(self, limit):
+        items = []
+        while len(items) < limit:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def flush(self, limit=None):
+        """Écrit immédiatement les événements en file (tous, ou au plus ``limit``)."""
+        written = 0
+        while limit is None or written < limit:
+            size = self.batch_size if limit is None else min(self.batch_size, limit - written)
+            batch = self._drain(size)
+            if not batch:
+                break
+            self.write(batch)
+            written += len(batch)
+        return written
+
+    def write(self, events):
+        from depannage.geoip import geoip_lookup
+        from .models import AuditLog
+
+        logs = []
+        for fields in events:
+            # Une recherche par IP distincte du lot, les suivantes sont servies par le cache
+            location = geoip_lookup.lookup(fields.get("ip_address"))
+            logs.append(AuditLog(**{
+                **fields,
+                "geo_country": fields.get("geo_country") or location.country,
+                "geo_city": fields.get("geo_city") or location.city,
+                "location": location.label,
+            }))
+        from .rollups import record_rollups
+
+        with self._write_lock:
+            try:
+                with transaction.atomic():
+                    AuditLog.objects.bulk_create(logs)
+                    record_rollups(logs)
+            except DatabaseError:
+                logger.exception("Échec de l'écriture groupée de %s événements d'audit, écriture unitaire", len(logs))
+                for log in logs:
+                    log.pk = None
+                    log._state.adding = True
+                    try:
+                        # post_save met à jour les agrégats
+                        log.save()
+                    except DatabaseError:
+                        logger.exception("Événement d'audit perdu : %s %s", log.event_type, log.status)
+        # bulk_create n'émet pas post_save : l'instantané des statistiques est invalidé ici
+        from depannage.statistics import mark_statistics_dirty
+        mark_statistics_dirty()
+
+    def close(self):
+        """Arrête le thread d'écriture puis écrit le reste de la file."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(self.flush_interval * 4, 1))
+            self._thread = None
+        self.flush()
+
+
+_audit_settings = getattr(settings, "AUDIT_SETTINGS", {})
+
+audit_buffer = AuditBuffer(
+    max_size=_audit_settings.get("MAX_BUFFER", 10000),
+    batch_size=_audit_settings.get("BATCH_SIZE", 500),
+    flush_interval=_audit_settings.get("FLUSH_INTERVAL_SECONDS", 0.5),
+    asynchronous=_audit_settings.get("ASYNC", True),
+)
+atexit.register(audit_buffer.close)
@@ -0,0 +1,49 @@
+from django.db import migrations, models
+
+
+def populate_rollups(apps, schema_editor):
+    from users.rollups import rebuild_rollups
+
+    rebuild_rollups(
+        audit_log_model=apps.get_model('users', 'AuditLog'),
+        rollup_model=apps.get_model('users', 'AuditLogRollup'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_auditlog_timestamp_id_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['event_type', 'status', 'timestamp'], name='users_audit_event_t_3c5684_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['risk_score', 'timestamp'], name='users_audit_risk_sc_9031b6_idx'),
+        ),
+        migrations.CreateModel(
+            name='AuditLogRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Heure'), ('day', 'Jour')], max_length=8)),
+                ('bucket', models.DateTimeField(help_text="Début de l'heure ou du jour (UTC)")),
+                ('event_type', models.CharField(max_length=32)),
+                ('status', models.CharField(max_length=16)),
+                ('geo_country', models.CharField(blank=True, max_length=64)),
+                ('user_id', models.PositiveIntegerField(default=0)),
+                ('high_risk', models.BooleanField(default=False)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': "Agrégat du journal d'audit",
+                'verbose_name_plural': "Agrégats du journal d'audit",
+                'indexes': [models.Index(fields=['granularity', 'event_type', 'bucket'], name='users_audit_granula_6dcf63_idx')],
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'bucket', 'event_type', 'status', 'geo_country', 'user_id', 'high_risk'), name='unique_audit_rollup_bucket')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
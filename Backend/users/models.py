@@ -5,6 +5,8 @@ from django.contrib.auth import get_user_model
 import uuid
 from django.utils import timezone
 from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
 class CustomUserManager(UserManager):
     def create_superuser(self, username, email=None, password=None, **extra_fields):
@@ -82,9 +84,58 @@ class AuditLog(models.Model):
     risk_score = models.PositiveSmallIntegerField(default=0)
     metadata = models.JSONField(blank=True, default=dict)
 
+    class Meta:
+        indexes = [
+            # Pagination par curseur (timestamp, id) de la liste admin
+            models.Index(fields=['timestamp', 'id']),
+            # Filtres par type/statut sur une période (localisations de connexion, archivage)
+            models.Index(fields=['event_type', 'status', 'timestamp']),
+            models.Index(fields=['risk_score', 'timestamp']),
+        ]
+
     def __str__(self):
         return f"[{self.timestamp}] {self.user} - {self.event_type} ({self.status})"
 
+class AuditLogRollup(models.Model):
+    """
+    Compteurs d'événements d'audit par heure et par jour (voir users/rollups.py).
+
+    Tenus à jour à l'écriture des événements : les tableaux de bord de
+    sécurité lisent ces agrégats au lieu de compter le journal brut, qui peut
+    être archivé (``archive_audit_logs``).
+    """
+    GRANULARITY_HOUR = 'hour'
+    GRANULARITY_DAY = 'day'
+    GRANULARITY_CHOICES = [
+        (GRANULARITY_HOUR, 'Heure'),
+        (GRANULARITY_DAY, 'Jour'),
+    ]
+    granularity = models.CharField(max_length=8, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField(help_text="Début de l'heure ou du jour (UTC)")
+    event_type = models.CharField(max_length=32)
+    status = models.CharField(max_length=16)
+    geo_country = models.CharField(max_length=64, blank=True)
+    # 0 pour les événements sans utilisateur ; pas de clé étrangère, l'agrégat survit au compte
+    user_id = models.PositiveIntegerField(default=0)
+    high_risk = models.BooleanField(default=False)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Agrégat du journal d'audit"
+        verbose_name_plural = "Agrégats du journal d'audit"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket', 'event_type', 'status', 'geo_country', 'user_id', 'high_risk'],
+                name='unique_audit_rollup_bucket',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['granularity', 'event_type', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket:%Y-%m-%d %H:%M} {self.event_type}/{self.status}: {self.count}"
+
 class OTPChallenge(models.Model):
     user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
     code = models.CharField(max_length=6)
@@ -151,3 +202,20 @@ class TechnicianProfile(models.Model):
 
     def __str__(self):
         return f"{self.user.username} ({self.specialty})"
+
+
+# Cache d'authentification (auth/token_cache.py) : instantané utilisateur
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_auth_user_snapshot(sender, instance, **kwargs):
+    from auth.token_cache import token_cache
+    token_cache.invalidate_user(instance.pk)
+
+
+
+# Agrégats du journal d'audit ; les écritures groupées (users/audit.py) les mettent à jour elles-mêmes
+@receiver(post_save, sender=AuditLog)
+def update_audit_rollups(sender, instance, created, **kwargs):
+    if created:
+        from .rollups import record_rollups
+        record_rollups([instance])
@@ -0,0 +1,193 @@
+"""
+Agrégats horaires et journaliers du journal d'audit.
+
+Chaque événement écrit incrémente deux lignes ``AuditLogRollup`` (son heure
+et son jour), par type, statut, pays, utilisateur et niveau de risque. Un lot
+de ``bulk_create`` est d'abord regroupé en mémoire : une mise à jour
+``count = count + n`` par clé distincte, pas par événement.
+
+Les tableaux de bord (``security_summary``) somment ces agrégats : le coût
+dépend du nombre de clés, plus du volume du journal brut, qui peut donc être
+archivé puis purgé (``archive_audit_logs``) sans fausser les totaux.
+
+``rebuild_rollups`` recalcule les agrégats depuis le journal brut (mise en
+place sur une base existante, ou après correction).
+"""
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+HIGH_RISK_SCORE = 80
+
+LOGIN_SUCCESS = Q(event_type="login", status="success")
+LOGIN_FAILURE = Q(event_type="login", status="failure")
+OTP_SENT = Q(event_type="otp_sent")
+HIGH_RISK_LOGIN = Q(event_type="login", high_risk=True)
+
+ROLLUP_FIELDS = ("granularity", "bucket", "event_type", "status", "geo_country", "user_id", "high_risk")
+
+
+def bucket_start(moment, granularity):
+    """Début (UTC) de l'heure ou du jour contenant ``moment``."""
+    from .models import AuditLogRollup
+
+    moment = moment.astimezone(dt_timezone.utc)
+    if granularity == AuditLogRollup.GRANULARITY_DAY:
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_keys(log):
+    from .models import AuditLogRollup
+
+    moment = log.timestamp or timezone.now()
+    for granularity in (AuditLogRollup.GRANULARITY_HOUR, AuditLogRollup.GRANULARITY_DAY):
+        yield (
+            granularity,
+            bucket_start(moment, granularity),
+            log.event_type,
+            log.status,
+            log.geo_country or "",
+            log.user_id or 0,
+            (log.risk_score or 0) >= HIGH_RISK_SCORE,
+        )
+
+
+def record_rollups(logs):
+    """Ajoute des événements enregistrés (instances ``AuditLog``) aux agrégats."""
+    counts = Counter(key for log in logs for key in rollup_keys(log))
+    if not counts:
+        return
+    with transaction.atomic():
+        for key, amount in counts.items():
+            _increment(dict(zip(ROLLUP_FIELDS, key)), amount)
+
+
+def _increment(fields, amount):
+    from .models import AuditLogRollup
+
+    if AuditLogRollup.objects.filter(**fields).update(count=F("count") + amount):
+        return
+    try:
+        with transaction.atomic():
+            AuditLogRollup.objects.create(count=amount, **fields)
+    except IntegrityError:
+        # Ligne créée entre-temps par un autre processus
+        AuditLogRollup.objects.filter(**fields).update(count=F("count") + amount)
+
+
+def rebuild_rollups(since=None, audit_log_model=None, rollup_model=None):
+    """
+    Recalcule les agrégats depuis le journal brut (à partir du jour de ``since``) ; retourne le nombre de lignes.
+    Les modèles peuvent être fournis (modèles historiques d'une migration).
+    """
+    from .models import AuditLog, AuditLogRollup
+
+    audit_log_model = audit_log_model or AuditLog
+    rollup_model = rollup_model or AuditLogRollup
+    logs = audit_log_model.objects.all()
+    rollups = rollup_model.objects.all()
+    if since is not None:
+        since = bucket_start(since, AuditLogRollup.GRANULARITY_DAY)
+        logs = logs.filter(timestamp__gte=since)
+        rollups = rollups.filter(bucket__gte=since)
+
+    truncs = {
+        AuditLogRollup.GRANULARITY_HOUR: TruncHour("timestamp", tzinfo=dt_timezone.utc),
+        AuditLogRollup.GRANULARITY_DAY: TruncDay("timestamp", tzinfo=dt_timezone.utc),
+    }
+    created = 0
+    with transaction.atomic():
+        rollups.delete()
+        for granularity, trunc in truncs.items():
+            rows = (
+                logs.annotate(bucket=trunc)
+                .values("bucket", "event_type", "status", "geo_country", "user_id",
+                        "risk_score")
+                .annotate(count=Count("id"))
+            )
+            # risk_score est regroupé tel quel puis replié sur le seuil en mémoire
+            counts = Counter()
+            for row in rows.iterator():
+                counts[(
+                    granularity,
+                    row["bucket"],
+                    row["event_type"],
+                    row["status"],
+                    row["geo_country"] or "",
+                    row["user_id"] or 0,
+                    row["risk_score"] >= HIGH_RISK_SCORE,
+                )] += row["count"]
+            rollup_model.objects.bulk_create(
+                [rollup_model(count=amount, **dict(zip(ROLLUP_FIELDS, key))) for key, amount in counts.items()],
+                batch_size=1000,
+            )
+            created += len(counts)
+    return created
+
+
+def security_totals():
+    """Totaux depuis l'origine : connexions, échecs, OTP, connexions et événements à risque."""
+    from .models import AuditLogRollup
+
+    return AuditLogRollup.objects.filter(granularity=AuditLogRollup.GRANULARITY_DAY).aggregate(
+        total_logins=Sum("count", filter=LOGIN_SUCCESS, default=0),
+        failed_logins=Sum("count", filter=LOGIN_FAILURE, default=0),
+        otp_sent=Sum("count", filter=OTP_SENT, default=0),
+        high_risk_logins=Sum("count", filter=HIGH_RISK_LOGIN, default=0),
+        security_alerts=Sum("count", filter=Q(high_risk=True), default=0),
+    )
+
+
+def security_summary(now=None, days=7, top=5):
+    """Indicateurs du tableau de bord de sécurité, calculés sur les agrégats."""
+    from .models import AuditLogRollup, User
+
+    now = now or timezone.now()
+    daily = AuditLogRollup.objects.filter(granularity=AuditLogRollup.GRANULARITY_DAY)
+    totals = security_totals()
+    # Fenêtre glissante à l'heure près
+    recent = AuditLogRollup.objects.filter(
+        granularity=AuditLogRollup.GRANULARITY_HOUR,
+        bucket__gte=bucket_start(now - timedelta(days=days), AuditLogRollup.GRANULARITY_HOUR),
+    ).aggregate(
+        logins_recent=Sum("count", filter=LOGIN_SUCCESS, default=0),
+        failed_recent=Sum("count", filter=LOGIN_FAILURE, default=0),
+        otp_recent=Sum("count", filter=OTP_SENT, default=0),
+    )
+
+    top_countries = list(
+        daily.filter(LOGIN_SUCCESS)
+        .values("geo_country")
+        .annotate(count=Sum("count"))
+        .order_by("-count")[:top]
+    )
+    risky = list(
+        daily.filter(HIGH_RISK_LOGIN)
+        .values("user_id")
+        .annotate(count=Sum("count"))
+        .order_by("-count")[:top]
+    )
+    emails = dict(User.objects.filter(pk__in=[row["user_id"] for row in risky]).values_list("pk", "email"))
+    top_risk_users = [{"user__email": emails.get(row["user_id"]), "count": row["count"]} for row in risky]
+
+    return {
+        **totals,
+        **recent,
+        "top_countries": top_countries,
+        "top_risk_users": top_risk_users,
+    }
+
+
+def prune_hourly_rollups(before):
+    """Supprime les agrégats horaires antérieurs à ``before`` (les journaliers sont conservés)."""
+    from .models import AuditLogRollup
+
+    deleted, _ = AuditLogRollup.objects.filter(
+        granularity=AuditLogRollup.GRANULARITY_HOUR, bucket__lt=before
+    ).delete()
+    return deleted
@@ -1,3 +1,187 @@
 from django.test import TestCase
+from django.utils import timezone
+import json
+import os
+from django.contrib.auth import get_user_model
 
-# Create your tests here.
+
+class TokenCacheTest(TestCase):
+    def setUp(self):
+        # Révocations et instantanés survivent sinon d'un test à l'autre (identifiants réutilisés)
+        from django.core.cache import cache
+        from auth.token_cache import token_cache
+        cache.clear()
+        token_cache.clear()
+
+    def test_token_decoded_once_and_user_cached_until_logout(self):
+        """Le jeton est décodé une fois, l'utilisateur lu une fois ; la déconnexion révoque le jeton."""
+        from unittest import mock
+        from django.contrib.auth.models import AnonymousUser
+        from django.db import connection
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from django.test.utils import CaptureQueriesContext
+        from rest_framework.exceptions import AuthenticationFailed
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from rest_framework_simplejwt.tokens import RefreshToken
+        from auth import token_cache as token_cache_module
+        from auth.middleware import TokenValidationMiddleware
+        from auth.token_cache import CachedJWTAuthentication, token_cache
+        from users.views import UserViewSet
+        User = get_user_model()
+        user = User.objects.create_user(username="jwt_user", email="jwt_user@example.com", password="x")
+        refresh = RefreshToken.for_user(user)
+        access = str(refresh.access_token)
+        middleware = TokenValidationMiddleware(lambda request: HttpResponse("ok"))
+
+        def authenticate():
+            request = RequestFactory().get("/depannage/api/notifications/", HTTP_AUTHORIZATION=f"Bearer {access}")
+            middleware(request)
+            return CachedJWTAuthentication().authenticate(Request(request))
+
+        with mock.patch.object(token_cache_module, "AccessToken", wraps=token_cache_module.AccessToken) as decode:
+            with CaptureQueriesContext(connection) as queries:
+                first_user, _ = authenticate()
+                second_user, _ = authenticate()
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(second_user.pk, user.pk)
+        self.assertIsNot(first_user, second_user)
+
+        user.first_name = "Awa"
+        user.save()
+        self.assertEqual(authenticate()[0].first_name, "Awa")
+
+        request = APIRequestFactory().post(
+            "/users/logout/", {"refresh": str(refresh)}, format="json", HTTP_AUTHORIZATION=f"Bearer {access}"
+        )
+        request.user = AnonymousUser()
+        response = UserViewSet.as_view({"post": "logout"})(request)
+        self.assertEqual(response.status_code, 200)
+        with self.assertRaises(AuthenticationFailed):
+            authenticate()
+
+    def test_logout_everywhere_revokes_access_tokens_issued_before(self):
+        """Une déconnexion simple épargne les autres appareils ; ``everywhere`` coupe leurs jetons déjà émis."""
+        from datetime import timedelta
+        from django.contrib.auth.models import AnonymousUser
+        from rest_framework.exceptions import AuthenticationFailed
+        from rest_framework.test import APIRequestFactory
+        from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+        from rest_framework_simplejwt.tokens import RefreshToken
+        from auth.token_cache import token_cache
+        from users.views import UserViewSet
+        User = get_user_model()
+        user = User.objects.create_user(username="jwt_other", email="jwt_other@example.com", password="x")
+        # Jeton d'un autre appareil, émis quelques secondes avant la déconnexion
+        other_device = RefreshToken.for_user(user).access_token
+        other_device.set_iat(at_time=timezone.now() - timedelta(seconds=10))
+        other_device = str(other_device)
+
+        def logout(**data):
+            refresh = RefreshToken.for_user(user)
+            request = APIRequestFactory().post(
+                "/users/logout/", {"refresh": str(refresh), **data}, format="json",
+                HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}",
+            )
+            request.user = AnonymousUser()
+            self.assertEqual(UserViewSet.as_view({"post": "logout"})(request).status_code, 200)
+
+        logout()
+        self.assertEqual(token_cache.authenticate(token_cache.validate(other_device)).pk, user.pk)
+
+        logout(everywhere=True)
+        with self.assertRaises(AuthenticationFailed):
+            token_cache.authenticate(token_cache.validate(other_device))
+        self.assertFalse(OutstandingToken.objects.filter(user=user, blacklistedtoken__isnull=True).exists())
+        later = str(RefreshToken.for_user(user).access_token)
+        self.assertEqual(token_cache.authenticate(token_cache.validate(later)).pk, user.pk)
+
+
+class AuditBufferTest(TestCase):
+    def test_backpressure_batches_and_flush_on_close(self):
+        """File pleine : l'appelant écrit un lot ; close() écrit le reste ; géolocalisation faite au lot."""
+        from unittest import mock
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from users.audit import AuditBuffer
+        from users.models import AuditLog
+        from depannage.geoip import GeoLocation, geoip_lookup
+
+        buffer = AuditBuffer(max_size=2, batch_size=2, asynchronous=True)
+        events = [
+            dict(ip_address="41.73.0.1", user_agent="ua", event_type="login", status="failure", risk_score=100)
+            for _ in range(5)
+        ]
+        with mock.patch.object(buffer, "_ensure_started"), \
+                mock.patch.object(geoip_lookup, "lookup", return_value=GeoLocation("Mali", "Bamako")):
+            with CaptureQueriesContext(connection) as queries:
+                for fields in events[:2]:
+                    buffer.record(**fields)
+            self.assertEqual(len(queries), 0)
+            self.assertEqual(AuditLog.objects.count(), 0)
+
+            buffer.record(**events[2])  # file pleine : un lot de 2 est écrit par l'appelant
+            self.assertEqual(AuditLog.objects.count(), 2)
+            for fields in events[3:]:
+                buffer.record(**fields)
+            buffer.close()
+        self.assertEqual(AuditLog.objects.count(), 5)
+        self.assertEqual(set(AuditLog.objects.values_list("location", flat=True)), {"Bamako, Mali"})
+
+
+class AuditRollupTest(TestCase):
+    def test_rollups_follow_writes_and_survive_archiving(self):
+        """Agrégats tenus à jour à l'écriture (= recalcul) ; l'archivage du brut ne change pas les totaux."""
+        import gzip
+        import tempfile
+        from datetime import timedelta
+        from pathlib import Path
+        from django.core.management import call_command
+        from users.audit import AuditBuffer
+        from users.models import AuditLog, AuditLogRollup
+        from users.rollups import rebuild_rollups, security_summary
+
+        def rollups():
+            return set(AuditLogRollup.objects.values_list(
+                "granularity", "bucket", "event_type", "status", "geo_country", "user_id", "high_risk", "count"))
+
+        user = get_user_model().objects.create_user(username="rollup", email="rollup@example.com", password="x", user_type="client")
+        base = dict(ip_address="127.0.0.1", user_agent="ua", geo_country="Mali")
+        AuditBuffer(asynchronous=False).write([
+            dict(base, user=user, event_type="login", status="success"),
+            dict(base, user=user, event_type="login", status="success", risk_score=90),
+            dict(base, event_type="login", status="failure"),
+            dict(base, user=user, event_type="otp_sent", status="success"),
+        ])
+        old = AuditLog.objects.create(**base, user=user, event_type="login", status="success")  # post_save
+        incremental = rollups()
+        rebuild_rollups()
+        self.assertEqual(rollups(), incremental)
+
+        # Événement ancien : hors de la fenêtre de 7 jours, archivable
+        AuditLog.objects.filter(pk=old.pk).update(timestamp=timezone.now() - timedelta(days=120))
+        rebuild_rollups()
+        summary = security_summary()
+        self.assertEqual(summary["total_logins"], 3)
+        self.assertEqual(summary["logins_recent"], 2)
+        self.assertEqual(summary["failed_logins"], 1)
+        self.assertEqual(summary["otp_sent"], 1)
+        self.assertEqual(summary["high_risk_logins"], 1)
+        self.assertEqual(summary["top_countries"], [{"geo_country": "Mali", "count": 3}])
+        self.assertEqual(summary["top_risk_users"], [{"user__email": "rollup@example.com", "count": 1}])
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            call_command("archive_audit_logs", days=90, archive_dir=archive_dir, stdout=open(os.devnull, "w"))
+            files = list(Path(archive_dir).rglob("*.jsonl.gz"))
+            self.assertEqual(len(files), 1)
+            with gzip.open(files[0], "rt", encoding="utf-8") as archive:
+                self.assertEqual([json.loads(line)["id"] for line in archive], [old.pk])
+            self.assertFalse(AuditLog.objects.filter(pk=old.pk).exists())
+            self.assertEqual(security_summary()["total_logins"], 3)
+
+            # Recalcul après archivage : les jours archivés gardent leurs agrégats
+            call_command("archive_audit_logs", days=90, archive_dir=archive_dir, rebuild_rollups=True,
+                         stdout=open(os.devnull, "w"))
+        self.assertEqual(security_summary()["total_logins"], 3)
@@ -27,6 +27,7 @@ urlpatterns = [
     path('forgot_password/', UserViewSet.as_view({'post': 'forgot_password'}), name='forgot_password'),
     path('reset_password/', UserViewSet.as_view({'post': 'reset_password'}), name='reset_password'),
     path('token/refresh/', UserViewSet.as_view({'post': 'refresh_token'}), name='refresh_token'),
+    path('logout/', UserViewSet.as_view({'post': 'logout'}), name='logout'),
     path('me/', user_me, name='user_me'),
     path('update_profile/', update_user_profile, name='update_user_profile'),
     path('admin/users/', admin_users, name='admin_users'),
@@ -1,27 +1,22 @@
-from .models import AuditLog, SecurityNotification
+from .models import SecurityNotification
 from django.core.mail import send_mail
 from django.conf import settings
-from depannage.utils import get_location_from_ip
+from .audit import audit_buffer
 
 def log_event(request, event_type, status, risk_score=0, metadata=None, user=None):
+    """Journalise un événement de sécurité ; l'écriture (et la géolocalisation) est faite par lot, voir users/audit.py."""
     if user is None:
         user = request.user if hasattr(request, 'user') and request.user.is_authenticated else None
-    ip = request.META.get('REMOTE_ADDR')
-    user_agent = request.META.get('HTTP_USER_AGENT', '')
-    geo_country = getattr(request, 'geoip_country', '') or request.META.get('GEOIP_COUNTRY', '')
-    geo_city = getattr(request, 'geoip_city', '') or request.META.get('GEOIP_CITY', '')
-    location = get_location_from_ip(ip)
-    AuditLog.objects.create(
+    audit_buffer.record(
         user=user,
-        ip_address=ip,
-        user_agent=user_agent,
+        ip_address=request.META.get('REMOTE_ADDR'),
+        user_agent=request.META.get('HTTP_USER_AGENT', ''),
         event_type=event_type,
         status=status,
-        geo_country=geo_country,
-        geo_city=geo_city,
+        geo_country=getattr(request, 'geoip_country', '') or request.META.get('GEOIP_COUNTRY', ''),
+        geo_city=getattr(request, 'geoip_city', '') or request.META.get('GEOIP_CITY', ''),
         risk_score=risk_score,
         metadata=metadata or {},
-        location=location
     )
 
 def send_security_notification(user, subject, message, html_message=None, event_type=None):
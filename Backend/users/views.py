@@ -1,21 +1,25 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError
 from django.contrib.auth import get_user_model
 from .serializers import UserSerializer, UserRegistrationSerializer
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
-from depannage.models import Client, Technician
-from .utils import log_event, send_security_notification
+from auth.token_cache import token_cache
+from depannage.jobs import enqueue
+from depannage.models import BackgroundJob, Client, Technician
+from depannage.exports import EXPORT_RENDERER_CLASSES, ExportColumn, export_response, format_datetime
+from depannage.query_planner import QueryPlanMixin
+from .utils import log_event
 from .models import OTPChallenge, AuditLog, SecurityNotification, PasswordResetToken
+from .rollups import security_summary
 from django.utils import timezone
-from django.core.mail import send_mail
 import random
-from django.db.models import Count
+from django.db.models import Q
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.pagination import PageNumberPagination
 import re
 
@@ -185,44 +189,47 @@ def admin_users(request):
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
-@api_view(["GET"])
+USER_EXPORT_COLUMNS = [
+    ExportColumn('ID', 'id'),
+    ExportColumn('Username', 'username'),
+    ExportColumn('Email', 'email'),
+    ExportColumn('Prénom', 'first_name'),
+    ExportColumn('Nom', 'last_name'),
+    ExportColumn('Type', 'user_type'),
+    ExportColumn('Staff', 'is_staff'),
+    ExportColumn('Actif', 'is_active'),
+    ExportColumn('Date d\'inscription', 'date_joined', format_datetime),
+]
+
+
+@api_view(["GET", "POST"])
 @permission_classes([IsAuthenticated])
+@renderer_classes(EXPORT_RENDERER_CLASSES)
 def export_users(request):
-    """Export des utilisateurs pour les administrateurs."""
+    """Export CSV des utilisateurs pour les administrateurs, en flux (filtres ``filter_type`` et ``search_term``)."""
     if not request.user.is_staff:
         return Response({"error": "Accès non autorisé"}, status=403)
-    
-    try:
-        users = User.objects.all().select_related('technician_profile', 'client_profile')
-        
-        # Créer un fichier CSV
-        import csv
-        from django.http import HttpResponse
-        
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="users_export.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'ID', 'Username', 'Email', 'Prénom', 'Nom', 'Type', 'Staff', 'Actif', 'Date d\'inscription'
-        ])
-        
-        for user in users:
-            writer.writerow([
-                user.id,
-                user.username,
-                user.email,
-                user.first_name,
-                user.last_name,
-                user.user_type,
-                user.is_staff,
-                user.is_active,
-                user.date_joined.strftime('%Y-%m-%d %H:%M:%S')
-            ])
-        
-        return response
-    except Exception as e:
-        return Response({"error": str(e)}, status=500)
+
+    params = request.data if request.method == "POST" else request.query_params
+    users = User.objects.order_by('id')
+    filter_type = params.get('filter_type')
+    if filter_type and filter_type != 'all':
+        users = users.filter(user_type=filter_type)
+    search_term = (params.get('search_term') or '').strip()
+    if search_term:
+        users = users.filter(
+            Q(username__icontains=search_term)
+            | Q(email__icontains=search_term)
+            | Q(first_name__icontains=search_term)
+            | Q(last_name__icontains=search_term)
+        )
+    return export_response(
+        users,
+        USER_EXPORT_COLUMNS,
+        filename='users_export',
+        export_format=request.query_params.get('format', 'csv'),
+        sheet_title='Utilisateurs',
+    )
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
@@ -258,7 +265,7 @@ def admin_login_locations(request):
 # ============================================================================
 
 # Correction des permissions pour les endpoints existants
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet pour gérer les utilisateurs."""
     
     queryset = User.objects.all()
@@ -358,22 +365,18 @@ class UserViewSet(viewsets.ModelViewSet):
                     code = f"{random.randint(100000, 999999)}"
                     expires = timezone.now() + timezone.timedelta(minutes=10)
                     otp = OTPChallenge.objects.create(user=user, code=code, expires_at=expires)
-                    # Envoi email
-                    send_mail(
-                        'Votre code de connexion DepanneTeliman',
-                        f'Votre code de vérification est : {code}',
-                        'no-reply@depanneteliman.com',
-                        [user.email],
-                        fail_silently=False,
+                    # Envoi email par un worker : la réponse n'attend pas le serveur SMTP
+                    enqueue(
+                        'otp_email', {'otp_challenge_id': otp.pk}, priority=BackgroundJob.PRIORITY_HIGH,
                     )
                     log_event(request, 'otp_sent', 'success', risk_score=risk_score, metadata={'session_uuid': str(otp.session_uuid)}, user=user)
                     if risk_score > 80 and user:
-                        send_security_notification(
-                            user,
-                            "Alerte de sécurité : Connexion inhabituelle",
-                            f"Bonjour {user.first_name},\n\nUne connexion inhabituelle a été détectée sur votre compte depuis {request.geoip_country} ({request.META.get('REMOTE_ADDR', 'IP inconnue')}). Si ce n'est pas vous, changez votre mot de passe immédiatement.",
-                            event_type="login_high_risk"
-                        )
+                        enqueue('security_notification', {
+                            'user_id': user.id,
+                            'subject': "Alerte de sécurité : Connexion inhabituelle",
+                            'message': f"Bonjour {user.first_name},\n\nUne connexion inhabituelle a été détectée sur votre compte depuis {request.geoip_country} ({request.META.get('REMOTE_ADDR', 'IP inconnue')}). Si ce n'est pas vous, changez votre mot de passe immédiatement.",
+                            'event_type': "login_high_risk",
+                        })
                     return Response({
                         'otp_required': True,
                         'session_uuid': str(otp.session_uuid),
@@ -449,26 +452,9 @@ class UserViewSet(viewsets.ModelViewSet):
                 expires_at=expires_at
             )
             
-            # Envoyer l'email
-            reset_url = f"http://127.0.0.1:5173/reset-password?token={token}"
-            send_mail(
-                'Réinitialisation de votre mot de passe - DepanneTeliman',
-                f'''Bonjour {user.first_name},
-
-Vous avez demandé la réinitialisation de votre mot de passe.
-
-Cliquez sur le lien suivant pour créer un nouveau mot de passe :
-{reset_url}
-
-Ce lien expire dans 24 heures.
-
-Si vous n'avez pas demandé cette réinitialisation, ignorez cet email.
-
-Cordialement,
-L'équipe DepanneTeliman''',
-                'no-reply@depanneteliman.com',
-                [user.email],
-                fail_silently=False,
+            # Envoi par un worker : seul l'identifiant du jeton est stocké dans la tâche
+            enqueue(
+                'password_reset_email', {'reset_token_id': reset_token.pk}, priority=BackgroundJob.PRIORITY_HIGH,
             )
             
             log_event(request, 'password_reset_requested', 'success', risk_score=0, metadata={'user_email': user.email})
@@ -556,6 +542,30 @@ L'équipe DepanneTeliman''',
                 'details': {'refresh': 'Le refresh token est invalide ou expiré'}
             }, status=401)
 
+    @action(detail=False, methods=['post'])
+    def logout(self, request):
+        """
+        Déconnexion : met le refresh token en liste noire et révoque le jeton d'accès courant.
+
+        Avec ``everywhere=true`` (compte compromis), tous les refresh tokens de l'utilisateur
+        passent en liste noire et ses jetons d'accès déjà émis sont révoqués sur tous les appareils.
+        """
+        refresh_token = request.data.get('refresh')
+        if refresh_token:
+            try:
+                RefreshToken(refresh_token).blacklist()
+            except TokenError:
+                pass
+        if isinstance(request.auth, AccessToken):
+            token_cache.revoke(request.auth)
+        if str(request.data.get('everywhere', '')).lower() in ('1', 'true') and request.user.is_authenticated:
+            from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+            for outstanding in OutstandingToken.objects.filter(user=request.user, blacklistedtoken__isnull=True):
+                BlacklistedToken.objects.get_or_create(token=outstanding)
+            token_cache.revoke_user_tokens(request.user.pk)
+        log_event(request, 'logout', 'success')
+        return Response({'success': True})
+
     @action(detail=False, methods=['get'])
     def me(self, request):
         user = request.user
@@ -624,7 +634,7 @@ L'équipe DepanneTeliman''',
     def dispatch(self, request, *args, **kwargs):
         # Vérification numéro de téléphone obligatoire sur toutes les requêtes protégées
         # Sauf pour les actions d'inscription, login, refresh, profil, update_profile
-        exempt_actions = ['register', 'login', 'refresh_token', 'update_profile', 'me']
+        exempt_actions = ['register', 'login', 'refresh_token', 'update_profile', 'me', 'logout']
         action = getattr(self, 'action', None)
         if request.user.is_authenticated and action not in exempt_actions:
             user = request.user
@@ -646,39 +656,22 @@ class SecurityDashboardView(APIView):
     def get(self, request):
         now = timezone.now()
         last_7_days = now - timezone.timedelta(days=7)
-        # Statistiques globales
-        total_logins = AuditLog.objects.filter(event_type='login', status='success').count()
-        failed_logins = AuditLog.objects.filter(event_type='login', status='failure').count()
-        otp_sent = AuditLog.objects.filter(event_type='otp_sent').count()
-        high_risk_logins = AuditLog.objects.filter(event_type='login', risk_score__gte=80).count()
+        # Compteurs du journal d'audit lus sur les agrégats horaires/journaliers
+        summary = security_summary(now=now, days=7)
         alerts = SecurityNotification.objects.count()
-        # Stats sur 7 jours
-        logins_7d = AuditLog.objects.filter(event_type='login', status='success', timestamp__gte=last_7_days).count()
-        failed_7d = AuditLog.objects.filter(event_type='login', status='failure', timestamp__gte=last_7_days).count()
-        otp_7d = AuditLog.objects.filter(event_type='otp_sent', timestamp__gte=last_7_days).count()
         alerts_7d = SecurityNotification.objects.filter(sent_at__gte=last_7_days).count()
-        # Top pays connexions
-        top_countries = (AuditLog.objects.filter(event_type='login', status='success')
-            .values('geo_country')
-            .order_by('-id')
-            .annotate(count=Count('id'))[:5])
-        # Top utilisateurs à risque
-        top_risk_users = (AuditLog.objects.filter(event_type='login', risk_score__gte=80)
-            .values('user__email')
-            .annotate(count=Count('id'))
-            .order_by('-count')[:5])
         return Response({
-            'total_logins': total_logins,
-            'failed_logins': failed_logins,
-            'otp_sent': otp_sent,
-            'high_risk_logins': high_risk_logins,
+            'total_logins': summary['total_logins'],
+            'failed_logins': summary['failed_logins'],
+            'otp_sent': summary['otp_sent'],
+            'high_risk_logins': summary['high_risk_logins'],
             'alerts': alerts,
-            'logins_7d': logins_7d,
-            'failed_7d': failed_7d,
-            'otp_7d': otp_7d,
+            'logins_7d': summary['logins_recent'],
+            'failed_7d': summary['failed_recent'],
+            'otp_7d': summary['otp_recent'],
             'alerts_7d': alerts_7d,
-            'top_countries': list(top_countries),
-            'top_risk_users': list(top_risk_users),
+            'top_countries': summary['top_countries'],
+            'top_risk_users': summary['top_risk_users'],
         })
 
 class SecurityNotificationsView(APIView):
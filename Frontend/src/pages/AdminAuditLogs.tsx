@@ -57,7 +57,7 @@ function AdminAuditLogs() {
             const response = await fetchWithAuth("/depannage/api/admin/audit-logs/");
             if (response.ok) {
                 const data = await response.json();
-                setLogs(data);
+                setLogs(data.results ?? data);
             } else {
                 let backendMsg = '';
                 try {
@@ -314,7 +314,7 @@ const AdminDashboard: React.FC = () => {
 
       if (notificationsResponse.ok) {
         const notificationsData = await notificationsResponse.json();
-        setNotifications(notificationsData);
+        setNotifications(notificationsData.results ?? notificationsData);
       } else {
         showToast('error', 'Erreur lors du chargement des notifications');
       }
@@ -74,7 +74,7 @@ const ChatMessenger: React.FC = () => {
                 if (!response.ok) throw new Error('Erreur lors du chargement des messages');
 
                 const data = await response.json();
-                setMessages(data);
+                setMessages(data.results ?? data);
             } catch (err) {
                 setError('Impossible de charger les messages.');
             } finally {
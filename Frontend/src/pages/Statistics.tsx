@@ -257,22 +257,35 @@ const Statistics: React.FC = () => {
         }
     };
 
-    // Fonction d'export PDF
+    // Fonction d'export PDF : rendu en tâche de fond, suivi de la tâche puis téléchargement
     const handleExportPDF = async () => {
         setExporting('pdf');
         try {
-            const response = await fetch('/depannage/api/export_statistics_pdf/', {
-                method: 'GET',
-                headers: { Authorization: `Bearer ${token}` },
-            });
+            const headers = { Authorization: `Bearer ${token}` };
+            const response = await fetch('/depannage/api/export_statistics_pdf/', { method: 'GET', headers });
             if (response.status === 401) {
                 setError('Session expirée. Veuillez vous reconnecter.');
                 setExporting('none');
                 return;
             }
             if (!response.ok) throw new Error("Erreur lors de l'export PDF");
-            const blob = await response.blob();
-            const filename = response.headers.get('Content-Disposition')?.split('filename=')[1]?.replace(/['"]/g, '') || 'statistiques_depanneteliman.pdf';
+            const { job_id } = await response.json();
+
+            let downloadUrl: string | null = null;
+            for (let attempt = 0; attempt < 120 && !downloadUrl; attempt++) {
+                await new Promise(resolve => setTimeout(resolve, 1500));
+                const jobResponse = await fetch(`/depannage/api/admin/jobs/${job_id}/`, { method: 'GET', headers });
+                if (!jobResponse.ok) throw new Error("Erreur lors du suivi de l'export PDF");
+                const job = await jobResponse.json();
+                if (job.status === 'failed') throw new Error(job.error || "Erreur lors de l'export PDF");
+                if (job.status === 'succeeded') downloadUrl = job.result?.url;
+            }
+            if (!downloadUrl) throw new Error("L'export PDF prend trop de temps");
+
+            const fileResponse = await fetch(downloadUrl, { method: 'GET', headers });
+            if (!fileResponse.ok) throw new Error("Erreur lors du téléchargement du PDF");
+            const blob = await fileResponse.blob();
+            const filename = fileResponse.headers.get('Content-Disposition')?.split('filename=')[1]?.replace(/['"]/g, '') || 'statistiques_depanneteliman.pdf';
             const url = window.URL.createObjectURL(blob);
             const a = document.createElement('a');
             a.href = url;